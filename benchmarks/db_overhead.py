@@ -0,0 +1,117 @@
+"""
+Benchmark per-mention database overhead and lock-wait time.
+
+Compares the legacy connection-per-call access pattern against the pooled
+WAL connections in `src.db.Database`. Each simulated mention performs the
+same calls as `handle_mention`: authorize, store the user message, read the
+thread history and store the bot reply.
+
+Usage:
+    python -m benchmarks.db_overhead --mentions 2000 --threads 8
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from src.db import Database
+
+
+class LegacyDatabase(Database):
+    """The pre-pooling behaviour: a fresh rollback-journal connection per call."""
+
+    def get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+
+def run_mention(db: Database, team_id: str, thread_ts: str) -> None:
+    db.get_workspace(team_id)
+    db.store_message(team_id, "C1", thread_ts, "U1", "hello bot", False)
+    db.get_thread_history(team_id, "C1", thread_ts)
+    db.store_message(team_id, "C1", thread_ts, "BOT", "hello human", True)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench(db: Database, mentions: int, threads: int) -> Dict[str, float]:
+    """Run mentions serially, then concurrently, and summarise the timings."""
+    serial = []
+    for i in range(mentions):
+        start = time.perf_counter()
+        run_mention(db, "T1", f"serial-{i % 50}")
+        serial.append(time.perf_counter() - start)
+    baseline = statistics.median(serial)
+
+    concurrent: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(worker_id: int) -> None:
+        local = []
+        for i in range(mentions // threads):
+            start = time.perf_counter()
+            try:
+                run_mention(db, "T1", f"thread-{worker_id}-{i % 10}")
+            except sqlite3.OperationalError:
+                with lock:
+                    errors[0] += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            concurrent.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    wall_start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    # Time spent above the uncontended median is attributed to lock waits
+    lock_wait = sum(max(0.0, sample - baseline) for sample in concurrent)
+    return {
+        "serial_mean_ms": statistics.mean(serial) * 1000,
+        "serial_p95_ms": percentile(serial, 95) * 1000,
+        "concurrent_p50_ms": percentile(concurrent, 50) * 1000,
+        "concurrent_p99_ms": percentile(concurrent, 99) * 1000,
+        "lock_wait_per_mention_ms": lock_wait / max(1, len(concurrent)) * 1000,
+        "mentions_per_sec": len(concurrent) / wall,
+        "locked_errors": errors[0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-mention DB overhead benchmark")
+    parser.add_argument("--mentions", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, cls in (("before (connect per call)", LegacyDatabase),
+                           ("after (pooled WAL)", Database)):
+            db = cls(os.path.join(tmp, f"{cls.__name__}.db"))
+            db.add_workspace("T1", "Bench", "xoxb-bench", "B1")
+            results[label] = bench(db, args.mentions, args.threads)
+            db.close()
+
+    for label, stats in results.items():
+        print(label)
+        for key, value in stats.items():
+            print(f"  {key:26s} {value:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Channel digest (`ChannelDigester.digest`) over a busy channel, fully offline.
+
+History comes from a fake Slack Web API client whose conversations.history
+pages by cursor with a per-page latency, or, with --source local, from the
+stored messages table. Gemini is replaced by a fake generative model behind
+the real `LLM` wrapper whose latency grows with the prompt's length. Each
+concurrency level is run in turn, 1 being the sequential baseline; reports
+wall time, LLM calls and the most summarization calls in flight at once.
+
+Usage:
+    python -m benchmarks.digest --messages 20000 --concurrency 1 4 8
+    python -m benchmarks.digest --source local --messages 20000
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import List
+
+from src.context import estimate_tokens
+from src.db import Database
+from src.digest import ChannelDigester
+from src.llm import LLM
+
+WORDS = ("deploy rollback incident review latency budget migration schema customer ticket "
+         "release branch flaky test alert dashboard oncall handoff postgres cache queue").split()
+SYSTEM_EVENTS = ("channel_join", "channel_topic")
+
+
+def synthetic_history(count: int, hours: float) -> List[dict]:
+    """Slack message objects spread over the last `hours`, newest first like the API."""
+    now = time.time()
+    messages = []
+    for n in range(count):
+        ts = now - hours * 3600 * (n + 1) / (count + 1)
+        message = {"type": "message", "ts": f"{ts:.6f}", "user": f"U{n % 40:03d}",
+                   "text": " ".join(random.choices(WORDS, k=random.randint(5, 40)))}
+        if n % 200 == 0:
+            message["subtype"] = random.choice(SYSTEM_EVENTS)
+        messages.append(message)
+    return messages
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel; counts calls and the most in flight."""
+
+    def __init__(self, base_ms: float, ms_per_1k_tokens: float):
+        self.base = base_ms / 1000
+        self.per_token = ms_per_1k_tokens / 1000 / 1000
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.base + self.per_token * estimate_tokens(prompt))
+            return FakeResponse(" ".join(random.choices(WORDS, k=120)))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FakeSlackClient:
+    """conversations.history over a fixed list, paged by an opaque cursor."""
+
+    def __init__(self, messages: List[dict], page_latency_ms: float):
+        self.messages = messages
+        self.page_latency = page_latency_ms / 1000
+        self.pages = 0
+
+    def conversations_history(self, channel: str, oldest: str, limit: int, cursor=None):
+        time.sleep(self.page_latency)
+        self.pages += 1
+        start = int(cursor or 0)
+        page = [m for m in self.messages[start:start + limit] if float(m["ts"]) > float(oldest)]
+        more = start + limit < len(self.messages)
+        return {"ok": True, "messages": page, "has_more": more,
+                "response_metadata": {"next_cursor": str(start + limit) if more else ""}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Channel digest wall time vs concurrency")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages in the channel's day")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--source", choices=("slack", "local"), default="slack")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--chunk-tokens", type=int, default=6000)
+    parser.add_argument("--max-chunks", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--page-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-base-ms", type=float, default=300)
+    parser.add_argument("--llm-ms-per-1k-tokens", type=float, default=150)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    random.seed(1)
+    history = synthetic_history(args.messages, args.hours)
+    slack = FakeSlackClient(history, args.page_latency_ms)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "digest.db"))
+        if args.source == "local":
+            with db.get_connection() as conn:
+                conn.executemany('''
+                    INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp)
+                    VALUES (?, ?, ?, ?, ?, 0, ?)
+                ''', [("T1", "C1", m["ts"], m["user"], m["text"], float(m["ts"]))
+                      for m in history if "subtype" not in m])
+
+        print(f"{'concurrency':>11} {'wall s':>8} {'llm calls':>9} {'peak':>5} {'pages':>6}")
+        for concurrency in args.concurrency:
+            fake = FakeGenerativeModel(args.llm_base_ms, args.llm_ms_per_1k_tokens)
+            model = LLM(API_KEY="benchmark", models=["gemini-pro"], client_factory=lambda name: fake)
+            digester = ChannelDigester(model, db, source=args.source, concurrency=concurrency,
+                                       chunk_tokens=args.chunk_tokens, page_size=args.page_size,
+                                       max_chunks=args.max_chunks)
+            slack.pages = 0
+            start = time.perf_counter()
+            digester.digest("T1", "C1", args.hours, client=slack)
+            elapsed = time.perf_counter() - start
+            digester.shutdown()
+            model.shutdown()
+            print(f"{concurrency:>11} {elapsed:>8.2f} {fake.calls:>9} {fake.peak:>5} {slack.pages:>6}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark `Database.get_thread_history` latency as the messages table grows.
+
+With idx_messages_thread the lookup is a bounded index range scan, so the
+per-call latency should stay flat from thousands to millions of rows.
+
+Usage:
+    python -m benchmarks.history_latency --sizes 10000 100000 1000000
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.db import Database
+
+BATCH = 50000
+
+
+def grow(db: Database, current: int, target: int, threads: int) -> None:
+    """Bulk-insert synthetic rows spread across many threads."""
+    conn = db.get_connection()
+    now = time.time()
+    while current < target:
+        count = min(BATCH, target - current)
+        rows = [
+            ("T1", f"C{n % 20}", f"{n % threads}", "U1", f"message {n}", n % 2, now)
+            for n in range(current, current + count)
+        ]
+        with conn:
+            conn.executemany('''
+                INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        current += count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Thread history latency vs table size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--threads", type=int, default=5000, help="Distinct threads in the table")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "history.db"))
+        size = 0
+        print(f"{'rows':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for target in sorted(args.sizes):
+            grow(db, size, target, args.threads)
+            size = target
+            samples = []
+            for _ in range(args.lookups):
+                n = random.randrange(size)
+                start = time.perf_counter()
+                db.get_thread_history("T1", f"C{n % 20}", f"{n % args.threads}")
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+            p50 = statistics.median(samples) * 1000
+            p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+            print(f"{size:>10} {p50:>8.3f} {p99:>8.3f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
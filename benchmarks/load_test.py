@@ -0,0 +1,345 @@
+"""
+End-to-end load test for mention handling, fully offline.
+
+Drives `SlackBot.handle_mention` (the registered app_mention listener) with
+synthetic events. Slack is replaced by a fake Web API client and `say`,
+and Gemini by a fake generative model behind the real `LLM` wrapper, both
+with configurable latency and error rates. Reports end-to-end latency
+percentiles, throughput, time spent in `Database` calls and dispatcher
+queue depth.
+
+Usage:
+    python -m benchmarks.load_test --mentions 500 --concurrency 32 \\
+        --workspaces 4 --threads-per-workspace 20 --llm-latency-ms 300
+
+With --faq-rate, that fraction of mentions starts a new thread with one of
+a few common questions; add --response-cache-size to answer repeats from
+the response cache.
+"""
+
+import argparse
+import collections
+import itertools
+import logging
+import math
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from typing import Deque, Dict, List, Tuple
+
+
+# Questions that --faq-rate mentions ask, in slightly different spellings
+FAQ_QUESTIONS = [
+    "How do I reset my VPN password?",
+    "how do i reset my  VPN password?",
+    "What is the on-call rotation?",
+    "Where is the deploy runbook?",
+    "What's the expense limit for travel?",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class FakeRateLimitError(Exception):
+    """Looks like the API's 429 RESOURCE_EXHAUSTED error."""
+
+    code = 429
+
+
+class LatencyModel:
+    """Log-normal latency with a given median and p99, plus error and 429 rates."""
+
+    def __init__(self, median_ms: float, p99_ms: float, error_rate: float,
+                 rate_limit_rate: float = 0.0):
+        self.mu = 0.0 if median_ms <= 0 else math.log(median_ms / 1000)
+        # z(0.99) ~= 2.326
+        ratio = max(p99_ms, median_ms) / max(median_ms, 1e-6)
+        self.sigma = math.log(ratio) / 2.326 if ratio > 1 else 0.0
+        self.median_ms = median_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+
+    def wait(self) -> None:
+        if self.median_ms > 0:
+            time.sleep(random.lognormvariate(self.mu, self.sigma))
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            raise FakeRateLimitError("429 simulated quota exhausted")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise RuntimeError("simulated backend error")
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeChat:
+    """Stands in for a Gemini ChatSession."""
+
+    def __init__(self, model: "FakeGenerativeModel", history: list):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, prompt: str, stream: bool = False):
+        self.model.latency.wait()
+        words = [f"word{n}" for n in range(self.model.response_words)]
+        self.history += [{"role": "user", "parts": [prompt]},
+                         {"role": "model", "parts": [" ".join(words)]}]
+        if stream:
+            return (FakeResponse(word + " ") for word in words)
+        return FakeResponse(" ".join(words))
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel."""
+
+    def __init__(self, latency: LatencyModel, response_words: int):
+        self.latency = latency
+        self.response_words = response_words
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history or [])
+
+    def generate_content(self, prompt: str):
+        self.latency.wait()
+        return FakeResponse("summary " * 20)
+
+
+class FakeSlack:
+    """Fake Web API client and `say` that record when each mention is answered."""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.lock = threading.Lock()
+        # Mentions in one thread complete in order, so a FIFO per thread suffices
+        self.started: Dict[Tuple[str, str], Deque[float]] = collections.defaultdict(collections.deque)
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.shed = 0
+        self.done = threading.Semaphore(0)
+        self.threads_by_ts: Dict[str, str] = {}
+        self._ts = 0
+
+    def start(self, channel: str, thread_ts: str) -> None:
+        with self.lock:
+            self.started[(channel, thread_ts)].append(time.perf_counter())
+
+    def _complete(self, channel: str, thread_ts: str, text: str) -> None:
+        with self.lock:
+            start = self.started[(channel, thread_ts)].popleft()
+            self.latencies.append(time.perf_counter() - start)
+            if text.startswith("Sorry"):
+                self.errors += 1
+            elif text.startswith("I'm a bit busy"):
+                self.shed += 1
+        self.done.release()
+
+    def say_for(self, channel: str):
+        def say(text: str = "", blocks=None, thread_ts: str = None, **kwargs):
+            self.latency.wait()
+            self._complete(channel, thread_ts, text or "reply")
+        return say
+
+    # Web API methods used by streamed replies
+    def chat_postMessage(self, channel: str, thread_ts: str, text: str, **kwargs):
+        self.latency.wait()
+        with self.lock:
+            self._ts += 1
+            ts = f"{self._ts}.000"
+            self.threads_by_ts[ts] = thread_ts
+        return {"ts": ts}
+
+    def chat_update(self, channel: str, ts: str, text: str, blocks=None, **kwargs):
+        self.latency.wait()
+        if blocks is not None or text.startswith("Sorry"):
+            self._complete(channel, self.threads_by_ts[ts], text)
+
+
+def instrument_db(db) -> Dict[str, List[float]]:
+    """Wrap the Database's public methods to record time spent in each."""
+    timings: Dict[str, List[float]] = collections.defaultdict(list)
+    lock = threading.Lock()
+    for name in ("get_workspace", "store_message", "get_thread_history", "get_context_messages",
+                 "get_thread_summary", "get_messages_after", "save_thread_summary"):
+        method = getattr(db, name)
+
+        def timed(*args, _method=method, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timings[_name].append(elapsed)
+        setattr(db, name, timed)
+    return timings
+
+
+def instrument_scheduler(scheduler) -> Dict[str, List[float]]:
+    """Record how long each team's LLM calls waited for a rate-limit slot."""
+    waits: Dict[str, List[float]] = collections.defaultdict(list)
+    lock = threading.Lock()
+    acquire = scheduler.acquire
+
+    def timed_acquire(team_id, cost=1):
+        waited = acquire(team_id, cost)
+        with lock:
+            waits[team_id].append(waited)
+        return waited
+    scheduler.acquire = timed_acquire
+    return waits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end mention load test")
+    parser.add_argument("--mentions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32, help="Simulated users in flight")
+    parser.add_argument("--workspaces", type=int, default=4)
+    parser.add_argument("--threads-per-workspace", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-p99-ms", type=float, default=1200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.01)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of LLM calls failing with a 429")
+    parser.add_argument("--llm-rpm", type=float, default=0,
+                        help="LLM_REQUESTS_PER_MINUTE for the scheduler (0 for no limit)")
+    parser.add_argument("--slack-latency-ms", type=float, default=20)
+    parser.add_argument("--response-words", type=int, default=80)
+    parser.add_argument("--stream", action="store_true", help="Use streamed replies")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Fraction of mentions Slack delivers a second time")
+    parser.add_argument("--faq-rate", type=float, default=0.0,
+                        help="Fraction of mentions that open a new thread with a common question")
+    parser.add_argument("--response-cache-size", type=int, default=0,
+                        help="RESPONSE_CACHE_SIZE (0 disables the response cache)")
+    parser.add_argument("--response-cache-sqlite", action="store_true",
+                        help="Also use the persistent SQLite response cache tier")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    # Configuration is read from the environment when src is imported
+    os.environ.update({
+        "DB_PATH": os.path.join(tmp, "load_test.db"),
+        "SLACK_APP_TOKEN": "xapp-load-test",
+        "SLACK_SIGNING_SECRET": "load-test",
+        "GOOGLE_API_KEY": "load-test",
+        "STREAM_RESPONSES": "true" if args.stream else "false",
+        "STREAM_UPDATE_INTERVAL": "0.2",
+        "LLM_REQUESTS_PER_MINUTE": str(args.llm_rpm),
+        "LLM_RETRY_BASE_DELAY": "0.1",
+        "RESPONSE_CACHE_SIZE": str(args.response_cache_size),
+        "RESPONSE_CACHE_PATH": os.path.join(tmp, "responses.db") if args.response_cache_sqlite else "",
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+
+    from src.bot import SlackBot
+    from src.metrics import EVENTS_DEDUPLICATED, RESPONSE_CACHE_REQUESTS
+
+    bot = SlackBot()
+    fake_model = FakeGenerativeModel(
+        LatencyModel(args.llm_latency_ms, args.llm_p99_ms, args.llm_error_rate,
+                     args.llm_rate_limit_rate), args.response_words)
+    # Clients are created on first use, so every model of the pool gets the fake
+    bot.model.router.client_factory = lambda model: fake_model
+    slack = FakeSlack(LatencyModel(args.slack_latency_ms, args.slack_latency_ms * 3, 0.0))
+    db_timings = instrument_db(bot.db)
+    queue_waits = instrument_scheduler(bot.model.scheduler)
+
+    teams = [f"T{n:04d}" for n in range(args.workspaces)]
+    for team in teams:
+        bot.db.add_workspace(team, f"Workspace {team}", f"xoxb-{team}", f"B{team}")
+
+    depth_samples: List[int] = []
+    event_ids = itertools.count()
+    faq_threads = itertools.count()
+    sampling = threading.Event()
+
+    def sample_depth() -> None:
+        while not sampling.wait(0.01):
+            depth_samples.append(bot.dispatcher.depth())
+
+    def user(count: int) -> None:
+        for _ in range(count):
+            team = random.choice(teams)
+            thread = random.randrange(args.threads_per_workspace)
+            channel = f"C{thread % 5}"
+            ts = f"{time.time():.6f}"
+            event = {"type": "app_mention", "team": team, "channel": channel, "user": "U1", "ts": ts}
+            if random.random() < args.faq_rate:
+                # A new top-level mention, so its thread has no history yet
+                thread_ts = f"{1800000000 + next(faq_threads)}.000100"
+                event["ts"] = thread_ts
+                event["text"] = f"<@B{team}> {random.choice(FAQ_QUESTIONS)}"
+            else:
+                thread_ts = f"{1700000000 + thread}.000100"
+                event["thread_ts"] = thread_ts
+                event["text"] = "<@B1> what is the status of the rollout?"
+            body = {"event_id": f"Ev{next(event_ids):08d}", "event": event}
+            # Bolt authorizes every event before calling the listener
+            context = {}
+            bot._authorize(None, team, context=context)
+            slack.start(channel, thread_ts)
+            bot.handle_mention(event=event, say=slack.say_for(channel), context=context, client=slack,
+                               body=body)
+            if random.random() < args.duplicate_rate:
+                # A redelivery must be dropped without a second reply
+                bot.handle_mention(event=event, say=slack.say_for(channel), context={}, client=slack,
+                                   body=body)
+            slack.done.acquire()
+
+    sampler = threading.Thread(target=sample_depth, daemon=True)
+    sampler.start()
+    per_user = args.mentions // args.concurrency
+    users = [threading.Thread(target=user, args=(per_user,)) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in users:
+        t.start()
+    for t in users:
+        t.join()
+    wall = time.perf_counter() - start
+    sampling.set()
+    bot.dispatcher.shutdown(timeout=10)
+    bot.db.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    latencies = slack.latencies
+    print(f"mentions            {len(latencies)} in {wall:.2f}s")
+    print(f"throughput          {len(latencies) / wall:.1f} mentions/sec")
+    print(f"latency p50/95/99   {percentile(latencies, 50) * 1000:.0f} / "
+          f"{percentile(latencies, 95) * 1000:.0f} / {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"errors / shed       {slack.errors} / {slack.shed}")
+    duplicates = sum(child.get() for child in EVENTS_DEDUPLICATED._children.values())
+    print(f"duplicates dropped  {duplicates:.0f}")
+    if args.response_cache_size > 0 or args.response_cache_sqlite:
+        for tier in ("memory", "sqlite"):
+            hits = RESPONSE_CACHE_REQUESTS.labels(tier, "hit").get()
+            lookups = hits + RESPONSE_CACHE_REQUESTS.labels(tier, "miss").get()
+            if lookups:
+                print(f"response cache      {tier}: {hits:.0f} hits / {lookups:.0f} lookups "
+                      f"({hits / lookups:.0%})")
+    print(f"queue depth         mean {statistics.mean(depth_samples or [0]):.1f}, "
+          f"max {max(depth_samples or [0])}")
+    total_db = sum(sum(samples) for samples in db_timings.values())
+    print(f"db time             {total_db * 1000 / max(1, len(latencies)):.2f} ms/mention")
+    for name, samples in sorted(db_timings.items()):
+        print(f"  {name:22s} calls {len(samples):6d}  p50 {percentile(samples, 50) * 1000:.3f} ms  "
+              f"p99 {percentile(samples, 99) * 1000:.3f} ms")
+    if args.llm_rpm > 0:
+        print("llm queue wait")
+        for team, samples in sorted(queue_waits.items()):
+            print(f"  {team:22s} calls {len(samples):6d}  p50 {percentile(samples, 50) * 1000:.0f} ms  "
+                  f"p99 {percentile(samples, 99) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
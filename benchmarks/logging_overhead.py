@@ -0,0 +1,94 @@
+"""
+Cost of a mention's log calls on the thread that makes them, fully offline.
+
+Each mention logs its raw event, retrieved history and reply, sized by
+--history-messages and --message-chars. Modes:
+
+    eager     f-strings of the full payloads to a StreamHandler (the old setup)
+    payloads  the same payloads as lazy arguments through src.logs.setup
+    current   the bot's present log calls (ids and sizes) through src.logs.setup
+
+Each mode is run with the root logger at INFO and at WARNING. Output goes to
+os.devnull; for the queued modes the clock stops before the writer thread
+has drained, since that work is off the mention path.
+
+Usage:
+    python -m benchmarks.logging_overhead --mentions 2000 --history-messages 200
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def payloads(history_messages: int, message_chars: int):
+    text = "lorem ipsum " * (message_chars // 12)
+    event = {"type": "app_mention", "channel": "C1", "ts": "1700000000.000100", "user": "U1",
+             "text": text, "blocks": [{"type": "rich_text", "elements": [{"text": text}]}]}
+    history = [(text, n % 2 == 0) for n in range(history_messages)]
+    return event, history, text
+
+
+def mention(log: logging.Logger, mode: str, event: dict, history: list, reply: str) -> None:
+    if mode == "eager":
+        log.info(f"Received app_mention event: {event}")
+        log.info(f"Thread history: {history}")
+        log.info(f"Sending response: {reply}")
+    elif mode == "payloads":
+        log.info("Received app_mention event: %s", event)
+        log.info("Thread history: %s", history)
+        log.info("Sending response: %s", reply)
+    else:
+        log.info("Received app_mention: channel=%s, ts=%s", event.get("channel"), event.get("ts"))
+        log.info("Received mention: channel=%s, thread=%s, %d chars", event["channel"], event["ts"],
+                 len(event["text"]))
+        log.info("Sending response: %d chars from %s", len(reply), "gemini-pro")
+
+
+def run(mode: str, level: int, args, devnull) -> float:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "eager":
+        logging.basicConfig(level=level, stream=devnull,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        listener = None
+    else:
+        from src.logs import setup
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            listener = setup(level)
+        finally:
+            sys.stdout = stdout
+    log = logging.getLogger("src.bot")
+    event, history, reply = payloads(args.history_messages, args.message_chars)
+
+    start = time.perf_counter()
+    for _ in range(args.mentions):
+        mention(log, mode, event, history, reply)
+    elapsed = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    return elapsed / args.mentions * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Log cost per mention on the calling thread")
+    parser.add_argument("--mentions", type=int, default=2000)
+    parser.add_argument("--history-messages", type=int, default=200)
+    parser.add_argument("--message-chars", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_FORMAT", "json")
+    with open(os.devnull, "w") as devnull:
+        print(f"{'mode':>9} {'INFO us':>9} {'WARNING us':>11}")
+        for mode in ("eager", "payloads", "current"):
+            info = run(mode, logging.INFO, args, devnull)
+            warning = run(mode, logging.WARNING, args, devnull)
+            print(f"{mode:>9} {info:>9.1f} {warning:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
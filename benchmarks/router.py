@@ -0,0 +1,153 @@
+"""
+Model router under a slow and failing primary model, fully offline.
+
+Drives `LLM.get_chat_response` from concurrent callers against two fake
+models behind the real router: a primary with a heavy latency tail that
+fails outright during an outage in the middle of the run, and a slower but
+steadier fallback. Each mode is run in turn:
+
+    single    the primary alone (the old behaviour)
+    failover  primary then fallback, on errors and open breakers only
+    hedged    failover plus a hedge to the fallback past the primary's p95
+
+Reports latency percentiles, errors, model calls per request (the extra
+load hedging adds) and the share of requests the fallback served.
+
+Usage:
+    python -m benchmarks.router --requests 600 --concurrency 16
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.load_test import FakeResponse, LatencyModel, percentile
+
+PRIMARY = "gemini-primary"
+FALLBACK = "gemini-fallback"
+
+
+class FakeChat:
+    def __init__(self, model: "FakeModel"):
+        self.model = model
+
+    def send_message(self, prompt: str, stream: bool = False):
+        self.model.wait()
+        return FakeResponse(f"answer from {self.model.name}")
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel; fails during the shared outage flag."""
+
+    def __init__(self, name: str, latency: LatencyModel, outage_latency_ms: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.outage_latency = outage_latency_ms / 1000
+        self.outage = threading.Event()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return FakeChat(self)
+
+    def wait(self) -> None:
+        with self.lock:
+            self.calls += 1
+        if self.outage.is_set():
+            time.sleep(self.outage_latency)
+            raise RuntimeError(f"{self.name} unavailable")
+        self.latency.wait()
+
+
+def run(mode: str, args) -> None:
+    from src.llm import LLM
+    from src.response_cache import ResponseCache
+
+    models = {
+        PRIMARY: FakeModel(PRIMARY, LatencyModel(args.primary_median_ms, args.primary_p99_ms, 0.0),
+                           args.outage_latency_ms),
+        FALLBACK: FakeModel(FALLBACK, LatencyModel(args.fallback_median_ms, args.fallback_p99_ms, 0.0)),
+    }
+    pool = [PRIMARY] if mode == "single" else [PRIMARY, FALLBACK]
+    llm = LLM(API_KEY="benchmark", models=pool, cache=ResponseCache(maxsize=0, path=""),
+              client_factory=models.__getitem__)
+    llm.router.hedge = mode == "hedged"
+
+    latencies: List[float] = []
+    served: Dict[str, int] = {PRIMARY: 0, FALLBACK: 0}
+    errors = 0
+    lock = threading.Lock()
+    outage_start = int(args.requests * args.outage_start)
+    outage_end = int(args.requests * args.outage_end)
+
+    def mention(n: int) -> None:
+        nonlocal errors
+        if n == outage_start:
+            models[PRIMARY].outage.set()
+        elif n == outage_end:
+            models[PRIMARY].outage.clear()
+        start = time.perf_counter()
+        try:
+            _, model_name = llm.get_chat_response(f"question {n}", team_id="T1")
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            served[model_name] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(mention, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    llm.shutdown()
+
+    calls = sum(model.calls for model in models.values())
+    print(f"{mode:>9} {statistics.median(latencies) * 1000:>8.0f} "
+          f"{percentile(latencies, 95) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f} "
+          f"{errors:>7} {calls / args.requests:>10.2f} {served[FALLBACK] / len(latencies):>9.1%} "
+          f"{elapsed:>7.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Model router latency and availability")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--modes", nargs="+", default=["single", "failover", "hedged"],
+                        choices=["single", "failover", "hedged"])
+    parser.add_argument("--primary-median-ms", type=float, default=200)
+    parser.add_argument("--primary-p99-ms", type=float, default=3000)
+    parser.add_argument("--fallback-median-ms", type=float, default=300)
+    parser.add_argument("--fallback-p99-ms", type=float, default=600)
+    parser.add_argument("--outage-start", type=float, default=0.4,
+                        help="Fraction of the run after which the primary fails every call")
+    parser.add_argument("--outage-end", type=float, default=0.6)
+    parser.add_argument("--outage-latency-ms", type=float, default=1000,
+                        help="Time the primary takes to fail during the outage")
+    parser.add_argument("--breaker-cooldown", type=float, default=2,
+                        help="LLM_BREAKER_COOLDOWN in seconds")
+    args = parser.parse_args()
+
+    # Configuration is read from the environment when src is imported
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "LLM_BREAKER_COOLDOWN": str(args.breaker_cooldown),
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+    random.seed(1)
+
+    print(f"{'mode':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'calls/req':>10} {'fallback':>9} {'wall s':>7}")
+    for mode in args.modes:
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
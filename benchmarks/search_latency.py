@@ -0,0 +1,133 @@
+"""
+Benchmark related-message search (`Database.search_messages`) as the
+messages table grows, against the `LIKE` scan it replaces.
+
+The synthetic corpus draws words from a Zipf-distributed vocabulary and
+spreads messages over many workspaces, channels and threads. Rows go
+through the normal insert path, so the FTS5 triggers' write cost is
+included in the reported insert rate. Searches use the real time budget;
+ones that hit it are counted as timeouts.
+
+Usage:
+    python -m benchmarks.search_latency --sizes 100000 1000000 --budget-ms 10
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+
+from src.db import Database
+from src.metrics import RETRIEVAL_TIMEOUTS
+from src.retrieval import search_terms
+
+BATCH = 50000
+TEAMS = 10
+CHANNELS = 20
+
+
+def vocabulary(size: int) -> List[str]:
+    """Pronounceable fake words, so stopword filtering does not interfere."""
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "fi"]
+    words = set()
+    for length in itertools.cycle((2, 3, 4)):
+        if len(words) >= size:
+            break
+        words.add("".join(random.choice(syllables) for _ in range(length)))
+    return sorted(words)
+
+
+def message(words: List[str], cum_weights: List[float]) -> str:
+    return " ".join(random.choices(words, cum_weights=cum_weights, k=random.randint(8, 30)))
+
+
+def grow(db: Database, current: int, target: int, threads: int, words: List[str],
+         cum_weights: List[float]) -> None:
+    """Insert synthetic rows through the indexed write path."""
+    conn = db.get_connection()
+    now = time.time()
+    while current < target:
+        count = min(BATCH, target - current)
+        rows = [
+            (f"T{n % TEAMS}", f"C{n % CHANNELS}", f"{n % threads}.0", "U1",
+             message(words, cum_weights), n % 2, now)
+            for n in range(current, current + count)
+        ]
+        with conn:
+            conn.executemany('''
+                INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        current += count
+
+
+def like_scan(db: Database, team: str, channel: str, terms: List[str], thread_ts: str,
+              limit: int) -> list:
+    """The pre-index alternative: a substring scan over the channel's messages."""
+    where = " OR ".join("message LIKE ?" for _ in terms)
+    return db.get_connection().execute(f'''
+        SELECT message, is_bot, thread_ts FROM messages
+        WHERE team_id = ? AND channel = ? AND thread_ts != ? AND ({where})
+        ORDER BY id DESC LIMIT ?
+    ''', (team, channel, thread_ts, *(f"%{term}%" for term in terms), limit)).fetchall()
+
+
+def percentiles(samples: List[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[max(0, int(len(samples) * 0.99) - 1)] * 1000
+    return f"{p50:>8.3f} {p99:>8.3f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Related-message search latency vs table size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--threads", type=int, default=20000, help="Distinct threads in the table")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--searches", type=int, default=1000)
+    parser.add_argument("--like-searches", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    words = vocabulary(args.vocabulary)
+    random.shuffle(words)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "search.db"))
+        size = 0
+        print(f"{'rows':>10} {'insert/s':>9} {'fts p50':>8} {'fts p99':>8} {'timeouts':>8} "
+              f"{'like p50':>8} {'like p99':>8}")
+        for target in sorted(args.sizes):
+            start = time.perf_counter()
+            grow(db, size, target, args.threads, words, cum_weights)
+            insert_rate = (target - size) / (time.perf_counter() - start)
+            size = target
+
+            fts, like = [], []
+            timeouts_before = RETRIEVAL_TIMEOUTS.labels().get()
+            for i in range(args.searches):
+                n = random.randrange(size)
+                team, channel, thread_ts = f"T{n % TEAMS}", f"C{n % CHANNELS}", f"{n % args.threads}.0"
+                terms = search_terms(message(words, cum_weights))
+                start = time.perf_counter()
+                db.search_messages(team, channel, terms, thread_ts, args.top_k, args.budget_ms / 1000)
+                fts.append(time.perf_counter() - start)
+                if i < args.like_searches:
+                    start = time.perf_counter()
+                    like_scan(db, team, channel, terms, thread_ts, args.top_k)
+                    like.append(time.perf_counter() - start)
+            timeouts = RETRIEVAL_TIMEOUTS.labels().get() - timeouts_before
+            print(f"{size:>10} {insert_rate:>9.0f} {percentiles(fts)} {timeouts:>8.0f} {percentiles(like)}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark cold-start cost: import time per entry module and time until the
+web server answers /health.
+
+Each import runs in a fresh interpreter under `python -X importtime`; the
+raw output is saved to --output/<module>.importtime.txt and the slowest
+modules by cumulative time are printed. The serve test starts `main.py`
+with waitress and fake credentials, so the bot thread fails to connect
+while the web server comes up; /health/bot reports that separately.
+
+Usage:
+    python -m benchmarks.startup --modules src src.web src.bot --top 8
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+FAKE_ENV = {
+    "SLACK_BOT_TOKEN": "xoxb-startup",
+    "SLACK_APP_TOKEN": "xapp-startup",
+    "SLACK_CLIENT_ID": "startup",
+    "SLACK_CLIENT_SECRET": "startup",
+    "SLACK_SIGNING_SECRET": "startup",
+    "GOOGLE_API_KEY": "startup",
+    "RETENTION_INTERVAL": "0",
+}
+
+
+def importtime(module: str, env: Dict[str, str]) -> Tuple[float, str]:
+    """Wall seconds to import module in a fresh interpreter, and the -X importtime log."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def slowest(log: str, top: int) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, module) for the slowest imports in a -X importtime log."""
+    rows = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url: str) -> Tuple[int, dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        # e.g. the HTML 404 of a server without the route
+        return status, {}
+
+
+def time_to_health(env: Dict[str, str], timeout: float) -> Tuple[float, dict]:
+    """Seconds from starting main.py until /health returns 200, and /health/bot at that time."""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "main.py", "--server", "waitress", "--port", str(port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                status, _ = get(f"http://127.0.0.1:{port}/health")
+                if status == 200:
+                    elapsed = time.perf_counter() - start
+                    return elapsed, get(f"http://127.0.0.1:{port}/health/bot")[1]
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"/health did not return 200 within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import and web startup time")
+    parser.add_argument("--modules", nargs="+", default=["src", "src.web", "src.bot"])
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to show per module")
+    parser.add_argument("--output", default="startup-importtime",
+                        help="Directory for the raw -X importtime logs")
+    parser.add_argument("--serve-timeout", type=float, default=30)
+    parser.add_argument("--no-serve", action="store_true", help="Skip the /health test")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **FAKE_ENV, DB_PATH=os.path.join(tmp, "startup.db"))
+        for module in args.modules:
+            wall, log = importtime(module, env)
+            path = os.path.join(args.output, f"{module}.importtime.txt")
+            with open(path, "w") as f:
+                f.write(log)
+            print(f"import {module}: {wall * 1000:.0f} ms wall (log: {path})")
+            for cumulative, name in slowest(log, args.top):
+                print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        if not args.no_serve:
+            elapsed, bot = time_to_health(env, args.serve_timeout)
+            print(f"main.py --server waitress: /health 200 after {elapsed * 1000:.0f} ms "
+                  f"(bot: {bot.get('bot')})")
+
+
+if __name__ == "__main__":
+    main()
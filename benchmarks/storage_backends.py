@@ -0,0 +1,98 @@
+"""
+Throughput benchmark shared by every storage backend.
+
+Each backend runs a mention-shaped workload: read the workspace, store the
+user message, load the context and store the reply. Every run uses fresh
+team ids, so it is safe to point the postgres backend at a shared database.
+The behaviour the backends share is checked by tests/test_storage.py.
+
+Usage:
+    python -m benchmarks.storage_backends --mentions 5000 --threads 8
+    python -m benchmarks.storage_backends --backends postgres \\
+        --dsn postgresql://localhost/slamobot_bench
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from src.storage import MemoryStorage, Storage
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench(db: Storage, mentions: int, threads: int) -> Dict[str, float]:
+    """Mentions/sec and per-mention latency with `threads` concurrent workers."""
+    team = f"T{uuid.uuid4().hex[:10]}"
+    db.add_workspace(team, "Bench", "xoxb-bench", "B1")
+    per_thread = mentions // threads
+    timings: List[float] = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int) -> None:
+        local = []
+        for i in range(per_thread):
+            thread_ts = f"{worker_id}.{i % 20}"
+            start = time.perf_counter()
+            db.get_workspace(team)
+            db.store_message(team, "C1", thread_ts, "U1", f"question {i}", False)
+            db.get_context_messages(team, "C1", thread_ts, 20)
+            db.store_message(team, "C1", thread_ts, "B1", f"answer {i}", True)
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    db.flush()
+    elapsed = time.perf_counter() - start
+    return {
+        "mentions_per_sec": len(timings) / elapsed,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Storage backend benchmark")
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"],
+                        choices=["memory", "sqlite", "postgres"])
+    parser.add_argument("--dsn", help="PostgreSQL DSN (defaults to DATABASE_URL)")
+    parser.add_argument("--mentions", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            if backend == "memory":
+                db: Storage = MemoryStorage()
+            elif backend == "sqlite":
+                from src.db import Database
+                db = Database(os.path.join(tmp, "storage.db"))
+            else:
+                from src.postgres import PostgresStorage
+                db = PostgresStorage(args.dsn or os.environ.get("DATABASE_URL"),
+                                     max_connections=max(args.threads, 1))
+            result = bench(db, args.mentions, args.threads)
+            db.close()
+            print(f"{backend:10} {result['mentions_per_sec']:10.0f} mentions/sec  "
+                  f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
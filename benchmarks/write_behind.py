@@ -0,0 +1,58 @@
+"""
+Benchmark message persistence throughput with and without write-behind.
+
+Several threads call `Database.store_message` the way concurrent mentions
+do; rows/sec includes the final flush, so every row is committed when the
+clock stops.
+
+Usage:
+    python -m benchmarks.write_behind --rows 20000 --threads 8
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from src.db import Database
+
+
+def bench(db: Database, rows: int, threads: int) -> float:
+    """Return committed rows per second."""
+    per_thread = rows // threads
+
+    def worker(worker_id: int) -> None:
+        for i in range(per_thread):
+            db.store_message("T1", "C1", f"{worker_id}-{i % 20}", "U1", f"message {i}", i % 2 == 1)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    db.flush()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write-behind persistence benchmark")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, write_behind in (("direct inserts", False), ("write-behind", True)):
+            db = Database(os.path.join(tmp, f"{label}.db"), write_behind=write_behind)
+            rate = bench(db, args.rows, args.threads)
+            count = db.get_connection().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            db.close()
+            print(f"{label:16s} {rate:10.0f} rows/sec  ({count} rows committed)")
+
+
+if __name__ == "__main__":
+    main()
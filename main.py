@@ -1,71 +1,152 @@
 import argparse
+import importlib.util
 import logging
+import subprocess
 import threading
 import os
+import signal
 import sys
 
-from src.bot import SlackBot
-from src.web import app
+from dotenv import load_dotenv
+
+# Before anything in src is imported: settings are read from the
+# environment when src.config is first imported
+load_dotenv()
+
 from src import config
+from src import readiness
 
 def setup_logging(verbose: bool) -> None:
-    """Configure logging with proper format and level."""
+    """Send logs to stdout through a background writer, as JSON lines unless LOG_FORMAT=text."""
     log_level = logging.INFO if verbose else logging.WARNING
-    
-    # Configure root logger
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        stream=sys.stdout  # Ensure logs go to stdout for Railway
-    )
-    
+    # Imported here so src.logs loads only in the processes that set up logging
+    from src.logs import setup
+    setup(log_level)
+
     # Set Flask's logger to the same level
     logging.getLogger('werkzeug').setLevel(log_level)
 
 def run_slack_bot():
     """Run the Slack bot in a separate thread."""
     try:
+        # Imported here so the web server can come up while the Slack and
+        # Gemini SDKs load on this thread
+        from src.bot import SlackBot
         bot = SlackBot()
         bot.start()
     except Exception as e:
-        logging.error(f"Failed to start bot: {e}")
+        logging.error("Failed to start bot: %s", e)
+        readiness.set_state('bot', readiness.FAILED)
         raise
 
-def run_web_server(port):
-    """Run the Flask web server."""
+def run_web_server(port, server='dev', threads=8, workers=2):
+    """Run the Flask web server with the selected WSGI server."""
     try:
         # Log the port we're using
-        logging.info(f"Starting web server on port {port}")
-        app.run(host='0.0.0.0', port=port)
+        logging.info("Starting %s web server on port %s", server, port)
+        if server == 'gunicorn':
+            run_gunicorn(port, threads, workers)
+            return
+        from src.web import create_app
+        app = create_app()
+        if server == 'waitress':
+            from waitress import serve
+            serve(app, host='0.0.0.0', port=port, threads=threads)
+        else:
+            app.run(host='0.0.0.0', port=port)
     except Exception as e:
-        logging.error(f"Failed to start web server: {e}")
+        logging.error("Failed to start web server: %s", e)
         raise
 
+def run_gunicorn(port, threads, workers):
+    """Serve the app factory from gunicorn worker processes until they exit."""
+    if importlib.util.find_spec('gunicorn') is None:
+        raise RuntimeError("gunicorn is not installed; run 'pip install gunicorn' or use --server waitress")
+    # A child process rather than an embedded arbiter, so gunicorn never
+    # forks a process that is already running the bot thread
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--bind', f'0.0.0.0:{port}',
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--worker-class', 'gthread',
+        'src.web:create_app()'
+    ]
+    process = subprocess.Popen(command)
+    # Pass a container stop on to gunicorn so it shuts its workers down
+    signal.signal(signal.SIGTERM, lambda signum, frame: process.terminate())
+    try:
+        returncode = process.wait()
+    except KeyboardInterrupt:
+        process.terminate()
+        returncode = process.wait()
+    if returncode:
+        raise RuntimeError(f"gunicorn exited with status {returncode}")
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Slack Bot with web interface')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
     parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)),
                       help='Port for the web server')
+    parser.add_argument('--server', choices=['dev', 'waitress', 'gunicorn', 'none'],
+                      default=os.environ.get('WEB_SERVER', 'dev'),
+                      help="Web server: Flask's dev server, embedded waitress, gunicorn workers, "
+                           "or none to run only the bot")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 8)),
+                      help='Request threads for waitress, or per gunicorn worker')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 2)),
+                      help='gunicorn worker processes')
+    parser.add_argument('--bot-shards', type=int, default=int(os.environ.get('BOT_SHARDS', 1)),
+                      help='Bot worker processes, each owning the workspaces whose team_id hashes to it')
     args = parser.parse_args()
 
-    # Set up logging
+    # Until logging is set up, only the warnings and errors of validate() reach stderr
+    config.validate()
     setup_logging(args.verbose)
 
     # Log startup information
     logging.info("Starting Slamobot...")
-    logging.info(f"Environment: SLACK_CLIENT_ID={'Yes' if config.SLACK_CLIENT_ID else 'No'}")
-    logging.info(f"Environment: SLACK_CLIENT_SECRET={'Yes' if config.SLACK_CLIENT_SECRET else 'No'}")
-    logging.info(f"Environment: SLACK_APP_TOKEN={'Yes' if config.SLACK_APP_TOKEN else 'No'}")
-    logging.info(f"Environment: GOOGLE_API_KEY={'Yes' if config.GOOGLE_API_KEY else 'No'}")
+    logging.info("Environment: SLACK_CLIENT_ID=%s", 'Yes' if config.SLACK_CLIENT_ID else 'No')
+    logging.info("Environment: SLACK_CLIENT_SECRET=%s", 'Yes' if config.SLACK_CLIENT_SECRET else 'No')
+    logging.info("Environment: SLACK_APP_TOKEN=%s", 'Yes' if config.SLACK_APP_TOKEN else 'No')
+    logging.info("Environment: GOOGLE_API_KEY=%s", 'Yes' if config.GOOGLE_API_KEY else 'No')
+
+    if args.bot_shards > 1:
+        run_sharded(args)
+        return
 
     # Start the Slack bot in a separate thread
+    readiness.set_state('bot', readiness.STARTING)
     bot_thread = threading.Thread(target=run_slack_bot)
     bot_thread.daemon = True  # Thread will exit when main program exits
     bot_thread.start()
 
+    if args.server == 'none':
+        bot_thread.join()
+        return
+
     # Run the Flask web server in the main thread
-    run_web_server(args.port)
+    run_web_server(args.port, args.server, args.threads, args.workers)
+
+def run_sharded(args):
+    """Run the bot as supervised shard processes next to the web server."""
+    from src.shards import Supervisor
+    logging.info("Starting %s bot shards", args.bot_shards)
+    readiness.set_state('bot', readiness.STARTING)
+    supervisor = Supervisor(args.bot_shards, logging.INFO if args.verbose else logging.WARNING)
+    supervisor.start()
+    readiness.register('bot', supervisor.ready_state)
+    # Turn a container stop into a normal exit so the shards are stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args.server == 'none':
+            supervisor.monitor()
+        else:
+            threading.Thread(target=supervisor.monitor, name='shard-supervisor', daemon=True).start()
+            run_web_server(args.port, args.server, args.threads, args.workers)
+    finally:
+        supervisor.stop()
 
 if __name__ == "__main__":
     main()
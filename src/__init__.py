@@ -2,6 +2,22 @@
 Slack bot application that integrates with LLM for conversational responses.
 """
 
-from .bot import SlackBot
-from .db import Database
-from .llm import LLM
+import importlib
+
+# Exported names resolve on first access, so importing src (e.g. for the web
+# server or a CLI) does not pull in the Slack and Gemini SDKs
+_EXPORTS = {
+    "SlackBot": ".bot",
+    "Database": ".db",
+    "LLM": ".llm",
+    "MemoryStorage": ".storage",
+    "Storage": ".storage",
+    "create_storage": ".storage",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
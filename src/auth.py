@@ -0,0 +1,80 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from .cache import TTLCache, MISSING
+from .config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL, AUTH_NEGATIVE_CACHE_TTL
+from .db import get_database
+from .storage import Storage
+
+if TYPE_CHECKING:
+    from slack_bolt.authorization import AuthorizeResult
+
+logger = logging.getLogger(__name__)
+
+class WorkspaceAuthorizer:
+    """Resolves Slack authorizations from the workspaces table through an LRU/TTL cache."""
+
+    def __init__(self, db: Optional[Storage] = None):
+        self._db = db
+        self.cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+    @property
+    def db(self) -> Storage:
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    def authorize(self, enterprise_id: Optional[str], team_id: Optional[str]) -> Optional["AuthorizeResult"]:
+        """Return the cached authorization for a team, loading it on a miss."""
+        if not team_id:
+            logger.error("No team_id provided for authorization")
+            return None
+
+        key = (enterprise_id, team_id)
+        result = self.cache.get(key)
+        if result is not MISSING:
+            return result
+
+        workspace = self.db.get_workspace(team_id)
+        if workspace:
+            # Imported here so web processes that only invalidate never load slack_bolt
+            from slack_bolt.authorization import AuthorizeResult
+            logger.info("Found authorization for team %s", team_id)
+            result = AuthorizeResult(
+                enterprise_id=enterprise_id,
+                team_id=workspace["team_id"],
+                bot_token=workspace["bot_token"],
+                bot_id=workspace.get("bot_id"),
+                bot_user_id=workspace.get("bot_id")  # Using bot_id as bot_user_id if no separate field exists
+            )
+            self.cache.set(key, result)
+            return result
+
+        # Cache the miss briefly so unknown teams do not hit the DB on every event
+        logger.error("No authorization found for team %s", team_id)
+        self.cache.set(key, None, ttl=AUTH_NEGATIVE_CACHE_TTL)
+        return None
+
+    def invalidate(self, team_id: Optional[str] = None) -> None:
+        """Drop cached authorizations for one team, or for all teams."""
+        if team_id is None:
+            self.cache.clear()
+        else:
+            removed = self.cache.discard_where(lambda key: key[1] == team_id)
+            logger.info("Invalidated %s cached authorization(s) for team %s", removed, team_id)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+_authorizer: Optional[WorkspaceAuthorizer] = None
+_authorizer_lock = threading.Lock()
+
+def get_authorizer() -> WorkspaceAuthorizer:
+    """Return the process-wide authorizer shared by the bot and web routes."""
+    global _authorizer
+    if _authorizer is None:
+        with _authorizer_lock:
+            if _authorizer is None:
+                _authorizer = WorkspaceAuthorizer()
+    return _authorizer
@@ -3,19 +3,61 @@ from typing import List, Tuple, Dict, Optional
 from slack_bolt import App
 from slack_bolt.authorization import AuthorizeResult
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_bolt.context.say import Say
+from slack_sdk import WebClient
 import sqlite3
 import os
+import time
 
-from .config import SLACK_APP_TOKEN, GOOGLE_API_KEY
-from .db import Database
+from .config import (SLACK_APP_TOKEN, GOOGLE_API_KEY, LLM_MODELS, MENTION_WORKERS, MENTION_QUEUE_SIZE,
+                     MENTION_SHUTDOWN_TIMEOUT, STREAM_RESPONSES, STREAM_UPDATE_INTERVAL,
+                     CONTEXT_TOKEN_BUDGET, CONTEXT_MESSAGE_MAX_TOKENS, CONTEXT_SCAN_LIMIT,
+                     SUMMARY_ENABLED, SUMMARY_TRIGGER_MESSAGES, SUMMARY_KEEP_RECENT, SUMMARY_MAX_TOKENS,
+                     RETENTION_INTERVAL)
+from . import readiness
+from .auth import get_authorizer
+from .context import build_context, estimate_tokens
+from .db import get_database
+from .digest import ChannelDigester, parse_digest_request
+from .dispatcher import MentionDispatcher
+from .idempotency import EventDeduplicator
 from .llm import LLM
+from .metrics import (MENTIONS, MENTION_ERRORS, MENTIONS_SHED, MENTIONS_IN_FLIGHT, MENTION_SECONDS,
+                      MENTION_QUEUE_DEPTH, SLACK_POST_SECONDS)
+from .retention import RetentionManager
+from .retrieval import related_messages, with_related_context
+from .scheduler import RateLimitError
+from .shards import ShardRouter
+from .streaming import StreamingReply
+from .summaries import ThreadSummarizer
+from .tracing import activate, current_trace, current_trace_id, new_trace, span, traced
+from .workspaces import get_registry
 
 logger = logging.getLogger(__name__)
 
+BUSY_MESSAGE = "I'm a bit busy right now, please try again in a moment. ⏳"
+
 class SlackBot:
-    def __init__(self):
-        self.db = Database()
-        self.model = LLM(API_KEY=GOOGLE_API_KEY, model_name='gemini-pro')
+    def __init__(self, router: Optional[ShardRouter] = None):
+        # Set when running as one shard of a supervisor (see src/shards.py)
+        self.router = router
+        self.db = get_database()
+        self.model = LLM(API_KEY=GOOGLE_API_KEY, models=LLM_MODELS)
+        self.deduplicator = EventDeduplicator(self.db)
+        self.dispatcher = MentionDispatcher(workers=MENTION_WORKERS, max_pending=MENTION_QUEUE_SIZE)
+        MENTION_QUEUE_DEPTH.labels().set_function(self.dispatcher.depth)
+        self.summarizer = None
+        if SUMMARY_ENABLED:
+            self.summarizer = ThreadSummarizer(self.db, self.model, trigger=SUMMARY_TRIGGER_MESSAGES,
+                                               keep_recent=SUMMARY_KEEP_RECENT,
+                                               max_tokens=SUMMARY_MAX_TOKENS,
+                                               message_max_tokens=CONTEXT_MESSAGE_MAX_TOKENS)
+        self.digester = ChannelDigester(self.model, self.db)
+        # One retention job per database, so only the first shard runs it
+        self.retention = None
+        if RETENTION_INTERVAL > 0 and (router is None or router.index == 0):
+            self.retention = RetentionManager(self.db)
+            self.retention.start(RETENTION_INTERVAL)
         
         # Initialize single app instance with OAuth
         self.app = App(
@@ -32,132 +74,274 @@ class SlackBot:
         self.handler = SocketModeHandler(self.app, SLACK_APP_TOKEN)
         
     @staticmethod
-    def _authorize(enterprise_id: Optional[str], team_id: Optional[str], **kwargs) -> Optional[AuthorizeResult]:
-        """Authorize incoming requests using stored tokens."""
-        logger.info(f"Authorizing request for team_id: {team_id}")
-        
-        if not team_id:
-            logger.error("No team_id provided for authorization")
-            return None
-            
-        # Create a new database instance for authorization
-        db = Database()
-        
-        # Get workspace details from database
-        workspace = db.get_workspace(team_id)
-        if workspace:
-            logger.info(f"Found authorization for team {team_id}")
-            return AuthorizeResult(
-                enterprise_id=enterprise_id,
-                team_id=workspace["team_id"],
-                bot_token=workspace["bot_token"],
-                bot_id=workspace.get("bot_id"),
-                bot_user_id=workspace.get("bot_id")  # Using bot_id as bot_user_id if no separate field exists
-            )
-            
-        logger.error(f"No authorization found for team {team_id}")
-        return None
+    def _authorize(enterprise_id: Optional[str], team_id: Optional[str], context=None,
+                   **kwargs) -> Optional[AuthorizeResult]:
+        """Authorize incoming requests using cached stored tokens."""
+        start = time.perf_counter()
+        result = get_authorizer().authorize(enterprise_id, team_id)
+        if context is not None:
+            # Picked up by handle_mention as the first span of the mention's trace
+            context["trace_started"] = start
+            context["authorize_seconds"] = time.perf_counter() - start
+        return result
         
     def _setup_handlers(self) -> None:
         """Set up event handlers for the Slack bot."""
-        @self.app.event("app_mention")
-        def handle_mention(event, say, context):
-            logger.info(f"Received event: {event}")
+        self.app.event("app_mention")(self.handle_mention)
+
+        # Add a message listener for debugging
+        @self.app.message("")
+        def handle_message(message, say, context):
+            logger.debug("Received message event: channel=%s, ts=%s", message.get("channel"),
+                         message.get("ts"))
+
+    def handle_mention(self, event, say, context, client, body=None) -> None:
+        """app_mention listener: queue the mention and return to Bolt straight away."""
+        logger.info("Received app_mention: channel=%s, ts=%s", event.get("channel"), event.get("ts"))
+        # Slack redelivers events it thinks were not acknowledged in time
+        if self.deduplicator.is_duplicate(event, body):
+            return
+        self._dispatch_mention(event, say, context, client)
+
+    def _dispatch_mention(self, event, say, context, client) -> None:
+        """Forward the mention to its shard, or queue it for processing here."""
+        thread_ts = event.get("thread_ts", event["ts"])
+        channel_id = event["channel"]
+        team_id = event.get("team_id") or event.get("team")
+        if self.router is not None and not self.router.owns(team_id):
+            if not self.router.forward(team_id, event):
+                logger.warning("Shard inbox full, shedding mention in thread %s", thread_ts)
+                MENTIONS_SHED.labels(team_id or "unknown").inc()
+                say(text=BUSY_MESSAGE, thread_ts=thread_ts)
+            return
+        MENTIONS.labels(team_id or "unknown").inc()
+
+        trace = new_trace("app_mention", started=context.get("trace_started"), team_id=team_id,
+                          channel=channel_id, thread_ts=thread_ts)
+        if trace is not None and "authorize_seconds" in context:
+            trace.add_span("authorize", trace.started, context["authorize_seconds"])
+
+        # The work runs on the dispatcher, one mention at a time per thread
+        key = (team_id, channel_id, thread_ts)
+        queued_at = time.perf_counter()
+        if not self.dispatcher.submit(key, lambda: self._process_mention(event, say, client, trace,
+                                                                         queued_at)):
+            logger.warning("Mention queue full or shutting down, shedding mention in thread %s", thread_ts)
+            MENTIONS_SHED.labels(team_id or "unknown").inc()
+            if trace is not None:
+                trace.error = "shed"
+            with activate(trace), span("slack.say"):
+                say(text=BUSY_MESSAGE, thread_ts=thread_ts)
+
+    def handle_forwarded(self, event: dict) -> None:
+        """Handle an app_mention that another shard received for a team this shard owns."""
+        team_id = event.get("team_id") or event.get("team")
+        authorization = get_authorizer().authorize(None, team_id)
+        if authorization is None:
+            logger.error("Dropping forwarded mention for unauthorized team %s", team_id)
+            return
+        client = WebClient(token=authorization.bot_token)
+        # Already claimed by the shard that received it
+        self._dispatch_mention(event, Say(client=client, channel=event["channel"]), {}, client)
+
+    def _process_mention(self, event: dict, say, client, trace=None, queued_at: float = 0.0) -> None:
+        """Run a dispatched mention, recording in-flight count, duration and its trace."""
+        team_label = event.get("team_id") or event.get("team") or "unknown"
+        with activate(trace), MENTIONS_IN_FLIGHT.labels(team_label).track_inprogress(), \
+                MENTION_SECONDS.labels(team_label).time():
+            if trace is not None:
+                trace.add_span("queue_wait", queued_at, time.perf_counter() - queued_at)
+            hours = parse_digest_request(event.get("text", ""))
+            if hours is not None:
+                self._reply_with_digest(event, say, client, hours)
+            else:
+                self._reply_to_mention(event, say, client)
+
+    def _reply_to_mention(self, event: dict, say, client) -> None:
+        """Generate, store and post the reply to an app_mention event."""
+        thread_ts = event.get("thread_ts", event["ts"])
+        reply = None
+        try:
+            channel_id = event["channel"]
+            user_message = event["text"]
+            
+            logger.info("Received mention: channel=%s, thread=%s, %d chars", channel_id, thread_ts,
+                        len(user_message))
+            
+            # Get team ID from the event
+            team_id = event.get("team_id") or event.get("team")
+            if not team_id:
+                raise ValueError("Could not determine team ID from event")
+            
+            logger.info("Processing message for team %s", team_id)
+            
+            # One chat session per thread; the stored history is only read
+            # when the thread has no live session yet
+            session_key = (team_id, channel_id, thread_ts)
+            load_history = lambda: self._load_context(team_id, channel_id, thread_ts)
             try:
-                thread_ts = event.get("thread_ts", event["ts"])
-                channel_id = event["channel"]
-                user_message = event["text"]
-                
-                logger.info(f"Received mention: channel={channel_id}, thread={thread_ts}, "
-                          f"message={user_message}")
-                
-                # Get team ID from the event
-                team_id = event.get("team_id") or event.get("team")
-                if not team_id:
-                    raise ValueError("Could not determine team ID from event")
-                
-                logger.info(f"Processing message for team {team_id}")
-                
-                # Store user message
+                # Matching messages from the channel's other threads go along
+                # with the prompt; only the user's own text is stored
+                prompt = with_related_context(
+                    user_message, related_messages(self.db, team_id, channel_id, thread_ts, user_message))
+                if STREAM_RESPONSES:
+                    # Post a placeholder right away and edit it as chunks arrive
+                    reply = StreamingReply(client, channel_id, thread_ts, STREAM_UPDATE_INTERVAL)
+                    reply.start()
+                    stream = self.model.stream_chat_response(prompt, session_key=session_key,
+                                                             history=load_history, team_id=team_id)
+                    for chunk in stream:
+                        reply.append(chunk)
+                    response, model_name = reply.text, stream.model
+                else:
+                    response, model_name = self.model.get_chat_response(
+                        prompt, session_key=session_key, history=load_history, team_id=team_id)
+            finally:
+                # Stored after the call so a freshly seeded session does not
+                # receive the current message twice
                 self.db.store_message(team_id, channel_id, thread_ts, event["user"], 
                                     user_message, False)
-                
-                # Get conversation history
-                history = self.db.get_thread_history(team_id, channel_id, thread_ts)
-                logger.info(f"Retrieved history: {history}")
-                
-                # Convert 'true'/'false' strings back to boolean for formatting
-                context = "\n".join([
-                    f"{'Bot' if is_bot == 'true' else 'User'}: {msg}" 
-                    for msg, is_bot in history
-                ])
-                
-                response = self.model.get_chat_response(context) 
-                logger.info(f"Sending response: {response}")
-                
-                # Store bot response
-                self.db.store_message(team_id, channel_id, thread_ts, "BOT", response, True)
-                
-                # Send response
-                say(**format_response(response), thread_ts=thread_ts)
-                
-            except Exception as e:
-                logger.error(f"Error in handle_mention: {e}", exc_info=True)
+            logger.info("Sending response: %d chars from %s", len(response), model_name)
+            
+            # Store bot response
+            self.db.store_message(team_id, channel_id, thread_ts, "BOT", response, True, model=model_name)
+            if self.summarizer is not None:
+                self.summarizer.schedule(team_id, channel_id, thread_ts)
+            
+            # Send response
+            if reply is not None:
+                reply.finish(text=response, **format_response(response))
+            else:
+                with SLACK_POST_SECONDS.labels("say").time(), span("slack.say"):
+                    say(**format_response(response), thread_ts=thread_ts)
+            
+        except Exception as e:
+            logger.error("Error in handle_mention (trace %s): %s", current_trace_id(), e, exc_info=True)
+            MENTION_ERRORS.labels(event.get("team_id") or event.get("team") or "unknown").inc()
+            trace = current_trace()
+            if trace is not None:
+                trace.error = f"{type(e).__name__}: {e}"
+            if isinstance(e, RateLimitError):
+                error_msg = "Sorry, I'm handling too many requests right now. Please try again in a minute."
+            else:
                 error_msg = f"Sorry, I encountered an error: {str(e)}"
-                say(text=error_msg, thread_ts=thread_ts)
+            if reply is not None and reply.ts:
+                reply.finish(text=error_msg)
+            else:
+                with span("slack.say"):
+                    say(text=error_msg, thread_ts=thread_ts)
 
-        # Add a message listener for debugging
-        @self.app.message("")
-        def handle_message(message, say, context):
-            logger.info(f"Received message: {message}")
-
-        def format_response(response: str) -> dict:
-            return {
-                "blocks": [
-                    {
-                        "type": "header",
-                        "text": {
-                            "type": "plain_text",
-                            "text": "🤖 Bot Response",
-                            "emoji": True
-                        }
-                    },
-                    {
-                        "type": "divider"
-                    },
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": response
-                        }
-                    }
-                ]
-            }
+    def _reply_with_digest(self, event: dict, say, client, hours: float) -> None:
+        """Post a digest of the channel's last `hours` hours in reply to a digest command."""
+        thread_ts = event.get("thread_ts", event["ts"])
+        reply = None
+        try:
+            channel_id = event["channel"]
+            team_id = event.get("team_id") or event.get("team")
+            if not team_id:
+                raise ValueError("Could not determine team ID from event")
+            logger.info("Digesting the last %g hours of channel %s for team %s", hours, channel_id, team_id)
+
+            # Reading and summarizing a busy channel takes a while, so
+            # acknowledge the command first
+            reply = StreamingReply(client, channel_id, thread_ts, STREAM_UPDATE_INTERVAL)
+            reply.start()
+            digest = self.digester.digest(team_id, channel_id, hours, client=client)
+            self.db.store_message(team_id, channel_id, thread_ts, event["user"], event["text"], False)
+            self.db.store_message(team_id, channel_id, thread_ts, "BOT", digest, True)
+            reply.finish(text=digest, **format_response(digest))
+
+        except Exception as e:
+            logger.error("Error building digest (trace %s): %s", current_trace_id(), e, exc_info=True)
+            MENTION_ERRORS.labels(event.get("team_id") or event.get("team") or "unknown").inc()
+            trace = current_trace()
+            if trace is not None:
+                trace.error = f"{type(e).__name__}: {e}"
+            if isinstance(e, RateLimitError):
+                error_msg = "Sorry, I'm handling too many requests right now. Please try again in a minute."
+            else:
+                error_msg = f"Sorry, I couldn't build the digest: {str(e)}"
+            if reply is not None and reply.ts:
+                reply.finish(text=error_msg)
+            else:
+                with span("slack.say"):
+                    say(text=error_msg, thread_ts=thread_ts)
+
+    @traced("bot.load_context")
+    def _load_context(self, team_id: str, channel_id: str, thread_ts: str) -> List[Tuple[str, bool]]:
+        """Build the session seed: the thread summary plus the recent messages it does not cover."""
+        summary, last_id = self.db.get_thread_summary(team_id, channel_id, thread_ts) or ("", 0)
+        summary_turn = [(f"Summary of the earlier conversation:\n{summary}", False)] if summary else []
+        budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(summary)
+        messages = self.db.get_context_messages(team_id, channel_id, thread_ts, CONTEXT_SCAN_LIMIT,
+                                                after_id=last_id)
+        return summary_turn + build_context(messages, max(budget, 0), CONTEXT_MESSAGE_MAX_TOKENS)
 
     def start(self) -> None:
         """Start the bot."""
         try:
             logger.info("Starting Slack bot...")
             # Log app configuration
-            logger.info(f"App Configuration:")
-            logger.info(f"  Signing Secret: {'Set' if os.environ.get('SLACK_SIGNING_SECRET') else 'Not Set'}")
-            logger.info(f"  App Token: {'Set' if SLACK_APP_TOKEN else 'Not Set'}")
-            logger.info(f"  Client ID: {'Set' if os.environ.get('SLACK_CLIENT_ID') else 'Not Set'}")
-            logger.info(f"  Client Secret: {'Set' if os.environ.get('SLACK_CLIENT_SECRET') else 'Not Set'}")
+            logger.info("App Configuration:")
+            logger.info("  Signing Secret: %s",
+                        'Set' if os.environ.get('SLACK_SIGNING_SECRET') else 'Not Set')
+            logger.info("  App Token: %s", 'Set' if SLACK_APP_TOKEN else 'Not Set')
+            logger.info("  Client ID: %s", 'Set' if os.environ.get('SLACK_CLIENT_ID') else 'Not Set')
+            logger.info("  Client Secret: %s", 'Set' if os.environ.get('SLACK_CLIENT_SECRET') else 'Not Set')
             
+            # Ready while Socket Mode is connected, including after reconnects
+            readiness.register("bot", lambda: readiness.READY if self.handler.client.is_connected()
+                               else readiness.STARTING)
             # Start the handler
             self.handler.start()
         except Exception as e:
-            logger.error(f"Error starting bot: {e}", exc_info=True)
+            logger.error("Error starting bot: %s", e, exc_info=True)
+            readiness.set_state("bot", readiness.FAILED)
             raise
 
+    def stop(self) -> None:
+        """Stop receiving events and let queued mentions finish."""
+        try:
+            self.handler.close()
+        finally:
+            self.dispatcher.shutdown(timeout=MENTION_SHUTDOWN_TIMEOUT)
+            if self.summarizer is not None:
+                self.summarizer.shutdown()
+            self.digester.shutdown()
+            self.model.shutdown()
+            if self.retention is not None:
+                self.retention.stop()
+            self.db.flush()
+
     def add_workspace(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> None:
         """Add a new workspace to the database."""
         try:
-            if not self.db.add_workspace(team_id, team_name, bot_token, bot_id):
-                raise Exception("Failed to store workspace in database")
-            logger.info(f"Added workspace to database: {team_id} ({team_name})")
+            get_registry().register(team_id, team_name, bot_token, bot_id)
         except Exception as e:
-            logger.error(f"Error adding workspace {team_id}: {e}", exc_info=True)
+            logger.error("Error adding workspace %s: %s", team_id, e, exc_info=True)
             raise
+
+
+def format_response(response: str) -> dict:
+    return {
+        "blocks": [
+            {
+                "type": "header",
+                "text": {
+                    "type": "plain_text",
+                    "text": "🤖 Bot Response",
+                    "emoji": True
+                }
+            },
+            {
+                "type": "divider"
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": response
+                }
+            }
+        ]
+    }
@@ -1,21 +1,71 @@
 import os
 import logging
-from dotenv import load_dotenv
+from typing import List, Optional
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Settings are read from os.environ when this module is imported, so entry
+# points load .env (load_dotenv) before anything in src imports it;
+# validate() then checks the required ones
+REQUIRED_VARS = (
+    "SLACK_BOT_TOKEN",
+    "SLACK_APP_TOKEN",
+    "SLACK_CLIENT_ID",
+    "SLACK_CLIENT_SECRET",
+    "SLACK_SIGNING_SECRET",
+    "GOOGLE_API_KEY"
+)
 
-def get_required_env(key: str) -> str:
-    """Get a required environment variable or log an error."""
+_validated = False
+
+def validate() -> List[str]:
+    """Check the required settings, logging the result once; returns the missing variables."""
+    global _validated
+    missing = [key for key in REQUIRED_VARS if not os.environ.get(key)]
+    if _validated:
+        return missing
+    _validated = True
+
+    logger.info("Using database path: %s", DB_PATH)
+    if missing:
+        logger.error("Missing required environment variables: %s", ', '.join(missing))
+    else:
+        logger.info("All required environment variables are set")
+    return missing
+
+def get_required_env(key: str) -> Optional[str]:
+    """Get a required environment variable; validate() reports it if unset."""
+    return os.environ.get(key)
+
+def get_bool_env(key: str, default: bool) -> bool:
+    """Get a boolean environment variable such as 'true'/'false' or '1'/'0'."""
     value = os.environ.get(key)
     if not value:
-        logger.error(f"Required environment variable {key} is not set")
-    else:
-        logger.info(f"Loaded {key} environment variable")
-    return value
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def get_float_env(key: str, default: float) -> float:
+    """Get a float environment variable, falling back to a default."""
+    value = os.environ.get(key)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.error("Environment variable %s must be a number, using default %s", key, default)
+        return default
+
+def get_int_env(key: str, default: int) -> int:
+    """Get an integer environment variable, falling back to a default."""
+    value = os.environ.get(key)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.error("Environment variable %s must be an integer, using default %s", key, default)
+        return default
 
 # Slack configuration
 SLACK_BOT_TOKEN = get_required_env("SLACK_BOT_TOKEN")
@@ -24,34 +74,175 @@ SLACK_CLIENT_ID = get_required_env("SLACK_CLIENT_ID")
 SLACK_CLIENT_SECRET = get_required_env("SLACK_CLIENT_SECRET")
 SLACK_SIGNING_SECRET = get_required_env("SLACK_SIGNING_SECRET")
 
+# Storage backend: sqlite (DB_PATH), postgres (DATABASE_URL) or memory (not persisted)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite").lower()
+DATABASE_URL = os.environ.get("DATABASE_URL")
+PG_POOL_MIN = get_int_env("PG_POOL_MIN", 1)
+PG_POOL_MAX = get_int_env("PG_POOL_MAX", 10)
+
 # Database configuration
 DB_PATH = os.environ.get("DB_PATH", "messages.db")
-logger.info(f"Using database path: {DB_PATH}")
+
+# SQLite connection tuning (applied to every pooled connection)
+DB_BUSY_TIMEOUT_MS = get_int_env("DB_BUSY_TIMEOUT_MS", 5000)
+DB_CACHE_SIZE_KB = get_int_env("DB_CACHE_SIZE_KB", 16384)
+DB_MMAP_SIZE = get_int_env("DB_MMAP_SIZE", 128 * 1024 * 1024)
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_STATEMENT_CACHE_SIZE = get_int_env("DB_STATEMENT_CACHE_SIZE", 128)
+DB_MIGRATION_BATCH_SIZE = get_int_env("DB_MIGRATION_BATCH_SIZE", 5000)
+
+# Write-behind message persistence: queue inserts and commit them in batches
+# of up to DB_WRITE_BATCH_SIZE rows at least every DB_WRITE_FLUSH_INTERVAL seconds
+DB_WRITE_BEHIND = get_bool_env("DB_WRITE_BEHIND", False)
+DB_WRITE_BATCH_SIZE = get_int_env("DB_WRITE_BATCH_SIZE", 200)
+DB_WRITE_FLUSH_INTERVAL = get_float_env("DB_WRITE_FLUSH_INTERVAL", 0.05)
+DB_WRITE_QUEUE_SIZE = get_int_env("DB_WRITE_QUEUE_SIZE", 10000)
+
+# Message retention: threads idle for longer than a workspace's TTL are
+# archived to ARCHIVE_DIR and deleted every RETENTION_INTERVAL seconds
+# (0 disables the job); RETENTION_DEFAULT_DAYS=0 keeps messages forever
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "archive"))
+RETENTION_DEFAULT_DAYS = get_float_env("RETENTION_DEFAULT_DAYS", 0)
+RETENTION_INTERVAL = get_float_env("RETENTION_INTERVAL", 3600)
+RETENTION_BATCH_THREADS = get_int_env("RETENTION_BATCH_THREADS", 50)
+RETENTION_VACUUM_PAGES = get_int_env("RETENTION_VACUUM_PAGES", 0)
+
+# Redelivered event suppression: keys seen in the last EVENT_DEDUP_TTL seconds,
+# up to EVENT_DEDUP_CACHE_SIZE of them in memory and all of them in storage
+EVENT_DEDUP_CACHE_SIZE = get_int_env("EVENT_DEDUP_CACHE_SIZE", 10000)
+EVENT_DEDUP_TTL = get_float_env("EVENT_DEDUP_TTL", 3600)
+
+# Authorization cache for incoming Slack events
+AUTH_CACHE_SIZE = get_int_env("AUTH_CACHE_SIZE", 1024)
+AUTH_CACHE_TTL = get_int_env("AUTH_CACHE_TTL", 300)
+AUTH_NEGATIVE_CACHE_TTL = get_int_env("AUTH_NEGATIVE_CACHE_TTL", 10)
+
+# Outbound HTTP to the Slack Web API: pooled keep-alive connections,
+# timeouts in seconds, and retries for failed connection attempts only
+HTTP_POOL_SIZE = get_int_env("HTTP_POOL_SIZE", 10)
+HTTP_CONNECT_TIMEOUT = get_float_env("HTTP_CONNECT_TIMEOUT", 3.05)
+HTTP_READ_TIMEOUT = get_float_env("HTTP_READ_TIMEOUT", 10)
+HTTP_CONNECT_RETRIES = get_int_env("HTTP_CONNECT_RETRIES", 2)
 
 # LLM configuration
 GOOGLE_API_KEY = get_required_env("GOOGLE_API_KEY")
 
-# Validate required configuration
-REQUIRED_VARS = [
-    SLACK_BOT_TOKEN,
-    SLACK_APP_TOKEN,
-    SLACK_CLIENT_ID,
-    SLACK_CLIENT_SECRET,
-    SLACK_SIGNING_SECRET,
-    GOOGLE_API_KEY
-]
-
-if not all(REQUIRED_VARS):
-    missing = [
-        var for var, value in {
-            "SLACK_BOT_TOKEN": SLACK_BOT_TOKEN,
-            "SLACK_APP_TOKEN": SLACK_APP_TOKEN,
-            "SLACK_CLIENT_ID": SLACK_CLIENT_ID,
-            "SLACK_CLIENT_SECRET": SLACK_CLIENT_SECRET,
-            "SLACK_SIGNING_SECRET": SLACK_SIGNING_SECRET,
-            "GOOGLE_API_KEY": GOOGLE_API_KEY
-        }.items() if not value
-    ]
-    logger.error(f"Missing required environment variables: {', '.join(missing)}")
-else:
-    logger.info("All required environment variables are set")
+# Model pool: requests go to the first model in LLM_MODELS (comma-separated)
+# whose circuit breaker is closed and fail over to the next. A breaker opens
+# when LLM_BREAKER_ERROR_RATE of the model's last LLM_STATS_WINDOW calls (and
+# at least LLM_BREAKER_MIN_CALLS) failed, for LLM_BREAKER_COOLDOWN seconds.
+# With LLM_HEDGE, a request slower than the model's LLM_HEDGE_PERCENTILE
+# latency (at least LLM_HEDGE_MIN_DELAY_MS) is also sent to the next model.
+# The API's model list is cached for LLM_MODEL_LIST_TTL seconds
+LLM_MODELS = [model.strip() for model in os.environ.get("LLM_MODELS", "gemini-pro").split(",")
+              if model.strip()]
+LLM_HEDGE = get_bool_env("LLM_HEDGE", True)
+LLM_HEDGE_PERCENTILE = get_float_env("LLM_HEDGE_PERCENTILE", 95)
+LLM_HEDGE_MIN_DELAY_MS = get_float_env("LLM_HEDGE_MIN_DELAY_MS", 500)
+LLM_HEDGE_WORKERS = get_int_env("LLM_HEDGE_WORKERS", 32)
+LLM_STATS_WINDOW = get_int_env("LLM_STATS_WINDOW", 200)
+LLM_BREAKER_ERROR_RATE = get_float_env("LLM_BREAKER_ERROR_RATE", 0.5)
+LLM_BREAKER_MIN_CALLS = get_int_env("LLM_BREAKER_MIN_CALLS", 10)
+LLM_BREAKER_COOLDOWN = get_float_env("LLM_BREAKER_COOLDOWN", 30)
+LLM_MODEL_LIST_TTL = get_float_env("LLM_MODEL_LIST_TTL", 3600)
+
+# Mention processing: worker threads, queued mentions before shedding load,
+# and seconds to wait for queued mentions on shutdown
+MENTION_WORKERS = get_int_env("MENTION_WORKERS", 8)
+MENTION_QUEUE_SIZE = get_int_env("MENTION_QUEUE_SIZE", 100)
+MENTION_SHUTDOWN_TIMEOUT = get_int_env("MENTION_SHUTDOWN_TIMEOUT", 30)
+
+# Streamed replies: edit a placeholder message at most once per interval (seconds)
+STREAM_RESPONSES = get_bool_env("STREAM_RESPONSES", True)
+STREAM_UPDATE_INTERVAL = get_float_env("STREAM_UPDATE_INTERVAL", 1.0)
+
+# Context assembly: estimated-token budget for thread history sent to the LLM,
+# cap for any single message, and how many recent messages to consider
+CONTEXT_TOKEN_BUDGET = get_int_env("CONTEXT_TOKEN_BUDGET", 2000)
+CONTEXT_MESSAGE_MAX_TOKENS = get_int_env("CONTEXT_MESSAGE_MAX_TOKENS", 500)
+CONTEXT_SCAN_LIMIT = get_int_env("CONTEXT_SCAN_LIMIT", 50)
+
+# Retrieval: up to RETRIEVAL_TOP_K messages (0 disables) from the channel's
+# other threads that share words with a mention are added to its prompt, in
+# at most RETRIEVAL_MAX_TOKENS estimated tokens; a search that takes longer
+# than RETRIEVAL_TIME_BUDGET_MS is abandoned
+RETRIEVAL_TOP_K = get_int_env("RETRIEVAL_TOP_K", 3)
+RETRIEVAL_MAX_TOKENS = get_int_env("RETRIEVAL_MAX_TOKENS", 300)
+RETRIEVAL_TIME_BUDGET_MS = get_float_env("RETRIEVAL_TIME_BUDGET_MS", 10)
+RETRIEVAL_MAX_TERMS = get_int_env("RETRIEVAL_MAX_TERMS", 8)
+
+# LLM request scheduling: a global limit of LLM_REQUESTS_PER_MINUTE (0 for
+# none) shared between workspaces by deficit round-robin, LLM_FAIR_QUANTUM
+# estimated tokens per team per round; rate-limited calls are retried up to
+# LLM_MAX_RETRIES times with jittered exponential backoff (seconds)
+LLM_REQUESTS_PER_MINUTE = get_float_env("LLM_REQUESTS_PER_MINUTE", 0)
+LLM_BURST = get_int_env("LLM_BURST", 5)
+LLM_FAIR_QUANTUM = get_int_env("LLM_FAIR_QUANTUM", 2000)
+LLM_QUEUE_TIMEOUT = get_float_env("LLM_QUEUE_TIMEOUT", 60)
+LLM_MAX_RETRIES = get_int_env("LLM_MAX_RETRIES", 3)
+LLM_RETRY_BASE_DELAY = get_float_env("LLM_RETRY_BASE_DELAY", 1.0)
+LLM_RETRY_MAX_DELAY = get_float_env("LLM_RETRY_MAX_DELAY", 30)
+
+# LLM response cache: a prompt sent with the same model, system prompt and
+# thread context as an earlier one is answered from a RESPONSE_CACHE_SIZE
+# entry in-memory LRU or, if RESPONSE_CACHE_PATH is set, a SQLite file of up
+# to RESPONSE_CACHE_MAX_MB; entries expire after RESPONSE_CACHE_TTL seconds.
+# Workspaces in the comma-separated RESPONSE_CACHE_DISABLED_TEAMS opt out
+RESPONSE_CACHE_SIZE = get_int_env("RESPONSE_CACHE_SIZE", 1000)
+RESPONSE_CACHE_TTL = get_float_env("RESPONSE_CACHE_TTL", 3600)
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "")
+RESPONSE_CACHE_MAX_MB = get_float_env("RESPONSE_CACHE_MAX_MB", 64)
+RESPONSE_CACHE_DISABLED_TEAMS = frozenset(
+    team.strip() for team in os.environ.get("RESPONSE_CACHE_DISABLED_TEAMS", "").split(",") if team.strip())
+
+# Rolling thread summaries: once a thread has more than SUMMARY_TRIGGER_MESSAGES
+# unsummarized messages, all but the newest SUMMARY_KEEP_RECENT are folded in
+SUMMARY_ENABLED = get_bool_env("SUMMARY_ENABLED", True)
+SUMMARY_TRIGGER_MESSAGES = get_int_env("SUMMARY_TRIGGER_MESSAGES", 20)
+SUMMARY_KEEP_RECENT = get_int_env("SUMMARY_KEEP_RECENT", 8)
+SUMMARY_MAX_TOKENS = get_int_env("SUMMARY_MAX_TOKENS", 400)
+
+# Channel digests ("@bot digest 6h"): history from the stored messages
+# (DIGEST_SOURCE=local) or the Slack API (slack, needs the channels:history
+# scope; workspaces without it fall back to local), read DIGEST_PAGE_SIZE
+# messages per page and cut into chunks of DIGEST_CHUNK_TOKENS estimated
+# tokens, at most DIGEST_MAX_CHUNKS of them; DIGEST_CONCURRENCY chunks are summarized at once, each in about
+# DIGEST_SUMMARY_TOKENS tokens, and the summaries merged into the digest
+DIGEST_SOURCE = os.environ.get("DIGEST_SOURCE", "local").lower()
+DIGEST_DEFAULT_HOURS = get_float_env("DIGEST_DEFAULT_HOURS", 24)
+DIGEST_MAX_HOURS = get_float_env("DIGEST_MAX_HOURS", 168)
+DIGEST_PAGE_SIZE = get_int_env("DIGEST_PAGE_SIZE", 200)
+DIGEST_CHUNK_TOKENS = get_int_env("DIGEST_CHUNK_TOKENS", 6000)
+DIGEST_SUMMARY_TOKENS = get_int_env("DIGEST_SUMMARY_TOKENS", 300)
+DIGEST_CONCURRENCY = get_int_env("DIGEST_CONCURRENCY", 4)
+DIGEST_MAX_CHUNKS = get_int_env("DIGEST_MAX_CHUNKS", 40)
+
+# Per-thread chat sessions (idle TTL in seconds)
+SESSION_CACHE_SIZE = get_int_env("SESSION_CACHE_SIZE", 256)
+SESSION_IDLE_TTL = get_int_env("SESSION_IDLE_TTL", 1800)
+
+# Sharded bot processes (main.py --bot-shards): heartbeat cadence and the
+# silence after which a shard is restarted, in seconds, plus how many events
+# may wait for a shard that owns their team
+SHARD_HEARTBEAT_INTERVAL = get_float_env("SHARD_HEARTBEAT_INTERVAL", 5)
+SHARD_HEARTBEAT_TIMEOUT = get_float_env("SHARD_HEARTBEAT_TIMEOUT", 60)
+SHARD_FORWARD_QUEUE_SIZE = get_int_env("SHARD_FORWARD_QUEUE_SIZE", 100)
+SHARD_MAX_RESTART_DELAY = get_float_env("SHARD_MAX_RESTART_DELAY", 60)
+
+# Per-mention tracing: traces slower than TRACE_SLOW_MS are logged and the
+# newest TRACE_BUFFER_SIZE of them kept for the admin traces endpoint
+TRACE_ENABLED = get_bool_env("TRACE_ENABLED", True)
+TRACE_SLOW_MS = get_float_env("TRACE_SLOW_MS", 2000)
+TRACE_BUFFER_SIZE = get_int_env("TRACE_BUFFER_SIZE", 100)
+
+# Logging: records are queued (up to LOG_QUEUE_SIZE, then dropped) and written
+# to stdout by a background thread as JSON lines (LOG_FORMAT=json) or text;
+# messages and their arguments are clipped to LOG_MAX_CHARS characters, and
+# INFO and DEBUG records are kept for LOG_SAMPLE_RATE of traces
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = get_int_env("LOG_QUEUE_SIZE", 10000)
+LOG_MAX_CHARS = get_int_env("LOG_MAX_CHARS", 2000)
+LOG_SAMPLE_RATE = get_float_env("LOG_SAMPLE_RATE", 1.0)
+
+# Bearer token for the /admin routes; they are disabled while unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
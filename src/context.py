@@ -0,0 +1,56 @@
+import re
+from typing import List, Optional, Tuple
+
+# Words split into pieces of at most four characters plus single punctuation
+# marks; a cheap local stand-in for a BPE tokenizer that tracks its counts
+# closely enough for budgeting
+TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+ELISION_MARKER = "\n… [{} tokens elided] …\n"
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many LLM tokens a piece of text will use."""
+    return len(TOKEN_PATTERN.findall(text or ""))
+
+def truncate_to_tokens(text: str, max_tokens: int, tokens: Optional[int] = None) -> str:
+    """Cut text down to roughly max_tokens, keeping its head and tail."""
+    if tokens is None:
+        tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    # Map the token budget onto characters using this text's own density
+    chars_per_token = len(text) / max(tokens, 1)
+    keep = max(0, int(max_tokens * chars_per_token))
+    head = text[:keep * 2 // 3]
+    tail = text[len(text) - keep // 3:] if keep // 3 else ""
+    return head + ELISION_MARKER.format(tokens - max_tokens) + tail
+
+def build_context(messages: List[Tuple[str, bool, int]], budget: int,
+                  max_message_tokens: int) -> List[Tuple[str, bool]]:
+    """Pick the newest messages that fit in a token budget.
+
+    messages are (message, is_bot, token_count) rows in chronological order.
+    Oversized messages are elided down to max_message_tokens, and the oldest
+    messages are dropped once the budget is spent. Returns (message, is_bot)
+    rows in chronological order.
+    """
+    selected: List[Tuple[str, bool]] = []
+    remaining = budget
+    for message, is_bot, tokens in reversed(messages):
+        if remaining <= 0:
+            break
+        if tokens > max_message_tokens:
+            if max_message_tokens <= 0:
+                # Nothing would be left but the elision marker
+                continue
+            message = truncate_to_tokens(message, max_message_tokens, tokens)
+            tokens = max_message_tokens
+        if tokens > remaining:
+            if selected:
+                break
+            # Always keep at least part of the newest message
+            message = truncate_to_tokens(message, remaining, tokens)
+            tokens = remaining
+        selected.append((message, is_bot))
+        remaining -= tokens
+    return selected[::-1]
@@ -1,64 +1,365 @@
+import atexit
+import contextlib
+import math
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import Counter, deque
 from datetime import datetime
 import logging
-from typing import List, Tuple, Optional, Dict
+from typing import Callable, List, Tuple, Optional, Dict, Deque
 
-from .config import DB_PATH
+from .config import (DB_PATH, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+                     DB_SYNCHRONOUS, DB_STATEMENT_CACHE_SIZE, DB_MIGRATION_BATCH_SIZE,
+                     DB_WRITE_BEHIND, DB_WRITE_BATCH_SIZE, DB_WRITE_FLUSH_INTERVAL, DB_WRITE_QUEUE_SIZE)
+from .context import estimate_tokens
+from .metrics import DB_QUERY_SECONDS, RETRIEVAL_TIMEOUTS, timed
+from .storage import Storage, create_storage
+from .tracing import traced
 
 logger = logging.getLogger(__name__)
 
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# SQLite VM instructions between checks of a search's time budget
+SEARCH_PROGRESS_OPS = 1000
+# Newest matching messages ranked by a related-message search
+SEARCH_CANDIDATES = 100
+_WORD = re.compile(r"\w+")
+
 class Database:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, write_behind: Optional[bool] = None):
         self.db_path = db_path
+        # One persistent connection per thread; Bolt listener threads each get their own
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # False when SQLite lacks FTS5; search_messages then finds nothing
+        self._search_enabled = False
         self.init_db()
 
+        if write_behind is None:
+            write_behind = DB_WRITE_BEHIND
+        self._writer: Optional[MessageWriter] = None
+        if write_behind:
+            self._writer = MessageWriter(self, DB_WRITE_BATCH_SIZE, DB_WRITE_FLUSH_INTERVAL,
+                                         DB_WRITE_QUEUE_SIZE)
+
     def get_connection(self) -> sqlite3.Connection:
-        """Create and return a database connection."""
-        return sqlite3.connect(self.db_path)
+        """Return the calling thread's pooled connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a new connection with WAL journaling and tuned pragmas."""
+        synchronous = DB_SYNCHRONOUS if DB_SYNCHRONOUS in SYNCHRONOUS_MODES else "NORMAL"
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # only closed from other threads, see close()
+            cached_statements=DB_STATEMENT_CACHE_SIZE
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def flush(self) -> None:
+        """Block until every queued write-behind message is committed."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        """Flush queued writes and close every pooled connection opened by this instance."""
+        if self._writer is not None:
+            self._writer.close()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error("Error closing database connection: %s", e)
+        self._local = threading.local()
+
+    # Ordered schema migrations as (version, method name, transactional).
+    # PRAGMA user_version records the last applied version. Non-transactional
+    # migrations manage their own commits and must be safe to resume.
+    MIGRATIONS = (
+        (1, "_migrate_base_schema", True),
+        (2, "_migrate_typed_message_columns", True),
+        (3, "_backfill_typed_message_columns", False),
+        (4, "_migrate_message_token_counts", True),
+        (5, "_migrate_thread_summaries", True),
+        (6, "_migrate_retention", True),
+        (7, "_migrate_processed_events", True),
+        (8, "_migrate_message_search", True),
+        (9, "_backfill_message_search", False),
+        (10, "_migrate_channel_time_index", True),
+        (11, "_migrate_message_model", True),
+    )
 
     def init_db(self) -> None:
-        """Initialize the database and create necessary tables."""
+        """Initialize the database and apply any pending schema migrations."""
         try:
-            with self.get_connection() as conn:
-                c = conn.cursor()
-                
-                # Create workspaces table first
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS workspaces
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    team_id TEXT UNIQUE,
-                    team_name TEXT,
-                    bot_token TEXT,
-                    bot_id TEXT,
-                    installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
-                ''')
-                
-                # Check if bot_id column exists
-                c.execute("PRAGMA table_info(workspaces)")
-                columns = [col[1] for col in c.fetchall()]
-                if 'bot_id' not in columns:
-                    logger.info("Adding bot_id column to workspaces table")
-                    c.execute('ALTER TABLE workspaces ADD COLUMN bot_id TEXT')
-                
-                # Create messages table with team_id foreign key
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS messages
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    team_id TEXT,
-                    channel TEXT,
-                    thread_ts TEXT,
-                    user_id TEXT,
-                    message TEXT,
-                    is_bot TEXT,
-                    timestamp TEXT,
-                    FOREIGN KEY (team_id) REFERENCES workspaces(team_id))
-                ''')
-                conn.commit()
-            logger.info("Database initialized successfully")
+            conn = self.get_connection()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+                # A new file can switch vacuum modes for free (VACUUM of an empty
+                # database); existing databases are converted with
+                # `python -m src.retention vacuum --full`
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            for target, method, transactional in self.MIGRATIONS:
+                if version >= target:
+                    continue
+                logger.info("Applying database migration %s: %s", target, method)
+                if transactional:
+                    self._apply_migration(conn, target, getattr(self, method))
+                else:
+                    getattr(self, method)(conn)
+                    with conn:
+                        conn.execute(f"PRAGMA user_version = {target}")
+                version = target
+            self._search_enabled = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+            logger.info("Database initialized successfully (schema version %s)", version)
         except Exception as e:
-            logger.error(f"Error initializing database: {e}")
+            logger.error("Error initializing database: %s", e)
             raise
 
+    def _apply_migration(self, conn: sqlite3.Connection, target: int, migration) -> None:
+        """Run one migration and bump user_version atomically."""
+        # IMMEDIATE takes the write lock up front so concurrent processes
+        # starting at the same time cannot both apply the same migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < target:
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _migrate_base_schema(self, c: sqlite3.Cursor) -> None:
+        """Create the original workspaces and messages tables."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS workspaces
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_id TEXT UNIQUE,
+            team_name TEXT,
+            bot_token TEXT,
+            bot_id TEXT,
+            installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+        ''')
+
+        # Check if bot_id column exists
+        c.execute("PRAGMA table_info(workspaces)")
+        columns = [col[1] for col in c.fetchall()]
+        if 'bot_id' not in columns:
+            logger.info("Adding bot_id column to workspaces table")
+            c.execute('ALTER TABLE workspaces ADD COLUMN bot_id TEXT')
+
+        # Create messages table with team_id foreign key
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS messages
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_id TEXT,
+            channel TEXT,
+            thread_ts TEXT,
+            user_id TEXT,
+            message TEXT,
+            is_bot TEXT,
+            timestamp TEXT,
+            FOREIGN KEY (team_id) REFERENCES workspaces(team_id))
+        ''')
+
+    def _migrate_typed_message_columns(self, c: sqlite3.Cursor) -> None:
+        """Switch is_bot/timestamp to INTEGER/REAL columns and index thread lookups."""
+        # SQLite cannot change a column's type in place, so the text columns are
+        # kept under a legacy name until the backfill has copied them over
+        c.execute('ALTER TABLE messages RENAME COLUMN is_bot TO is_bot_legacy')
+        c.execute('ALTER TABLE messages RENAME COLUMN timestamp TO timestamp_legacy')
+        c.execute('ALTER TABLE messages ADD COLUMN is_bot INTEGER NOT NULL DEFAULT 0')
+        c.execute('ALTER TABLE messages ADD COLUMN timestamp REAL')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_thread
+            ON messages (team_id, channel, thread_ts, id)
+        ''')
+
+    def _backfill_typed_message_columns(self, conn: sqlite3.Connection) -> None:
+        """Copy legacy text values into the typed columns in short transactions."""
+        last_id = 0
+        migrated = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, is_bot_legacy, timestamp_legacy FROM messages
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, DB_MIGRATION_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = [
+                (1 if is_bot == 'true' else 0, _legacy_timestamp_to_epoch(timestamp), row_id)
+                for row_id, is_bot, timestamp in rows
+                if is_bot is not None or timestamp is not None
+            ]
+            if updates:
+                # Each chunk commits on its own so the write lock is only held briefly
+                with conn:
+                    conn.executemany('''
+                        UPDATE messages
+                        SET is_bot = ?, timestamp = ?, is_bot_legacy = NULL, timestamp_legacy = NULL
+                        WHERE id = ?
+                    ''', updates)
+                migrated += len(updates)
+        logger.info("Backfilled typed columns for %s messages", migrated)
+
+    def _migrate_message_token_counts(self, c: sqlite3.Cursor) -> None:
+        """Add the cached per-message token count used by the context builder."""
+        # Existing rows stay NULL and are counted lazily on first read
+        c.execute('ALTER TABLE messages ADD COLUMN token_count INTEGER')
+
+    def _migrate_thread_summaries(self, c: sqlite3.Cursor) -> None:
+        """Create the rolling per-thread summary table."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS thread_summaries
+            (team_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            thread_ts TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (team_id, channel, thread_ts)) WITHOUT ROWID
+        ''')
+
+    def _migrate_retention(self, c: sqlite3.Cursor) -> None:
+        """Create per-workspace retention policies and index messages by age."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS retention_policies
+            (team_id TEXT PRIMARY KEY,
+            ttl_days REAL NOT NULL,
+            updated_at REAL NOT NULL) WITHOUT ROWID
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_team_time
+            ON messages (team_id, timestamp)
+        ''')
+
+    def _migrate_processed_events(self, c: sqlite3.Cursor) -> None:
+        """Create the event deduplication table, keyed by a 64-bit hash of the event key."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS processed_events
+            (event_hash INTEGER PRIMARY KEY,
+            expires_at REAL NOT NULL)
+        ''')
+
+    def _migrate_message_search(self, c: sqlite3.Cursor) -> None:
+        """Create the FTS5 index over message text and the triggers that keep it in sync."""
+        # Contentless: the index stores no copy of the text, searches join
+        # back to messages by rowid. scope ("team channel") and thread are
+        # indexed so a search is confined to one channel inside the index
+        try:
+            c.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                USING fts5(message, scope, thread, content='', tokenize='unicode61 remove_diacritics 2')
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning("SQLite lacks FTS5, related-message search is disabled: %s", e)
+            return
+        # Rows in (last_id, end_id] predate the triggers and are indexed by
+        # the next migration; deleting them must not touch the index yet
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS message_search_backfill
+            (id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL,
+            end_id INTEGER NOT NULL)
+        ''')
+        c.execute('''
+            INSERT OR IGNORE INTO message_search_backfill (id, last_id, end_id)
+            SELECT 1, 0, COALESCE(MAX(id), 0) FROM messages
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_search_insert AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO messages_fts (rowid, message, scope, thread)
+                VALUES (new.id, new.message, new.team_id || ' ' || new.channel, new.thread_ts);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_search_delete AFTER DELETE ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM message_search_backfill
+                             WHERE old.id > last_id AND old.id <= end_id)
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, message, scope, thread)
+                VALUES ('delete', old.id, old.message, old.team_id || ' ' || old.channel, old.thread_ts);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_search_update
+            AFTER UPDATE OF message, team_id, channel, thread_ts ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM message_search_backfill
+                             WHERE old.id > last_id AND old.id <= end_id)
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, message, scope, thread)
+                VALUES ('delete', old.id, old.message, old.team_id || ' ' || old.channel, old.thread_ts);
+                INSERT INTO messages_fts (rowid, message, scope, thread)
+                VALUES (new.id, new.message, new.team_id || ' ' || new.channel, new.thread_ts);
+            END
+        ''')
+
+    def _backfill_message_search(self, conn: sqlite3.Connection) -> None:
+        """Index messages written before the search triggers, in short resumable transactions."""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is None:
+            return
+        indexed = 0
+        while True:
+            # The progress row is read and advanced under the write lock, so
+            # a concurrent or resumed run never indexes a row twice
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_id, end_id = conn.execute(
+                    "SELECT last_id, end_id FROM message_search_backfill").fetchone()
+                if last_id >= end_id:
+                    conn.commit()
+                    break
+                upper = min(last_id + DB_MIGRATION_BATCH_SIZE, end_id)
+                indexed += conn.execute('''
+                    INSERT INTO messages_fts (rowid, message, scope, thread)
+                    SELECT id, message, team_id || ' ' || channel, thread_ts FROM messages
+                    WHERE id > ? AND id <= ?
+                ''', (last_id, upper)).rowcount
+                conn.execute("UPDATE message_search_backfill SET last_id = ?", (upper,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        logger.info("Indexed %s existing messages for search", indexed)
+
+    def _migrate_channel_time_index(self, c: sqlite3.Cursor) -> None:
+        """Index messages by channel and time for paging through a channel's history."""
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_channel_time
+            ON messages (team_id, channel, timestamp)
+        ''')
+
+    def _migrate_message_model(self, c: sqlite3.Cursor) -> None:
+        """Record which LLM produced each bot message; NULL for users and older rows."""
+        c.execute('ALTER TABLE messages ADD COLUMN model TEXT')
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
     def get_workspaces(self) -> List[Tuple[str, str, str, str]]:
         """Get all workspaces from the database."""
         try:
@@ -67,9 +368,11 @@ class Database:
                 c.execute('SELECT team_id, team_name, bot_token, bot_id FROM workspaces')
                 return c.fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Error getting workspaces: {e}")
+            logger.error("Error getting workspaces: %s", e)
             return []
 
+    @timed(DB_QUERY_SECONDS)
+    @traced()
     def get_workspace(self, team_id: str) -> Optional[Dict[str, str]]:
         """Get a specific workspace's details."""
         try:
@@ -90,25 +393,16 @@ class Database:
                     }
                 return None
         except sqlite3.Error as e:
-            logger.error(f"Error getting workspace {team_id}: {e}")
+            logger.error("Error getting workspace %s: %s", team_id, e)
             return None
 
+    @timed(DB_QUERY_SECONDS)
+    @traced()
     def add_workspace(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> bool:
         """Add or update a workspace in the database."""
         try:
             with self.get_connection() as conn:
                 c = conn.cursor()
-                # Update schema if needed
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS workspaces
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    team_id TEXT UNIQUE,
-                    team_name TEXT,
-                    bot_token TEXT,
-                    bot_id TEXT,
-                    installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
-                ''')
-                
                 # Insert or update workspace
                 c.execute('''
                     INSERT OR REPLACE INTO workspaces 
@@ -116,45 +410,483 @@ class Database:
                     VALUES (?, ?, ?, ?)
                 ''', (team_id, team_name, bot_token, bot_id))
                 conn.commit()
-            logger.info(f"Workspace added/updated: {team_id}")
+            logger.info("Workspace added/updated: %s", team_id)
             return True
         except sqlite3.Error as e:
-            logger.error(f"Error adding workspace: {e}")
+            logger.error("Error adding workspace: %s", e)
             return False
 
+    @timed(DB_QUERY_SECONDS)
+    @traced()
     def store_message(self, team_id: str, channel_id: str, thread_ts: str, user_id: str, 
-                     message: str, is_bot: bool) -> None:
-        """Store a message in the database."""
+                     message: str, is_bot: bool, model: Optional[str] = None) -> None:
+        """Store a message in the database, or queue it in write-behind mode."""
+        row = (team_id, channel_id, thread_ts, user_id, message, int(is_bot), time.time(),
+               estimate_tokens(message), model)
+        if self._writer is not None:
+            self._writer.enqueue(row)
+            return
         try:
             with self.get_connection() as conn:
-                c = conn.cursor()
-                is_bot_str = 'true' if is_bot else 'false'
-                c.execute('''
-                INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp)
-                VALUES(?, ?, ?, ?, ?, ?, ?)
-                ''', (team_id, channel_id, thread_ts, user_id, message, is_bot_str, 
-                     datetime.now().isoformat()))
-                conn.commit()
-            logger.info(f"Stored message: channel={channel_id}, thread={thread_ts}, "
-                       f"user={user_id}, is_bot={is_bot_str}")
+                conn.execute(INSERT_MESSAGE_SQL, row)
+            logger.info("Stored message: channel=%s, thread=%s, user=%s, is_bot=%s",
+                        channel_id, thread_ts, user_id, is_bot)
         except Exception as e:
-            logger.error(f"Error storing message: {e}")
+            logger.error("Error storing message: %s", e)
             raise
 
+    def _read_overlay(self):
+        """Lock that keeps thread reads consistent with write-behind flushes."""
+        return self._writer.lock if self._writer is not None else contextlib.nullcontext()
+
+    def _pending_rows(self, team_id: str, channel_id: str, thread_ts: str) -> List[tuple]:
+        """Queued, not yet committed rows for a thread; call with _read_overlay held."""
+        if self._writer is None:
+            return []
+        return self._writer.pending_rows((team_id, channel_id, thread_ts))
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
     def get_thread_history(self, team_id: str, channel_id: str, thread_ts: str, 
-                          limit: int = 5) -> List[Tuple[str, str]]:
+                          limit: int = 5) -> List[Tuple[str, bool]]:
         """Retrieve message history for a thread."""
+        try:
+            with self._read_overlay():
+                with self.get_connection() as conn:
+                    c = conn.cursor()
+                    # Served by idx_messages_thread: a bounded backwards range scan
+                    c.execute('''
+                        SELECT message, is_bot FROM messages 
+                        WHERE team_id=? AND channel=? AND thread_ts=?
+                        ORDER BY id DESC LIMIT ?
+                    ''', (team_id, channel_id, thread_ts, limit))
+                    rows = c.fetchall()
+                pending = self._pending_rows(team_id, channel_id, thread_ts)
+            # Queued rows are always newer than committed ones
+            messages = [(message, bool(is_bot)) for message, is_bot in reversed(rows)]
+            messages += [(row[4], bool(row[5])) for row in pending]
+            messages = messages[-limit:] if limit > 0 else []
+            logger.info("Retrieved %s messages for thread %s", len(messages), thread_ts)
+            return messages
+        except Exception as e:
+            logger.error("Error retrieving thread history: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_context_messages(self, team_id: str, channel_id: str, thread_ts: str,
+                             limit: int, after_id: int = 0) -> List[Tuple[str, bool, int]]:
+        """Retrieve recent thread messages newer than after_id with their cached token counts."""
+        try:
+            with self._read_overlay():
+                with self.get_connection() as conn:
+                    rows = conn.execute('''
+                        SELECT id, message, is_bot, token_count FROM messages
+                        WHERE team_id=? AND channel=? AND thread_ts=? AND id > ?
+                        ORDER BY id DESC LIMIT ?
+                    ''', (team_id, channel_id, thread_ts, after_id, limit)).fetchall()
+
+                    # Rows written before token counts existed are counted once and saved
+                    missing = [(estimate_tokens(message), row_id)
+                               for row_id, message, _, token_count in rows if token_count is None]
+                    if missing:
+                        conn.executemany('UPDATE messages SET token_count = ? WHERE id = ?', missing)
+                        counted = {row_id: tokens for tokens, row_id in missing}
+                        rows = [(row_id, message, is_bot, counted.get(row_id, token_count))
+                                for row_id, message, is_bot, token_count in rows]
+                pending = self._pending_rows(team_id, channel_id, thread_ts)
+            messages = [(message, bool(is_bot), token_count)
+                        for _, message, is_bot, token_count in reversed(rows)]
+            messages += [(row[4], bool(row[5]), row[7]) for row in pending]
+            return messages[-limit:] if limit > 0 else []
+        except Exception as e:
+            logger.error("Error retrieving context messages: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_messages_after(self, team_id: str, channel_id: str, thread_ts: str, after_id: int,
+                           limit: int) -> List[Tuple[int, str, bool]]:
+        """Retrieve committed thread messages with id > after_id, oldest first."""
         try:
             with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute('''
-                    SELECT message, is_bot FROM messages 
-                    WHERE team_id=? AND channel=? AND thread_ts=?
-                    ORDER BY timestamp DESC LIMIT ?
-                ''', (team_id, channel_id, thread_ts, limit))
-                messages = c.fetchall()
-            logger.info(f"Retrieved {len(messages)} messages for thread {thread_ts}")
-            return messages[::-1]  # Reverse to get chronological order
+                rows = conn.execute('''
+                    SELECT id, message, is_bot FROM messages
+                    WHERE team_id=? AND channel=? AND thread_ts=? AND id > ?
+                    ORDER BY id LIMIT ?
+                ''', (team_id, channel_id, thread_ts, after_id, limit)).fetchall()
+            return [(row_id, message, bool(is_bot)) for row_id, message, is_bot in rows]
         except Exception as e:
-            logger.error(f"Error retrieving thread history: {e}")
+            logger.error("Error retrieving messages after %s: %s", after_id, e)
             return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_channel_messages(self, team_id: str, channel_id: str, since: float, limit: int,
+                             after: Optional[Tuple[float, int]] = None
+                             ) -> List[Tuple[int, str, str, bool, float]]:
+        """One page of the channel's messages since a timestamp, oldest first.
+
+        Rows are (id, user_id, message, is_bot, timestamp); pass the last
+        row's (timestamp, id) as `after` to get the next page.
+        """
+        cursor = after or (since, 0)
+        try:
+            with self.get_connection() as conn:
+                # A range scan of idx_messages_channel_time, whose entries end with the rowid
+                rows = conn.execute('''
+                    SELECT id, user_id, message, is_bot, timestamp FROM messages
+                    WHERE team_id = ? AND channel = ? AND (timestamp, id) > (?, ?)
+                    ORDER BY timestamp, id LIMIT ?
+                ''', (team_id, channel_id, cursor[0], cursor[1], limit)).fetchall()
+            return [(row_id, user_id, message, bool(is_bot), timestamp)
+                    for row_id, user_id, message, is_bot, timestamp in rows]
+        except Exception as e:
+            logger.error("Error retrieving channel messages: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def search_messages(self, team_id: str, channel_id: str, terms: List[str],
+                        exclude_thread_ts: str, limit: int,
+                        time_budget: float) -> List[Tuple[str, bool, str]]:
+        """Messages from the channel's other threads that best match the terms, best first.
+
+        bm25 ranking would read every match of every term, so the index is
+        only asked for the newest SEARCH_CANDIDATES matches, which costs
+        about the same on any table size. Candidates are ranked by the terms
+        they contain, terms that are rare among them weighing more, then by
+        recency. The search is interrupted after time_budget seconds and
+        then returns nothing.
+        """
+        if not self._search_enabled or not terms or limit <= 0:
+            return []
+        query = (f"scope : {_fts_phrase(f'{team_id} {channel_id}')} "
+                 f"NOT thread : {_fts_phrase(exclude_thread_ts)} "
+                 f"AND ({' OR '.join(_fts_phrase(term) for term in terms)})")
+        conn = self.get_connection()
+        deadline = time.perf_counter() + time_budget
+        conn.set_progress_handler(lambda: time.perf_counter() > deadline, SEARCH_PROGRESS_OPS)
+        try:
+            rows = conn.execute('''
+                SELECT m.id, m.message, m.is_bot, m.thread_ts
+                FROM (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?
+                      ORDER BY rowid DESC LIMIT ?) AS hit
+                JOIN messages m ON m.id = hit.rowid
+            ''', (query, SEARCH_CANDIDATES)).fetchall()
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                RETRIEVAL_TIMEOUTS.labels().inc()
+                logger.warning("Message search for team %s exceeded its %.0f ms budget",
+                               team_id, time_budget * 1000)
+            else:
+                logger.error("Error searching messages: %s", e)
+            return []
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        wanted = set(terms)
+        matched = {row[0]: wanted.intersection(_WORD.findall((row[1] or "").lower())) for row in rows}
+        counts = Counter(term for found in matched.values() for term in found)
+        weights = {term: math.log(1 + len(rows) / count) for term, count in counts.items()}
+        best = sorted(rows, key=lambda row: (sum(weights[term] for term in matched[row[0]]), row[0]),
+                      reverse=True)[:limit]
+        return [(message, bool(is_bot), thread_ts) for _, message, is_bot, thread_ts in best]
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_thread_summary(self, team_id: str, channel_id: str,
+                           thread_ts: str) -> Optional[Tuple[str, int]]:
+        """Return a thread's rolling summary and the last message id it covers."""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute('''
+                    SELECT summary, last_message_id FROM thread_summaries
+                    WHERE team_id=? AND channel=? AND thread_ts=?
+                ''', (team_id, channel_id, thread_ts)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error getting summary for thread %s: %s", thread_ts, e)
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def save_thread_summary(self, team_id: str, channel_id: str, thread_ts: str,
+                            summary: str, last_message_id: int) -> None:
+        """Insert or replace a thread's rolling summary."""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO thread_summaries
+                (team_id, channel, thread_ts, summary, last_message_id, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (team_id, channel_id, thread_ts, summary, last_message_id, time.time()))
+
+    def get_retention_policies(self) -> Dict[str, float]:
+        """Return every workspace's retention TTL in days."""
+        rows = self.get_connection().execute(
+            'SELECT team_id, ttl_days FROM retention_policies').fetchall()
+        return dict(rows)
+
+    def set_retention_policy(self, team_id: str, ttl_days: float) -> None:
+        """Keep a workspace's threads for ttl_days after their last message; 0 keeps them forever."""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO retention_policies (team_id, ttl_days, updated_at)
+                VALUES (?, ?, ?)
+            ''', (team_id, ttl_days, time.time()))
+
+    def delete_retention_policy(self, team_id: str) -> None:
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM retention_policies WHERE team_id = ?', (team_id,))
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def claim_event(self, event_hash: int, expires_at: float) -> bool:
+        """Record an event as processed; False if a live claim for it already exists."""
+        with self.get_connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO processed_events (event_hash, expires_at) VALUES (?, ?)
+                ON CONFLICT (event_hash) DO UPDATE SET expires_at = excluded.expires_at
+                WHERE processed_events.expires_at <= ?
+            ''', (event_hash, expires_at, time.time()))
+            return cursor.rowcount == 1
+
+    def purge_processed_events(self, now: float) -> int:
+        """Delete expired event claims; returns how many were removed."""
+        with self.get_connection() as conn:
+            return conn.execute('DELETE FROM processed_events WHERE expires_at <= ?', (now,)).rowcount
+
+    def archive_expired_threads(self, team_id: str, cutoff: float, limit: int,
+                                sink: Callable[[List[dict]], None]) -> Tuple[int, int]:
+        """Move up to `limit` threads with no messages since cutoff out of the database.
+
+        The expired threads' rows are handed to sink (which writes the
+        archive) and deleted in the same write transaction, so a reply that
+        arrives meanwhile either keeps its thread alive or is archived with
+        it. If sink raises, nothing is deleted. Returns (threads, messages).
+        """
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Threads with a NULL (unparsable legacy) timestamp are never expired
+            threads = conn.execute('''
+                SELECT DISTINCT channel, thread_ts FROM messages AS m
+                WHERE team_id = ? AND timestamp < ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM messages AS n
+                    WHERE n.team_id = m.team_id AND n.channel = m.channel
+                    AND n.thread_ts = m.thread_ts
+                    AND (n.timestamp >= ? OR n.timestamp IS NULL)
+                )
+                LIMIT ?
+            ''', (team_id, cutoff, cutoff, limit)).fetchall()
+            rows: List[dict] = []
+            for channel, thread_ts in threads:
+                cursor = conn.execute('''
+                    SELECT id, team_id, channel, thread_ts, user_id, message, is_bot,
+                           timestamp, token_count, model
+                    FROM messages
+                    WHERE team_id = ? AND channel = ? AND thread_ts = ?
+                    ORDER BY id
+                ''', (team_id, channel, thread_ts))
+                columns = [column[0] for column in cursor.description]
+                rows.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+            if rows:
+                sink(rows)
+            for channel, thread_ts in threads:
+                params = (team_id, channel, thread_ts)
+                conn.execute('DELETE FROM messages WHERE team_id = ? AND channel = ? AND thread_ts = ?',
+                             params)
+                conn.execute('''
+                    DELETE FROM thread_summaries WHERE team_id = ? AND channel = ? AND thread_ts = ?
+                ''', params)
+            conn.commit()
+            return len(threads), len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+
+    def reclaim_space(self, pages: int = 0) -> int:
+        """Incrementally vacuum if the file supports it; returns bytes freed."""
+        if self.storage_stats()["auto_vacuum"] != "incremental":
+            logger.warning("Database is not in incremental auto-vacuum mode; run "
+                           "'python -m src.retention vacuum --full' once to convert it")
+            return 0
+        return self.incremental_vacuum(pages)
+
+    def incremental_vacuum(self, pages: int = 0) -> int:
+        """Return up to `pages` free pages (0 for all) to the filesystem; returns bytes freed."""
+        conn = self.get_connection()
+        before = self.storage_stats()
+        # The pragma frees one page per step, and Cursor.execute() only steps
+        # a statement without result columns once; executescript() runs it
+        # to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({max(0, int(pages))});")
+        after = self.storage_stats()
+        return max(0, before["page_count"] - after["page_count"]) * before["page_size"]
+
+    def full_vacuum(self) -> int:
+        """Rebuild the whole file, switching it to incremental auto-vacuum; returns bytes freed."""
+        conn = self.get_connection()
+        before = self.storage_stats()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        after = self.storage_stats()
+        return max(0, before["page_count"] - after["page_count"]) * before["page_size"]
+
+    def ping(self) -> None:
+        """Raise if the database cannot be queried."""
+        self.get_connection().execute('SELECT 1').fetchone()
+
+    def storage_stats(self) -> dict:
+        """Page counts and auto-vacuum mode of the database file."""
+        conn = self.get_connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "size_bytes": page_size * page_count,
+            "free_bytes": page_size * freelist_count,
+            "auto_vacuum": ("none", "full", "incremental")[auto_vacuum]
+        }
+
+
+INSERT_MESSAGE_SQL = '''
+    INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp,
+                          token_count, model)
+    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+class MessageWriter:
+    """Write-behind queue that inserts messages in batched transactions.
+
+    store_message returns as soon as its row is queued. A background thread
+    commits queued rows with executemany once DB_WRITE_BATCH_SIZE rows are
+    waiting or DB_WRITE_FLUSH_INTERVAL seconds after the first one arrived.
+    Until then the rows stay visible to thread reads through `pending`.
+
+    Crash safety: a row is durable only once its batch commits, so a hard
+    crash loses at most the rows still queued (bounded by the flush
+    interval and DB_WRITE_QUEUE_SIZE). close(), flush() and interpreter
+    exit drain the queue first. A batch that fails to commit is logged and
+    dropped rather than retried forever.
+    """
+
+    def __init__(self, db: "Database", batch_size: int, flush_interval: float, max_queue: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Held while a batch commits and while readers merge `pending`, so a
+        # row is never seen both committed and pending, or neither
+        self.lock = threading.Lock()
+        self.pending: Dict[Tuple[str, str, str], Deque[tuple]] = {}
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        # Orders enqueues against each other and against close(), so rows are
+        # queued in `pending` order and never behind the stop marker
+        self._enqueue_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, row: tuple) -> None:
+        """Queue a message row; blocks when the queue is full."""
+        with self._enqueue_lock:
+            with self.lock:
+                self.pending.setdefault(row[:3], deque()).append(row)
+            if not self._closed:
+                self._queue.put(row)
+                return
+        # Late writes during shutdown go straight to the database
+        self._write([row])
+
+    def pending_rows(self, key: Tuple[str, str, str]) -> List[tuple]:
+        return list(self.pending.get(key, ()))
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        """Commit everything queued and stop the writer thread."""
+        with self._enqueue_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is _STOP:
+                self._queue.task_done()
+                return
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch: List[tuple]) -> None:
+        conn = self.db.get_connection()
+        with self.lock:
+            try:
+                with conn:
+                    conn.executemany(INSERT_MESSAGE_SQL, batch)
+                self.rows_written += len(batch)
+            except sqlite3.Error as e:
+                logger.error("Dropping %s queued messages after failed write: %s", len(batch), e)
+                self.rows_dropped += len(batch)
+            for row in batch:
+                rows = self.pending[row[:3]]
+                # The row just written, found by identity; usually the first
+                for index, pending in enumerate(rows):
+                    if pending is row:
+                        del rows[index]
+                        break
+                if not rows:
+                    del self.pending[row[:3]]
+
+_database: Optional[Storage] = None
+_database_lock = threading.Lock()
+
+def get_database() -> Storage:
+    """Return the process-wide shared storage backend, creating it on first use."""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = create_storage()
+    return _database
+
+def _fts_phrase(text: str) -> str:
+    """Quote text as an FTS5 phrase so user input cannot inject query syntax."""
+    return '"' + text.replace('"', '""') + '"'
+
+def _legacy_timestamp_to_epoch(value: Optional[str]) -> Optional[float]:
+    """Convert a legacy ISO-8601 timestamp string to epoch seconds."""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
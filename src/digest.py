@@ -0,0 +1,258 @@
+import contextvars
+import logging
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from slack_sdk.errors import SlackApiError
+
+from .config import (DIGEST_SOURCE, DIGEST_DEFAULT_HOURS, DIGEST_MAX_HOURS, DIGEST_PAGE_SIZE,
+                     DIGEST_CHUNK_TOKENS, DIGEST_SUMMARY_TOKENS, DIGEST_CONCURRENCY,
+                     DIGEST_MAX_CHUNKS, CONTEXT_MESSAGE_MAX_TOKENS)
+from .context import estimate_tokens, truncate_to_tokens
+from .llm import LLM
+from .metrics import DIGEST_SECONDS, RETRIES, SLACK_POST_SECONDS
+from .storage import Storage
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# A whole mention that asks for a channel digest: "@bot digest", "@bot digest 6h",
+# "@bot summarize this channel", "@bot summarize the last 2 days". Other
+# "summarize ..." mentions are ordinary prompts
+_WINDOW = r"(?:(?:for\s+)?the\s+)?(?:last\s+)?\d+(?:\.\d+)?\s*(?:h|hours?|d|days?)"
+DIGEST_COMMAND = re.compile(
+    r"^\s*(?:<@\w+>\s*)*("
+    rf"digest(?:\s+{_WINDOW})?"
+    rf"|summari[sz]e\s+this\s+channel(?:\s+{_WINDOW})?"
+    r"|summari[sz]e\s+the\s+last\s+\d+(?:\.\d+)?\s*(?:h|hours?|d|days?)(?:\s+(?:in|of)\s+this\s+channel)?"
+    r")\s*[.!?]*\s*$",
+    re.IGNORECASE)
+DIGEST_WINDOW = re.compile(r"(\d+(?:\.\d+)?)\s*(h|hours?|d|days?)\b", re.IGNORECASE)
+
+# Channel events that are not conversation
+SKIPPED_SUBTYPES = frozenset(("channel_join", "channel_leave", "channel_topic", "channel_purpose",
+                              "channel_name", "bot_add", "bot_remove"))
+
+MAP_PROMPT = """
+Summarize this excerpt of a Slack channel's history in at most {max_tokens}
+tokens of plain prose: the topics discussed, decisions made, open questions
+and who was involved. Reply with the summary only.
+
+Messages:
+{messages}
+"""
+
+REDUCE_PROMPT = """
+Merge these summaries of consecutive parts of a Slack channel's last {hours}
+hours, oldest first, into one digest of at most {max_tokens} tokens. Group
+it by topic with bullet points (•), then list decisions and open questions.
+Use Slack markdown and reply with the digest only.
+
+Summaries:
+{summaries}
+"""
+
+# (author, text, timestamp) of one channel message
+Message = Tuple[str, str, float]
+
+class Chunk:
+    """Consecutive messages that fit in one summarization prompt."""
+    __slots__ = ("first_ts", "count", "text")
+
+    def __init__(self, first_ts: float, count: int, text: str):
+        self.first_ts = first_ts
+        self.count = count
+        self.text = text
+
+def parse_digest_request(text: str) -> Optional[float]:
+    """Hours of history to digest if the mention is a digest command, else None."""
+    match = DIGEST_COMMAND.match(text or "")
+    if match is None:
+        return None
+    window = DIGEST_WINDOW.search(match.group(1))
+    if window is None:
+        return DIGEST_DEFAULT_HOURS
+    amount, unit = window.groups()
+    hours = float(amount) * (24 if unit.lower().startswith("d") else 1)
+    return min(max(hours, 0.1), DIGEST_MAX_HOURS)
+
+def slack_history_pages(client, channel_id: str, oldest: float,
+                        page_size: int = DIGEST_PAGE_SIZE) -> Iterator[List[Message]]:
+    """Page through conversations.history by cursor, newest messages first."""
+    cursor = None
+    while True:
+        try:
+            with SLACK_POST_SECONDS.labels("conversations_history").time(), \
+                    span("slack.conversations_history"):
+                response = client.conversations_history(channel=channel_id, oldest=f"{oldest:.6f}",
+                                                        limit=page_size, cursor=cursor)
+        except SlackApiError as e:
+            if e.response.status_code != 429:
+                raise
+            RETRIES.labels("conversations_history").inc()
+            retry_after = float(e.response.headers.get("Retry-After") or 1)
+            logger.warning("conversations.history rate limited in %s, retrying in %ss",
+                           channel_id, retry_after)
+            time.sleep(retry_after)
+            continue
+        yield [(message.get("user") or message.get("bot_id") or "unknown", message["text"],
+                float(message["ts"]))
+               for message in response.get("messages", [])
+               if message.get("text") and message.get("subtype") not in SKIPPED_SUBTYPES]
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            return
+
+def stored_history_pages(db: Storage, team_id: str, channel_id: str, oldest: float,
+                         page_size: int = DIGEST_PAGE_SIZE) -> Iterator[List[Message]]:
+    """Page through the channel's stored messages by (timestamp, id) cursor, oldest first."""
+    after = None
+    while True:
+        rows = db.get_channel_messages(team_id, channel_id, oldest, page_size, after)
+        if rows:
+            yield [("Bot" if is_bot else user_id, message, timestamp)
+                   for _, user_id, message, is_bot, timestamp in rows]
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][4], rows[-1][0])
+
+def chunk_messages(pages: Iterable[List[Message]], max_tokens: int,
+                   message_max_tokens: int = CONTEXT_MESSAGE_MAX_TOKENS) -> Iterator[Chunk]:
+    """Cut a stream of pages into chunks of about max_tokens, each in time order."""
+    messages: List[Message] = []
+    tokens = 0
+    for page in pages:
+        for author, text, timestamp in page:
+            text = truncate_to_tokens(text, message_max_tokens)
+            cost = estimate_tokens(author) + estimate_tokens(text) + 2
+            if messages and tokens + cost > max_tokens:
+                yield _chunk(messages)
+                messages, tokens = [], 0
+            messages.append((author, text, timestamp))
+            tokens += cost
+    if messages:
+        yield _chunk(messages)
+
+def _chunk(messages: List[Message]) -> Chunk:
+    messages.sort(key=lambda message: message[2])
+    text = "\n".join(f"{author}: {text}" for author, text, _ in messages)
+    return Chunk(messages[0][2], len(messages), text)
+
+class ChannelDigester:
+    """Summarizes the last N hours of a channel with a map-reduce over LLM calls.
+
+    History is streamed a page at a time, from Slack's conversations.history
+    or the local messages table, and cut into chunks of `chunk_tokens`.
+    Each chunk is summarized on a shared pool of `concurrency` workers, and
+    a digest keeps at most `concurrency` chunks in flight, so memory stays
+    bounded however busy the channel is. The chunk summaries are then
+    merged, in several rounds if they do not fit in one prompt. At most
+    `max_chunks` chunks are read per digest.
+    """
+
+    def __init__(self, model: LLM, db: Storage, source: str = DIGEST_SOURCE,
+                 concurrency: int = DIGEST_CONCURRENCY, chunk_tokens: int = DIGEST_CHUNK_TOKENS,
+                 summary_tokens: int = DIGEST_SUMMARY_TOKENS, page_size: int = DIGEST_PAGE_SIZE,
+                 max_chunks: int = DIGEST_MAX_CHUNKS):
+        self.model = model
+        self.db = db
+        self.source = source
+        self.concurrency = max(concurrency, 1)
+        self.chunk_tokens = chunk_tokens
+        self.summary_tokens = summary_tokens
+        self.page_size = page_size
+        self.max_chunks = max_chunks
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="digest")
+
+    def digest(self, team_id: str, channel_id: str, hours: float, client=None) -> str:
+        """Return a digest of the channel's messages from the last `hours` hours.
+
+        With the slack source, a workspace that has not granted the
+        history scope gets a digest of the stored messages instead.
+        """
+        if self.source != "slack":
+            return self._digest(team_id, channel_id, hours, "local", client)
+        try:
+            return self._digest(team_id, channel_id, hours, "slack", client)
+        except SlackApiError as e:
+            if e.response.get("error") != "missing_scope":
+                raise
+            logger.warning("Team %s has not granted the history scope; digesting stored messages",
+                           team_id)
+            return self._digest(team_id, channel_id, hours, "local", client)
+
+    def _digest(self, team_id: str, channel_id: str, hours: float, source: str, client) -> str:
+        oldest = time.time() - hours * 3600
+        if source == "slack":
+            pages = slack_history_pages(client, channel_id, oldest, self.page_size)
+        else:
+            pages = stored_history_pages(self.db, team_id, channel_id, oldest, self.page_size)
+        with DIGEST_SECONDS.labels(source).time(), span("digest"):
+            summaries, count, complete = self._map(team_id, chunk_messages(pages, self.chunk_tokens))
+            if not summaries:
+                return f"No messages in this channel in the last {hours:g} hours."
+            digest = self._reduce(team_id, summaries, hours)
+        logger.info("Digested %s messages in %s chunks for channel %s", count, len(summaries), channel_id)
+        if not complete:
+            digest += f"\n\n_The channel had too many messages to read them all; this covers {count}._"
+        return digest
+
+    def _submit(self, fn, *args) -> Future:
+        # Each task gets its own copy, so its spans land in the mention's trace
+        return self._executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def _map(self, team_id: str, chunks: Iterator[Chunk]) -> Tuple[List[str], int, bool]:
+        """Summarize chunks concurrently; returns the summaries in time order,
+        the number of messages and whether every chunk was read."""
+        pending: Dict[Future, float] = {}
+        results: List[Tuple[float, str]] = []
+        count = 0
+        complete = True
+        for index, chunk in enumerate(chunks):
+            if index == self.max_chunks:
+                complete = False
+                break
+            if len(pending) >= self.concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend((pending.pop(future), future.result()) for future in done)
+            prompt = MAP_PROMPT.format(max_tokens=self.summary_tokens, messages=chunk.text)
+            pending[self._submit(self._generate, team_id, prompt)] = chunk.first_ts
+            count += chunk.count
+        results.extend((first_ts, future.result()) for future, first_ts in pending.items())
+        results.sort(key=lambda result: result[0])
+        return [summary for _, summary in results], count, complete
+
+    def _reduce(self, team_id: str, summaries: List[str], hours: float) -> str:
+        """Merge summaries into one digest, first in groups while they overflow a prompt."""
+        while True:
+            groups = list(_group(summaries, self.chunk_tokens))
+            prompts = [REDUCE_PROMPT.format(hours=f"{hours:g}", max_tokens=self.summary_tokens,
+                                            summaries="\n\n".join(group)) for group in groups]
+            if len(prompts) == 1:
+                return self._generate(team_id, prompts[0])
+            futures = [self._submit(self._generate, team_id, prompt) for prompt in prompts]
+            summaries = [future.result() for future in futures]
+
+    def _generate(self, team_id: str, prompt: str) -> str:
+        with span("digest.summarize"):
+            return truncate_to_tokens(self.model.generate(prompt, team_id=team_id).strip(),
+                                      self.summary_tokens * 2)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+def _group(summaries: List[str], max_tokens: int) -> Iterator[List[str]]:
+    """Consecutive summaries in groups of about max_tokens, at least two per group."""
+    group: List[str] = []
+    tokens = 0
+    for summary in summaries:
+        cost = estimate_tokens(summary)
+        if len(group) >= 2 and tokens + cost > max_tokens:
+            yield group
+            group, tokens = [], 0
+        group.append(summary)
+        tokens += cost
+    if group:
+        yield group
@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class MentionDispatcher:
+    """Bounded worker pool that runs tasks with the same key in submission order.
+
+    Tasks for different keys (threads) run in parallel on up to `workers`
+    threads; tasks for one key run one at a time. Once `max_pending` tasks
+    are queued or running, submit() refuses new work so callers can shed load.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        # Keys that have runnable work and no worker currently serving them
+        self._ready: "queue.Queue" = queue.Queue()
+        # Per-key FIFO; the head task is the one being run or about to be run
+        self._pending: Dict[Hashable, Deque[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._size = 0
+        self._closed = False
+        self.rejected = 0
+        self._threads: List[threading.Thread] = []
+        for n in range(workers):
+            thread = threading.Thread(target=self._run, name=f"mention-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: Hashable, task: Callable[[], None]) -> bool:
+        """Queue a task behind any earlier tasks for the same key.
+
+        Returns False without queueing when the dispatcher is at capacity
+        or shutting down.
+        """
+        with self._lock:
+            if self._closed or self._size >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._size += 1
+            tasks = self._pending.get(key)
+            if tasks is None:
+                self._pending[key] = deque([task])
+                self._ready.put(key)
+            else:
+                # A worker already owns this key and will pick the task up in order
+                tasks.append(task)
+        return True
+
+    def depth(self) -> int:
+        """Number of tasks queued or running."""
+        return self._size
+
+    def _run(self) -> None:
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+            with self._lock:
+                task = self._pending[key][0]
+            try:
+                task()
+            except Exception as e:
+                logger.error("Unhandled error in dispatched task for %s: %s", key, e, exc_info=True)
+            with self._lock:
+                tasks = self._pending[key]
+                tasks.popleft()
+                self._size -= 1
+                if tasks:
+                    # Requeue at the back so one busy thread cannot starve the others
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+                if self._size == 0:
+                    self._drained.notify_all()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Refuse new tasks, wait up to timeout for queued ones to finish, then stop the workers."""
+        with self._drained:
+            self._closed = True
+            self._drained.wait_for(lambda: self._size == 0, timeout=timeout)
+        for _ in self._threads:
+            self._ready.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
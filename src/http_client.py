@@ -0,0 +1,48 @@
+import logging
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_CONNECT_RETRIES
+from .metrics import SLACK_POST_SECONDS
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+SLACK_API_URL = "https://slack.com/api/"
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _new_session() -> requests.Session:
+    """Create a session whose connection pool keeps connections alive between calls."""
+    session = requests.Session()
+    # Only connection failures are retried: Web API calls such as
+    # oauth.v2.access are not idempotent once the request has been sent
+    retry = Retry(total=HTTP_CONNECT_RETRIES, connect=HTTP_CONNECT_RETRIES, read=0, status=0,
+                  backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_http_session() -> requests.Session:
+    """Return the process-wide pooled requests session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _new_session()
+    return _session
+
+def slack_api_call(method: str, data: dict) -> dict:
+    """POST a form-encoded Slack Web API call and return its JSON body."""
+    with SLACK_POST_SECONDS.labels(method).time(), span(f"slack.{method}"):
+        response = get_http_session().post(SLACK_API_URL + method, data=data,
+                                           timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    if response.status_code == 429:
+        logger.warning("Slack rate limited %s, Retry-After=%s", method, response.headers.get('Retry-After'))
+    return response.json()
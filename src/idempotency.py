@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Optional
+
+from .cache import TTLCache, MISSING
+from .config import EVENT_DEDUP_CACHE_SIZE, EVENT_DEDUP_TTL
+from .db import get_database
+from .metrics import EVENTS_DEDUPLICATED
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+def event_key(event: dict, body: Optional[dict] = None) -> str:
+    """Slack's event_id when the envelope is available, else team:channel:ts."""
+    event_id = (body or {}).get("event_id")
+    if event_id:
+        return event_id
+    team_id = event.get("team_id") or event.get("team")
+    return f"{team_id}:{event.get('channel')}:{event.get('ts')}"
+
+def event_hash(key: str) -> int:
+    """64-bit signed hash of an event key, stored instead of the key itself."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+class EventDeduplicator:
+    """Drops redelivered events before any message, LLM or Slack work is done.
+
+    Recently seen keys live in a bounded in-process LRU; a miss there claims
+    the key in the storage backend's processed_events table, which catches
+    redeliveries that reach another shard or arrive after a restart. Claims
+    expire after `ttl` seconds and are purged at most once per `ttl`. If the
+    table cannot be reached the event is processed: a rare duplicate reply
+    is better than a dropped mention.
+    """
+
+    def __init__(self, db: Optional[Storage] = None, maxsize: int = EVENT_DEDUP_CACHE_SIZE,
+                 ttl: float = EVENT_DEDUP_TTL):
+        self._db = db
+        self.ttl = ttl
+        self._seen = TTLCache(maxsize, ttl)
+        self._next_purge = time.time() + ttl
+        self._purge_lock = threading.Lock()
+
+    @property
+    def db(self) -> Storage:
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    def is_duplicate(self, event: dict, body: Optional[dict] = None) -> bool:
+        """Claim the event; True if it was already claimed and should be dropped."""
+        key = event_key(event, body)
+        team_label = event.get("team_id") or event.get("team") or "unknown"
+        if self._seen.get(key) is not MISSING:
+            EVENTS_DEDUPLICATED.labels(team_label, "memory").inc()
+            logger.info("Dropping redelivered event %s", key)
+            return True
+        self._seen.set(key, True)
+
+        now = time.time()
+        try:
+            claimed = self.db.claim_event(event_hash(key), now + self.ttl)
+        except Exception as e:
+            logger.error("Error claiming event %s, processing it anyway: %s", key, e)
+            return False
+        if not claimed:
+            EVENTS_DEDUPLICATED.labels(team_label, "storage").inc()
+            logger.info("Dropping event %s already claimed by another process", key)
+        self._maybe_purge(now)
+        return not claimed
+
+    def _maybe_purge(self, now: float) -> None:
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = now + self.ttl
+            purged = self.db.purge_processed_events(now)
+            logger.info("Purged %s expired event claims", purged)
+        except Exception as e:
+            logger.error("Error purging event claims: %s", e)
+        finally:
+            self._purge_lock.release()
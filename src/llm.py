@@ -1,41 +1,19 @@
-import google.generativeai as genai
+import logging
+import time
+from typing import Any, Callable, Hashable, Iterator, List, Optional, Sequence, Tuple, Union
 
+from .config import SESSION_CACHE_SIZE, SESSION_IDLE_TTL, CONTEXT_TOKEN_BUDGET, LLM_MODELS
+from .context import estimate_tokens, truncate_to_tokens
+from .metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+from .response_cache import ResponseCache, add_turn, context_digest, response_key
+from .router import ModelRouter
+from .scheduler import LLMScheduler, RateLimitError
+from .sessions import ChatSession, ChatSessionManager
+from .tracing import span
 
+logger = logging.getLogger(__name__)
 
-class LLM:
-    def __init__(self, API_KEY, model_name):
-        self.api_key = API_KEY  #change for other models
-        self.model_name = model_name
-        self.chat = None
-
-        if 'gemini' in model_name.lower():
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(model_name)
-        else:
-            raise NotImplementedError(f"Model {model_name} is not supported yet")
-    
-
-    def change_model(self, new_model):
-        if 'gemini' in new_model.lower():
-            available_models = [model.name for model in genai.list_models()]
-            if new_model not in available_models:
-                raise ValueError(f"Model {new_model} is not available. Available Models: {available_models}")
-            self.model_name = new_model
-            self.model = genai.GenerativeModle(new_model)
-            self.chat = None
-        else:
-            raise NotImplementedError(f"Model {new_model} not added yet.")
-    
-    def chat_with_history(self, history=[]):
-        if history is None:
-            history = []
-        if 'gemini' in self.model_name.lower():
-            self.chat = self.model.start_chat(history=history)
-        else:
-            raise NotImplementedError("Chat with history not implemented yet.")
-    
-    def get_chat_response(self, prompt):
-        system_prompt = """
+SYSTEM_PROMPT = """
             Format your response using Slack markdown:
             - Use *bold* for emphasis
             - Use _italic_ for subtle emphasis
@@ -44,14 +22,275 @@ class LLM:
             - Use > for quotes
             - Use bullet points with •
             - Add emojis where appropriate 🎯
-            
-            Current conversation:
             """
+
+# (message, is_bot) rows as returned by Database.get_thread_history
+History = List[Tuple[str, bool]]
+
+
+class ChatStream:
+    """Text chunks of a streamed reply; `model` names the model producing them once it is known."""
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self._chunks: Iterator[str] = iter(())
+
+    def __iter__(self) -> Iterator[str]:
+        return self._chunks
+
+
+class LLM:
+    def __init__(self, API_KEY, models: Sequence[str] = LLM_MODELS,
+                 scheduler: Optional[LLMScheduler] = None, cache: Optional[ResponseCache] = None,
+                 client_factory: Optional[Callable[[str], Any]] = None):
+        self.api_key = API_KEY  #change for other models
+        self.sessions = ChatSessionManager(max_sessions=SESSION_CACHE_SIZE, idle_ttl=SESSION_IDLE_TTL)
+        # Every workspace shares one API key, so every call goes through one scheduler
+        self.scheduler = scheduler or LLMScheduler()
+        self.cache = cache or ResponseCache()
+
+        for model_name in models:
+            if 'gemini' not in model_name.lower():
+                raise NotImplementedError(f"Model {model_name} is not supported yet")
+        list_models = None
+        if client_factory is None:
+            # Imported on first use: the SDK takes most of a cold start to import
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            client_factory = genai.GenerativeModel
+            list_models = lambda: [model.name for model in genai.list_models()]
+        self.router = ModelRouter(models, client_factory, list_models)
+
+    @property
+    def model_name(self) -> str:
+        """The model requests are sent to first."""
+        return self.router.primary
+
+    def change_model(self, new_model):
+        """Make new_model the primary model; the rest of the pool stays as fallbacks.
+
+        Sessions keep their history, so ongoing threads continue on the new model.
+        """
+        if 'gemini' not in new_model.lower():
+            raise NotImplementedError(f"Model {new_model} not added yet.")
+        self.router.set_primary(new_model)
+        logger.info("Primary model is now %s", self.model_name)
+
+    def chat_with_history(self, history: Optional[History] = None) -> ChatSession:
+        """Start a new chat session seeded with thread history."""
+        if history is None:
+            history = []
+        contents, pending = to_chat_contents(history)
+        tokens = sum(estimate_tokens(message) for message, _ in history)
+        context = context_digest((turn["role"], "\n".join(turn["parts"])) for turn in contents)
+        return ChatSession(contents, pending_prompt=pending, tokens=tokens, context=context)
+
+    def _get_session(self, session_key: Optional[Hashable],
+                     history: Union[History, Callable[[], History], None]) -> ChatSession:
+        def new_session() -> ChatSession:
+            return self.chat_with_history(history() if callable(history) else history)
+
+        with span("llm.get_session"):
+            if session_key is None:
+                return new_session()
+            return self.sessions.get(session_key, new_session)
+
+    def _format_prompt(self, session: ChatSession, prompt: str) -> str:
+        # A single pasted log must not blow past the whole context budget
+        prompt = truncate_to_tokens(prompt, CONTEXT_TOKEN_BUDGET)
+        pending = session.take_pending_prompt()
+        return f"{pending}\n{prompt}" if pending else prompt
+
+    def _record_usage(self, model_name: str, response) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        LLM_TOKENS.labels(model_name, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+        LLM_TOKENS.labels(model_name, "completion").inc(
+            getattr(usage, "candidates_token_count", 0) or 0)
+
+    def _record_turn(self, session: ChatSession, session_key: Optional[Hashable],
+                     prompt: str, response: str) -> None:
+        """Account for a completed turn and retire sessions that outgrew the budget."""
+        session.add_turns(prompt, response)
+        session.tokens += estimate_tokens(prompt) + estimate_tokens(response)
+        if session.context is not None:
+            add_turn(session.context, "user", prompt)
+            add_turn(session.context, "model", response)
+        if session_key is not None and session.tokens > CONTEXT_TOKEN_BUDGET:
+            # The next mention re-seeds from the DB through the context builder
+            self.sessions.discard(session_key)
+
+    def _cache_key(self, session: ChatSession, prompt: str, team_id: Optional[str]) -> Optional[bytes]:
+        if session.context is None or not self.cache.enabled_for(team_id):
+            return None
+        return response_key(session.context, self.model_name, prompt)
+
+    def _cache_response(self, session: ChatSession, prompt: str, key: Optional[bytes],
+                        model_name: str, response: str) -> None:
+        """Cache a response under the model that gave it, which may be a fallback
+        rather than the primary the lookup key names. Call before _record_turn
+        extends the context."""
+        if key is not None:
+            self.cache.set(response_key(session.context, model_name, prompt), model_name, response)
+
+    def _cached_response(self, session: ChatSession, session_key: Optional[Hashable],
+                         prompt: str, key: Optional[bytes]) -> Optional[Tuple[str, str]]:
+        """Answer from the response cache without calling a model, if the key is cached."""
+        if key is None:
+            return None
+        with span("llm.cache"):
+            cached = self.cache.get(key)
+        if cached is None:
+            return None
+        model_name, response = cached
+        self._record_turn(session, session_key, prompt, response)
+        return response, model_name
+
+    def get_chat_response(self, prompt: str, session_key: Optional[Hashable] = None,
+                          history: Union[History, Callable[[], History], None] = None,
+                          team_id: Optional[str] = None) -> Tuple[str, str]:
+        """Send a prompt on the session for session_key, seeding it from history on first use.
+
+        history may be a callable so the thread history is only loaded when
+        a new session has to be created. Without a session_key the prompt is
+        answered by a one-off chat. A cached response for the same model,
+        context and prompt is returned without calling the model; otherwise
+        the call is scheduled against team_id's share of the request quota
+        and routed to the model pool. Returns the response and the model
+        that gave it. RateLimitError is raised unwrapped.
+        """
+        try:
+            session = self._get_session(session_key, history)
+            # Concurrent mentions in the same thread must not interleave turns
+            with session.lock:
+                formatted_prompt = self._format_prompt(session, prompt)
+                key = self._cache_key(session, formatted_prompt, team_id)
+                cached = self._cached_response(session, session_key, formatted_prompt, key)
+                if cached is not None:
+                    return cached
+
+                # A hedged request may still be reading it after the winner's turn is added
+                history_turns = list(session.history)
+
+                def send(model_name: str, client):
+                    with LLM_REQUEST_SECONDS.labels(model_name, "chat").time(), span("llm.chat"):
+                        response = client.start_chat(history=history_turns).send_message(formatted_prompt)
+                        # Blocked responses raise here, so the router fails over
+                        return response, response.text
+                (response, text), model_name = self._route(
+                    team_id, send, self._cost(session, formatted_prompt))
+                self._record_usage(model_name, response)
+                self._cache_response(session, formatted_prompt, key, model_name, text)
+                self._record_turn(session, session_key, formatted_prompt, text)
+            return text, model_name
+        except RateLimitError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error getting chat response: {str(e)}")
+
+    def generate(self, prompt: str, team_id: Optional[str] = None) -> str:
+        """Answer a standalone prompt outside of any chat session."""
         try:
-            if self.chat is None:
-                self.chat_with_history()
-            formatted_prompt = system_prompt + prompt
-            response = self.chat.send_message(formatted_prompt)
-            return response.text
+            def send(model_name: str, client):
+                with LLM_REQUEST_SECONDS.labels(model_name, "generate").time(), span("llm.generate"):
+                    response = client.generate_content(prompt)
+                    return response, response.text
+            (response, text), model_name = self._route(team_id, send, estimate_tokens(prompt))
+            self._record_usage(model_name, response)
+            return text
+        except RateLimitError:
+            raise
         except Exception as e:
-            raise Exception(f"Error getting chat response: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error generating response: {str(e)}")
+
+    def stream_chat_response(self, prompt: str, session_key: Optional[Hashable] = None,
+                             history: Union[History, Callable[[], History], None] = None,
+                             team_id: Optional[str] = None) -> ChatStream:
+        """Like get_chat_response, but yield the response text as the model produces it.
+
+        The returned stream's `model` is set once a model has started
+        answering. The session stays locked until the stream is exhausted or
+        closed. Routing, failover and rate-limit retries happen before the
+        first chunk; an error after it is raised to the caller.
+        """
+        stream = ChatStream()
+        stream._chunks = self._stream_chunks(stream, prompt, session_key, history, team_id)
+        return stream
+
+    def _stream_chunks(self, stream: ChatStream, prompt: str, session_key: Optional[Hashable],
+                       history: Union[History, Callable[[], History], None],
+                       team_id: Optional[str]) -> Iterator[str]:
+        try:
+            session = self._get_session(session_key, history)
+            with session.lock:
+                formatted_prompt = self._format_prompt(session, prompt)
+                key = self._cache_key(session, formatted_prompt, team_id)
+                cached = self._cached_response(session, session_key, formatted_prompt, key)
+                if cached is not None:
+                    stream.model = cached[1]
+                    yield cached[0]
+                    return
+
+                history_turns = list(session.history)
+
+                def send(model_name: str, client):
+                    # Hedged and failed over up to the first chunk
+                    with span("llm.stream_start"):
+                        chunks = iter(client.start_chat(history=history_turns)
+                                      .send_message(formatted_prompt, stream=True))
+                        first = next(chunks, None)
+                        return first, "" if first is None else first.text, chunks
+                start = time.perf_counter()
+                (chunk, text, chunks), stream.model = self._route(
+                    team_id, send, self._cost(session, formatted_prompt))
+                with span("llm.stream"):
+                    if text:
+                        yield text
+                    for chunk in chunks:
+                        text += chunk.text
+                        yield chunk.text
+                LLM_REQUEST_SECONDS.labels(stream.model, "stream").observe(time.perf_counter() - start)
+                # Usage is reported on the final chunk
+                self._record_usage(stream.model, chunk)
+                self._cache_response(session, formatted_prompt, key, stream.model, text)
+                self._record_turn(session, session_key, formatted_prompt, text)
+        except RateLimitError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error getting chat response: {str(e)}")
+
+    def _route(self, team_id: Optional[str], send: Callable[[str, Any], Any], cost: int):
+        """Send on the model pool, taking a scheduler slot for every request the
+        router makes (hedges and failovers too) and retrying on rate limits."""
+        admit = lambda: self.scheduler.acquire(team_id, cost)
+        return self.scheduler.with_retries(team_id, lambda: self.router.call(send, admit))
+
+    def shutdown(self) -> None:
+        self.router.shutdown()
+
+    @staticmethod
+    def _cost(session: ChatSession, prompt: str) -> int:
+        # The whole session history is sent again with every turn
+        return session.tokens + estimate_tokens(prompt)
+
+
+def to_chat_contents(history: History) -> Tuple[list, str]:
+    """Convert (message, is_bot) rows into alternating Gemini chat turns.
+
+    Returns the turns plus any trailing unanswered user text, which has to
+    be sent with the next prompt because Gemini expects turns to alternate.
+    """
+    turns: List[Tuple[str, List[str]]] = [("user", [SYSTEM_PROMPT]), ("model", ["Understood."])]
+    for message, is_bot in history:
+        role = "model" if is_bot else "user"
+        if turns[-1][0] == role:
+            turns[-1][1].append(message)
+        else:
+            turns.append((role, [message]))
+
+    pending = ""
+    if turns[-1][0] == "user":
+        pending = "\n".join(turns.pop()[1])
+    contents = [{"role": role, "parts": ["\n".join(parts)]} for role, parts in turns]
+    return contents, pending
@@ -0,0 +1,166 @@
+import atexit
+import json
+import logging
+import queue
+import reprlib
+import sys
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import LOG_FORMAT, LOG_QUEUE_SIZE, LOG_MAX_CHARS, LOG_SAMPLE_RATE
+from .metrics import LOG_RECORDS_DROPPED
+from .tracing import current_trace
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "trace_id", "team_id"}
+
+def clip(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}… [{len(text)} chars]"
+
+class ContextFilter(logging.Filter):
+    """Runs on the logging thread, before a record is queued.
+
+    Tags the record with the current trace and team, keeps `sample_rate` of
+    INFO and DEBUG records (all or none of a trace's), and clips arguments
+    so formatting costs the same however large a payload is: strings to
+    `max_chars`, containers to a bounded repr. Other arguments are
+    formatted later, on the writer thread.
+    """
+
+    def __init__(self, max_chars: int = LOG_MAX_CHARS, sample_rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+        self._repr = reprlib.Repr()
+        self._repr.maxstring = self._repr.maxother = max_chars
+        self._repr.maxlevel = 3
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace()
+        record.trace_id = trace.trace_id if trace is not None else None
+        record.team_id = trace.attributes.get("team_id") if trace is not None else None
+        if record.levelno < logging.WARNING and not self._sampled(record.trace_id):
+            LOG_RECORDS_DROPPED.labels("sampled").inc()
+            return False
+        if isinstance(record.args, dict) and "%(" not in str(record.msg):
+            # logger.info("%s", some_dict) arrives with the dict as the args mapping
+            record.args = (record.args,)
+        if isinstance(record.args, tuple):
+            record.args = tuple(self._clip(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: self._clip(value) for key, value in record.args.items()}
+        return True
+
+    def _sampled(self, trace_id: Optional[str]) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        if trace_id is None:
+            return self.sample_rate > 0
+        return zlib.crc32(trace_id.encode()) / 0xFFFFFFFF < self.sample_rate
+
+    def _clip(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return clip(value, self.max_chars)
+        if isinstance(value, (dict, list, tuple, set, frozenset)):
+            return self._repr.repr(value)
+        return value
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread as they are; a full queue drops them."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record needs no
+        # pickling-safe copy; messages are formatted on its thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when stopping behind a full queue
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        # Also registered with atexit, so it may run again after an explicit stop
+        if self._thread is not None:
+            super().stop()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, trace and team ids,
+    `extra` fields, static `fields` such as the shard, and any traceback."""
+
+    def __init__(self, max_chars: int = LOG_MAX_CHARS, fields: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.max_chars = max_chars
+        self.fields = fields or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": clip(record.getMessage(), self.max_chars),
+        }
+        entry.update(self.fields)
+        for key in ("trace_id", "team_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """The classic text format, with messages clipped to max_chars."""
+
+    def __init__(self, fmt: str = TEXT_FORMAT, max_chars: int = LOG_MAX_CHARS):
+        super().__init__(fmt)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = clip(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+def setup(level: int, log_format: str = LOG_FORMAT, shard: Optional[int] = None) -> QueueListener:
+    """Send every log record through a bounded queue to a background stdout writer.
+
+    The logging thread only runs ContextFilter and a non-blocking put; the
+    message is formatted, as JSON lines or text, and written by the
+    listener thread, which is stopped (after draining) at exit.
+    """
+    stream = logging.StreamHandler(sys.stdout)  # stdout for Railway
+    if log_format == "json":
+        stream.setFormatter(JsonFormatter(fields=None if shard is None else {"shard": shard}))
+    else:
+        fmt = TEXT_FORMAT if shard is None else TEXT_FORMAT.replace(" - %(name)s", f" - shard {shard} - %(name)s")
+        stream.setFormatter(TextFormatter(fmt))
+
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = _Listener(records, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,246 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans sub-millisecond SQLite calls up to slow LLM completions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    """A named metric family whose children are keyed by label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values: str):
+        """Return the child for these label values, creating it on first use."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items(), key=lambda item: item[0])
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+class _GaugeChild(_CounterChild):
+    def __init__(self):
+        super().__init__()
+        self._function: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from a callback at scrape time instead."""
+        self._function = function
+
+    def get(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    @contextmanager
+    def track_inprogress(self) -> Iterator[None]:
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render() -> str:
+    return REGISTRY.render()
+
+def timed(histogram: Histogram):
+    """Decorator that observes each call's duration, labelled with the function name."""
+    def decorator(func):
+        child = histogram.labels(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Hot-path metrics shared by the bot, database and LLM layers
+DB_QUERY_SECONDS = Histogram("slamobot_db_query_seconds",
+                             "Time spent in Database methods", ["method"])
+LLM_REQUEST_SECONDS = Histogram("slamobot_llm_request_seconds",
+                                "Latency of LLM calls", ["model", "operation"])
+LLM_MODEL_CALLS = Counter("slamobot_llm_model_calls_total",
+                          "LLM requests sent to each model of the pool, by result", ["model", "result"])
+LLM_HEDGES = Counter("slamobot_llm_hedges_total",
+                     "Requests also sent to a fallback model after passing the model's latency "
+                     "percentile", ["model"])
+LLM_BREAKER_OPEN = Gauge("slamobot_llm_breaker_open",
+                         "1 while a model's circuit breaker is open or half-open", ["model"])
+LLM_QUEUE_SECONDS = Histogram("slamobot_llm_queue_seconds",
+                              "Time LLM calls waited for a rate-limit slot", ["team_id"])
+LLM_QUEUE_DEPTH = Gauge("slamobot_llm_queue_depth", "LLM calls waiting for a rate-limit slot")
+LLM_RATE_LIMITED = Counter("slamobot_llm_rate_limited_total",
+                           "LLM calls rejected by the API with a rate-limit error", ["team_id"])
+RESPONSE_CACHE_REQUESTS = Counter("slamobot_response_cache_requests_total",
+                                  "LLM response cache lookups by tier and result", ["tier", "result"])
+LLM_TOKENS = Counter("slamobot_llm_tokens_total",
+                     "Tokens reported by the LLM API", ["model", "kind"])
+SLACK_POST_SECONDS = Histogram("slamobot_slack_post_seconds",
+                               "Latency of Slack Web API calls", ["method"])
+RETRIEVAL_TIMEOUTS = Counter("slamobot_retrieval_timeouts_total",
+                             "Related-message searches abandoned at the time budget")
+DIGEST_SECONDS = Histogram("slamobot_digest_seconds",
+                           "Time to build a channel digest", ["source"])
+MENTIONS = Counter("slamobot_mentions_total", "app_mention events received", ["team_id"])
+MENTION_ERRORS = Counter("slamobot_mention_errors_total",
+                         "Mentions that ended in an error reply", ["team_id"])
+EVENTS_DEDUPLICATED = Counter("slamobot_events_deduplicated_total",
+                             "Redelivered events dropped, by the layer that caught them",
+                             ["team_id", "layer"])
+MENTIONS_SHED = Counter("slamobot_mentions_shed_total",
+                        "Mentions refused because the queue was full", ["team_id"])
+MENTIONS_IN_FLIGHT = Gauge("slamobot_mentions_in_flight",
+                           "Mentions currently being processed", ["team_id"])
+MENTION_SECONDS = Histogram("slamobot_mention_seconds",
+                            "Time from dequeuing a mention to posting its reply", ["team_id"])
+MENTION_QUEUE_DEPTH = Gauge("slamobot_mention_queue_depth", "Mentions queued or running")
+ARCHIVED_MESSAGES = Counter("slamobot_archived_messages_total",
+                            "Messages moved to the archive by retention", ["team_id"])
+VACUUM_FREED_BYTES = Counter("slamobot_vacuum_freed_bytes_total",
+                             "Bytes returned to the filesystem by incremental vacuum")
+LOG_RECORDS_DROPPED = Counter("slamobot_log_records_dropped_total",
+                             "Log records not written, sampled out or behind a full queue",
+                             ["reason"])
+RETRIES = Counter("slamobot_retries_total", "Retried external calls", ["operation"])
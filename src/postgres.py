@@ -0,0 +1,408 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import DATABASE_URL, PG_POOL_MIN, PG_POOL_MAX
+from .context import estimate_tokens
+from .metrics import DB_QUERY_SECONDS, RETRIEVAL_TIMEOUTS, timed
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Serializes schema setup across processes starting at the same time
+SCHEMA_LOCK_ID = 0x510B07
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS workspaces
+    (team_id TEXT PRIMARY KEY,
+    team_name TEXT,
+    bot_token TEXT,
+    bot_id TEXT,
+    installed_at TIMESTAMPTZ NOT NULL DEFAULT now());
+
+    CREATE TABLE IF NOT EXISTS messages
+    (id BIGSERIAL PRIMARY KEY,
+    team_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    thread_ts TEXT NOT NULL,
+    user_id TEXT,
+    message TEXT,
+    is_bot BOOLEAN NOT NULL DEFAULT FALSE,
+    timestamp DOUBLE PRECISION,
+    token_count INTEGER,
+    model TEXT);
+    -- Added after the first release
+    ALTER TABLE messages ADD COLUMN IF NOT EXISTS model TEXT;
+
+    CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (team_id, channel, thread_ts, id);
+    CREATE INDEX IF NOT EXISTS idx_messages_team_time ON messages (team_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_messages_channel_time ON messages (team_id, channel, timestamp, id);
+    -- Full-text search for related messages. Building it on a large existing
+    -- table blocks writes; create it CONCURRENTLY by hand beforehand instead
+    CREATE INDEX IF NOT EXISTS idx_messages_search
+    ON messages USING GIN (to_tsvector('simple', coalesce(message, '')));
+
+    CREATE TABLE IF NOT EXISTS thread_summaries
+    (team_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    thread_ts TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    last_message_id BIGINT NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (team_id, channel, thread_ts));
+
+    CREATE TABLE IF NOT EXISTS processed_events
+    (event_hash BIGINT PRIMARY KEY,
+    expires_at DOUBLE PRECISION NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS retention_policies
+    (team_id TEXT PRIMARY KEY,
+    ttl_days DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL);
+'''
+
+class PostgresStorage:
+    """PostgreSQL storage backend over a thread-safe psycopg2 connection pool.
+
+    Callers block while all PG_POOL_MAX connections are checked out rather
+    than failing, so the pool size caps concurrent queries per process.
+    Requires `pip install psycopg2-binary`.
+    """
+
+    def __init__(self, dsn: Optional[str] = DATABASE_URL, min_connections: int = PG_POOL_MIN,
+                 max_connections: int = PG_POOL_MAX):
+        try:
+            from psycopg2.pool import ThreadedConnectionPool
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires psycopg2; "
+                               "run 'pip install psycopg2-binary'") from e
+        if not dsn:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires DATABASE_URL")
+        self._pool = ThreadedConnectionPool(min_connections, max_connections, dsn)
+        # ThreadedConnectionPool raises instead of waiting when it is exhausted
+        self._available = threading.BoundedSemaphore(max_connections)
+        self.init_db()
+
+    @contextmanager
+    def _cursor(self) -> Iterator:
+        """Borrow a pooled connection for one transaction."""
+        with self._available:
+            conn = self._pool.getconn()
+            try:
+                # Commits on success and rolls back on error; the connection stays open
+                with conn:
+                    with conn.cursor() as cursor:
+                        yield cursor
+            finally:
+                self._pool.putconn(conn)
+
+    def init_db(self) -> None:
+        """Create the schema if it does not exist yet."""
+        with self._cursor() as c:
+            c.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            c.execute(SCHEMA)
+        logger.info("PostgreSQL storage initialized")
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_workspaces(self) -> List[Tuple[str, str, str, str]]:
+        """Get all workspaces from the database."""
+        try:
+            with self._cursor() as c:
+                c.execute('SELECT team_id, team_name, bot_token, bot_id FROM workspaces')
+                return c.fetchall()
+        except Exception as e:
+            logger.error("Error getting workspaces: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_workspace(self, team_id: str) -> Optional[Dict[str, str]]:
+        """Get a specific workspace's details."""
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    SELECT team_id, team_name, bot_token, bot_id FROM workspaces WHERE team_id = %s
+                ''', (team_id,))
+                result = c.fetchone()
+            if result:
+                return dict(zip(("team_id", "team_name", "bot_token", "bot_id"), result))
+            return None
+        except Exception as e:
+            logger.error("Error getting workspace %s: %s", team_id, e)
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def add_workspace(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> bool:
+        """Add or update a workspace in the database."""
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    INSERT INTO workspaces (team_id, team_name, bot_token, bot_id)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (team_id) DO UPDATE
+                    SET team_name = EXCLUDED.team_name, bot_token = EXCLUDED.bot_token,
+                        bot_id = EXCLUDED.bot_id
+                ''', (team_id, team_name, bot_token, bot_id))
+            logger.info("Workspace added/updated: %s", team_id)
+            return True
+        except Exception as e:
+            logger.error("Error adding workspace: %s", e)
+            return False
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def store_message(self, team_id: str, channel_id: str, thread_ts: str, user_id: str,
+                      message: str, is_bot: bool, model: Optional[str] = None) -> None:
+        """Store a message in the database."""
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot,
+                                          timestamp, token_count, model)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ''', (team_id, channel_id, thread_ts, user_id, message, bool(is_bot), time.time(),
+                      estimate_tokens(message), model))
+        except Exception as e:
+            logger.error("Error storing message: %s", e)
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_thread_history(self, team_id: str, channel_id: str, thread_ts: str,
+                           limit: int = 5) -> List[Tuple[str, bool]]:
+        """Retrieve message history for a thread."""
+        return [(message, is_bot) for message, is_bot, _ in
+                self.get_context_messages(team_id, channel_id, thread_ts, limit)]
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_context_messages(self, team_id: str, channel_id: str, thread_ts: str,
+                             limit: int, after_id: int = 0) -> List[Tuple[str, bool, int]]:
+        """Retrieve recent thread messages newer than after_id with their token counts."""
+        if limit <= 0:
+            return []
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    SELECT message, is_bot, token_count FROM messages
+                    WHERE team_id = %s AND channel = %s AND thread_ts = %s AND id > %s
+                    ORDER BY id DESC LIMIT %s
+                ''', (team_id, channel_id, thread_ts, after_id, limit))
+                rows = c.fetchall()
+            return [(message, is_bot, estimate_tokens(message) if tokens is None else tokens)
+                    for message, is_bot, tokens in reversed(rows)]
+        except Exception as e:
+            logger.error("Error retrieving context messages: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_messages_after(self, team_id: str, channel_id: str, thread_ts: str, after_id: int,
+                           limit: int) -> List[Tuple[int, str, bool]]:
+        """Retrieve thread messages with id > after_id, oldest first."""
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    SELECT id, message, is_bot FROM messages
+                    WHERE team_id = %s AND channel = %s AND thread_ts = %s AND id > %s
+                    ORDER BY id LIMIT %s
+                ''', (team_id, channel_id, thread_ts, after_id, limit))
+                return c.fetchall()
+        except Exception as e:
+            logger.error("Error retrieving messages after %s: %s", after_id, e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_channel_messages(self, team_id: str, channel_id: str, since: float, limit: int,
+                             after: Optional[Tuple[float, int]] = None
+                             ) -> List[Tuple[int, str, str, bool, float]]:
+        """One page of the channel's messages since a timestamp, oldest first."""
+        cursor = after or (since, 0)
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    SELECT id, user_id, message, is_bot, timestamp FROM messages
+                    WHERE team_id = %s AND channel = %s AND (timestamp, id) > (%s, %s)
+                    ORDER BY timestamp, id LIMIT %s
+                ''', (team_id, channel_id, cursor[0], cursor[1], limit))
+                return c.fetchall()
+        except Exception as e:
+            logger.error("Error retrieving channel messages: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def search_messages(self, team_id: str, channel_id: str, terms: List[str],
+                        exclude_thread_ts: str, limit: int,
+                        time_budget: float) -> List[Tuple[str, bool, str]]:
+        """Best-ranked messages matching any term in the channel's other threads, best first.
+
+        The query is cancelled by statement_timeout after time_budget seconds
+        and then returns nothing.
+        """
+        if not terms or limit <= 0:
+            return []
+        # Terms are plain words, so they are safe as tsquery operands
+        query = " | ".join(terms)
+        try:
+            with self._cursor() as c:
+                c.execute("SET LOCAL statement_timeout = %s", (max(1, int(time_budget * 1000)),))
+                c.execute('''
+                    SELECT message, is_bot, thread_ts FROM messages,
+                        to_tsquery('simple', %s) AS query
+                    WHERE team_id = %s AND channel = %s AND thread_ts <> %s
+                      AND to_tsvector('simple', coalesce(message, '')) @@ query
+                    ORDER BY ts_rank(to_tsvector('simple', coalesce(message, '')), query) DESC
+                    LIMIT %s
+                ''', (query, team_id, channel_id, exclude_thread_ts, limit))
+                return c.fetchall()
+        except Exception as e:
+            # psycopg2.errors.QueryCanceled, imported lazily with the driver
+            if type(e).__name__ == "QueryCanceled":
+                RETRIEVAL_TIMEOUTS.labels().inc()
+                logger.warning("Message search for team %s exceeded its %.0f ms budget",
+                               team_id, time_budget * 1000)
+            else:
+                logger.error("Error searching messages: %s", e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def get_thread_summary(self, team_id: str, channel_id: str,
+                           thread_ts: str) -> Optional[Tuple[str, int]]:
+        """Return a thread's rolling summary and the last message id it covers."""
+        try:
+            with self._cursor() as c:
+                c.execute('''
+                    SELECT summary, last_message_id FROM thread_summaries
+                    WHERE team_id = %s AND channel = %s AND thread_ts = %s
+                ''', (team_id, channel_id, thread_ts))
+                return c.fetchone()
+        except Exception as e:
+            logger.error("Error getting summary for thread %s: %s", thread_ts, e)
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def save_thread_summary(self, team_id: str, channel_id: str, thread_ts: str,
+                            summary: str, last_message_id: int) -> None:
+        """Insert or replace a thread's rolling summary."""
+        with self._cursor() as c:
+            c.execute('''
+                INSERT INTO thread_summaries
+                (team_id, channel, thread_ts, summary, last_message_id, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (team_id, channel, thread_ts) DO UPDATE
+                SET summary = EXCLUDED.summary, last_message_id = EXCLUDED.last_message_id,
+                    updated_at = EXCLUDED.updated_at
+            ''', (team_id, channel_id, thread_ts, summary, last_message_id, time.time()))
+
+    def get_retention_policies(self) -> Dict[str, float]:
+        """Return every workspace's retention TTL in days."""
+        with self._cursor() as c:
+            c.execute('SELECT team_id, ttl_days FROM retention_policies')
+            return dict(c.fetchall())
+
+    def set_retention_policy(self, team_id: str, ttl_days: float) -> None:
+        """Keep a workspace's threads for ttl_days after their last message; 0 keeps them forever."""
+        with self._cursor() as c:
+            c.execute('''
+                INSERT INTO retention_policies (team_id, ttl_days, updated_at) VALUES (%s, %s, %s)
+                ON CONFLICT (team_id) DO UPDATE
+                SET ttl_days = EXCLUDED.ttl_days, updated_at = EXCLUDED.updated_at
+            ''', (team_id, ttl_days, time.time()))
+
+    def delete_retention_policy(self, team_id: str) -> None:
+        with self._cursor() as c:
+            c.execute('DELETE FROM retention_policies WHERE team_id = %s', (team_id,))
+
+    @timed(DB_QUERY_SECONDS)
+    @traced()
+    def claim_event(self, event_hash: int, expires_at: float) -> bool:
+        """Record an event as processed; False if a live claim for it already exists."""
+        with self._cursor() as c:
+            c.execute('''
+                INSERT INTO processed_events (event_hash, expires_at) VALUES (%s, %s)
+                ON CONFLICT (event_hash) DO UPDATE SET expires_at = EXCLUDED.expires_at
+                WHERE processed_events.expires_at <= %s
+            ''', (event_hash, expires_at, time.time()))
+            return c.rowcount == 1
+
+    def purge_processed_events(self, now: float) -> int:
+        """Delete expired event claims; returns how many were removed."""
+        with self._cursor() as c:
+            c.execute('DELETE FROM processed_events WHERE expires_at <= %s', (now,))
+            return c.rowcount
+
+    def archive_expired_threads(self, team_id: str, cutoff: float, limit: int,
+                                sink: Callable[[List[dict]], None]) -> Tuple[int, int]:
+        """Move up to `limit` threads with no messages since cutoff out of the database.
+
+        Only the rows handed to sink are deleted, in the same transaction,
+        so a reply that lands concurrently is kept rather than lost. If sink
+        raises, nothing is deleted. Returns (threads, messages).
+        """
+        with self._cursor() as c:
+            c.execute('''
+                SELECT DISTINCT channel, thread_ts FROM messages AS m
+                WHERE team_id = %s AND timestamp < %s
+                AND NOT EXISTS (
+                    SELECT 1 FROM messages AS n
+                    WHERE n.team_id = m.team_id AND n.channel = m.channel
+                    AND n.thread_ts = m.thread_ts
+                    AND (n.timestamp >= %s OR n.timestamp IS NULL)
+                )
+                LIMIT %s
+            ''', (team_id, cutoff, cutoff, limit))
+            threads = c.fetchall()
+            rows: List[dict] = []
+            for channel, thread_ts in threads:
+                c.execute('''
+                    SELECT id, team_id, channel, thread_ts, user_id, message, is_bot,
+                           timestamp, token_count, model
+                    FROM messages
+                    WHERE team_id = %s AND channel = %s AND thread_ts = %s
+                    ORDER BY id
+                ''', (team_id, channel, thread_ts))
+                columns = [column[0] for column in c.description]
+                rows.extend(dict(zip(columns, row)) for row in c.fetchall())
+            if rows:
+                sink(rows)
+                c.execute('DELETE FROM messages WHERE id = ANY(%s)', ([row["id"] for row in rows],))
+            for channel, thread_ts in threads:
+                c.execute('''
+                    DELETE FROM thread_summaries WHERE team_id = %s AND channel = %s AND thread_ts = %s
+                ''', (team_id, channel, thread_ts))
+        return len(threads), len(rows)
+
+    def reclaim_space(self, pages: int = 0) -> int:
+        # Autovacuum makes deleted rows reusable; returning the space to the
+        # filesystem would need VACUUM FULL, which locks the table
+        return 0
+
+    def storage_stats(self) -> dict:
+        """Sizes of the database and the messages table."""
+        with self._cursor() as c:
+            c.execute('''
+                SELECT pg_database_size(current_database()), pg_total_relation_size('messages')
+            ''')
+            database_bytes, messages_bytes = c.fetchone()
+        return {"backend": "postgres", "size_bytes": database_bytes,
+                "messages_bytes": messages_bytes}
+
+    def ping(self) -> None:
+        """Raise if the database cannot be queried."""
+        with self._cursor() as c:
+            c.execute('SELECT 1')
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self._pool.closeall()
@@ -0,0 +1,34 @@
+import logging
+import threading
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+# The component does not run in this process (e.g. a gunicorn worker has no bot)
+NOT_RUNNING = "not_running"
+
+_checks: Dict[str, Callable[[], str]] = {}
+_lock = threading.Lock()
+
+def register(component: str, check: Callable[[], str]) -> None:
+    """Report a component's state through a callback evaluated on each health check."""
+    with _lock:
+        _checks[component] = check
+
+def set_state(component: str, state: str) -> None:
+    """Report a fixed state for a component, e.g. STARTING before it is built."""
+    register(component, lambda: state)
+
+def state(component: str) -> str:
+    """Current state of a component; NOT_RUNNING if nothing reported it in this process."""
+    check = _checks.get(component)
+    if check is None:
+        return NOT_RUNNING
+    try:
+        return check()
+    except Exception as e:
+        logger.error("Readiness check for %s failed: %s", component, e)
+        return FAILED
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import AbstractSet, Iterable, Optional, Tuple
+
+from .cache import TTLCache, MISSING
+from .config import (RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_PATH,
+                     RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_DISABLED_TEAMS)
+from .metrics import RESPONSE_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Slack user mentions such as <@U0123ABCD>; the bot's own id differs per workspace
+USER_MENTION = re.compile(r"<@[A-Z0-9]+(?:\|[^>]*)?>")
+
+# Check the SQLite tier's size after this many writes
+EVICT_EVERY = 100
+
+def normalize(text: str) -> str:
+    """Drop user mentions and fold case and whitespace, so trivially different prompts share a key."""
+    return " ".join(USER_MENTION.sub(" ", text).split()).casefold()
+
+def context_digest(turns: Iterable[Tuple[str, str]]):
+    """Start a running hash of a chat's (role, text) turns, system prompt included."""
+    digest = hashlib.sha256()
+    for role, text in turns:
+        add_turn(digest, role, text)
+    return digest
+
+def add_turn(digest, role: str, text: str) -> None:
+    """Extend a context digest with one turn."""
+    digest.update(b"\0" + role.encode() + b"\0" + normalize(text).encode())
+
+def response_key(digest, model_name: str, prompt: str) -> bytes:
+    """Cache key for sending prompt to model_name on a chat whose context hashes to digest."""
+    digest = digest.copy()
+    digest.update(b"\0model\0" + normalize(model_name).encode())
+    add_turn(digest, "user", prompt)
+    return digest.digest()
+
+class PersistentResponseCache:
+    """SQLite tier of the response cache; processes sharing the file share its entries.
+
+    Expired rows are never returned. Every EVICT_EVERY writes, expired rows
+    are deleted and, while the stored responses exceed max_bytes, the least
+    recently used ones too.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses
+                (key BLOB PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL)
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used "
+                               "ON responses (last_used)")
+
+    def get(self, key: bytes) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT model, response FROM responses WHERE key = ? AND expires_at > ?",
+                                     (key, now)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return None if row is None else tuple(row)
+
+    def set(self, key: bytes, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, expires_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, len(response.encode()), now + self.ttl, now))
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def evict(self) -> int:
+        """Delete expired entries, then the least recently used beyond max_bytes."""
+        with self._lock:
+            return self._evict(time.time())
+
+    def _evict(self, now: float) -> int:
+        with self._conn:
+            deleted = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Walk the oldest entries until enough bytes are covered
+                excess = total - self.max_bytes
+                cutoff = None
+                for last_used, size in self._conn.execute(
+                        "SELECT last_used, size FROM responses ORDER BY last_used"):
+                    excess -= size
+                    if excess <= 0:
+                        cutoff = last_used
+                        break
+                if cutoff is not None:
+                    deleted += self._conn.execute("DELETE FROM responses WHERE last_used <= ?",
+                                                  (cutoff,)).rowcount
+        if deleted:
+            logger.info("Evicted %s cached responses from %s", deleted, self.path)
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """Two-tier cache of LLM responses keyed by response_key().
+
+    A bounded in-memory LRU answers repeats within this process; the
+    optional SQLite tier at `path` keeps responses across restarts and
+    shards and refills the memory tier on a hit. Keys do not include the
+    workspace, so teams listed in `disabled_teams` neither read nor write
+    cached responses. A tier with a size of 0 is off.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 path: str = RESPONSE_CACHE_PATH, max_mb: float = RESPONSE_CACHE_MAX_MB,
+                 disabled_teams: AbstractSet[str] = RESPONSE_CACHE_DISABLED_TEAMS):
+        self.ttl = ttl
+        self.disabled_teams = disabled_teams
+        self.memory = TTLCache(maxsize, ttl) if maxsize > 0 and ttl > 0 else None
+        self.persistent = None
+        if path and max_mb > 0 and ttl > 0:
+            self.persistent = PersistentResponseCache(path, ttl, int(max_mb * 1024 * 1024))
+
+    def enabled_for(self, team_id: Optional[str]) -> bool:
+        if self.memory is None and self.persistent is None:
+            return False
+        return team_id not in self.disabled_teams
+
+    def get(self, key: bytes) -> Optional[Tuple[str, str]]:
+        """Return a cached (model, response), or None on a miss in every tier."""
+        if self.memory is not None:
+            entry = self.memory.get(key)
+            if entry is not MISSING:
+                RESPONSE_CACHE_REQUESTS.labels("memory", "hit").inc()
+                return entry
+            RESPONSE_CACHE_REQUESTS.labels("memory", "miss").inc()
+        if self.persistent is not None:
+            try:
+                entry = self.persistent.get(key)
+            except sqlite3.Error as e:
+                logger.error("Error reading response cache: %s", e)
+                entry = None
+            RESPONSE_CACHE_REQUESTS.labels("sqlite", "miss" if entry is None else "hit").inc()
+            if entry is not None:
+                if self.memory is not None:
+                    self.memory.set(key, entry)
+                return entry
+        return None
+
+    def set(self, key: bytes, model: str, response: str) -> None:
+        """Store the response model gave in every tier; empty responses are not cached."""
+        if not response:
+            return
+        if self.memory is not None:
+            self.memory.set(key, (model, response))
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, model, response)
+            except sqlite3.Error as e:
+                logger.error("Error writing response cache: %s", e)
+
+    def close(self) -> None:
+        if self.persistent is not None:
+            self.persistent.close()
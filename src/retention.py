@@ -0,0 +1,173 @@
+"""
+Message retention: archives threads older than each workspace's TTL to
+gzip-compressed NDJSON files and returns the freed pages to the filesystem.
+
+Usage:
+    python -m src.retention run               # archive expired threads, vacuum if any
+    python -m src.retention stats             # database size and policies
+    python -m src.retention vacuum [--full]   # --full also converts old databases
+    python -m src.retention set-policy T0123 30
+    python -m src.retention clear-policy T0123
+"""
+
+if __name__ == "__main__":
+    # Run as a CLI: load .env before src.config is first imported below
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from . import config
+from .config import (ARCHIVE_DIR, RETENTION_DEFAULT_DAYS, RETENTION_INTERVAL,
+                     RETENTION_BATCH_THREADS, RETENTION_VACUUM_PAGES)
+from .db import get_database
+from .storage import Storage
+from .metrics import ARCHIVED_MESSAGES, VACUUM_FREED_BYTES
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+class RetentionManager:
+    """Applies per-workspace retention policies to the messages table.
+
+    A workspace without a policy uses RETENTION_DEFAULT_DAYS; a TTL of 0
+    keeps its messages forever. A thread expires once its newest message
+    is older than the TTL, and is archived whole to
+    ARCHIVE_DIR/<team_id>/messages-<date>.ndjson.gz before it is deleted.
+    Batches are at most `batch_threads` threads, each in its own short
+    transaction. An archive that was written but not committed (e.g. a
+    crash in between) is written again on the next run, so archives may
+    contain duplicate message ids but never miss one.
+    """
+
+    def __init__(self, db: Optional[Storage] = None, archive_dir: str = ARCHIVE_DIR,
+                 default_days: float = RETENTION_DEFAULT_DAYS,
+                 batch_threads: int = RETENTION_BATCH_THREADS,
+                 vacuum_pages: int = RETENTION_VACUUM_PAGES):
+        self.db = db or get_database()
+        self.archive_dir = archive_dir
+        self.default_days = default_days
+        self.batch_threads = batch_threads
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def policies(self) -> Dict[str, float]:
+        """TTL in days for every known workspace, including defaulted ones."""
+        policies = {team_id: self.default_days for team_id, *_ in self.db.get_workspaces()}
+        policies.update(self.db.get_retention_policies())
+        return policies
+
+    def run(self, now: Optional[float] = None) -> dict:
+        """Archive every expired thread, then vacuum if any were; returns what was reclaimed."""
+        now = time.time() if now is None else now
+        stats = {"threads": 0, "messages": 0, "archive_bytes": 0, "freed_bytes": 0}
+        # Re-read every run, so policies set while the bot runs apply
+        policies = {team_id: days for team_id, days in self.policies().items() if days > 0}
+        if not policies:
+            return stats
+        for team_id, ttl_days in sorted(policies.items()):
+            cutoff = now - ttl_days * DAY_SECONDS
+            path = self._archive_path(team_id, now)
+            while not self._stop.is_set():
+                written = []
+                threads, messages = self.db.archive_expired_threads(
+                    team_id, cutoff, self.batch_threads,
+                    lambda rows: written.append(self._write_archive(path, rows)))
+                if not threads:
+                    break
+                stats["threads"] += threads
+                stats["messages"] += messages
+                stats["archive_bytes"] += sum(written)
+                ARCHIVED_MESSAGES.labels(team_id).inc(messages)
+                logger.info("Archived %s threads (%s messages) for team %s", threads, messages, team_id)
+        # Nothing archived means no pages to free
+        stats["freed_bytes"] = self.vacuum() if stats["threads"] else 0
+        return stats
+
+    def vacuum(self) -> int:
+        """Return freed space to the filesystem where the backend supports it."""
+        freed = self.db.reclaim_space(self.vacuum_pages)
+        VACUUM_FREED_BYTES.labels().inc(freed)
+        return freed
+
+    def _archive_path(self, team_id: str, now: float) -> str:
+        day = datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%d")
+        return os.path.join(self.archive_dir, team_id, f"messages-{day}.ndjson.gz")
+
+    def _write_archive(self, path: str, rows: List[dict]) -> int:
+        """Append rows as one gzip member and fsync it before the delete commits."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        data = gzip.compress(payload.encode("utf-8"))
+        # Concatenated gzip members read back as a single stream
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def start(self, interval: float = RETENTION_INTERVAL) -> None:
+        """Run the retention job every `interval` seconds on a background thread."""
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    stats = self.run()
+                    if stats["threads"] or stats["freed_bytes"]:
+                        logger.info("Retention run: %s", stats)
+                except Exception as e:
+                    logger.error("Error running retention job: %s", e, exc_info=True)
+
+        self._thread = threading.Thread(target=loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Message retention and compaction")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="Archive expired threads, then vacuum")
+    commands.add_parser("stats", help="Show database size and retention policies")
+    vacuum = commands.add_parser("vacuum", help="Release free pages")
+    vacuum.add_argument("--full", action="store_true",
+                        help="Rebuild the file (converts it to incremental auto-vacuum)")
+    set_policy = commands.add_parser("set-policy", help="Set a workspace's TTL in days (0 keeps forever)")
+    set_policy.add_argument("team_id")
+    set_policy.add_argument("days", type=float)
+    clear_policy = commands.add_parser("clear-policy", help="Use the default TTL for a workspace")
+    clear_policy.add_argument("team_id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config.validate()
+    manager = RetentionManager()
+    db = manager.db
+    if args.command == "run":
+        print(json.dumps(manager.run(), indent=2))
+    elif args.command == "stats":
+        print(json.dumps({"storage": db.storage_stats(), "policies": manager.policies()}, indent=2))
+    elif args.command == "vacuum":
+        if args.full and not hasattr(db, "full_vacuum"):
+            parser.error("--full is only supported by the sqlite backend")
+        freed = db.full_vacuum() if args.full else db.reclaim_space(0)
+        print(json.dumps({"freed_bytes": freed, "storage": db.storage_stats()}, indent=2))
+    elif args.command == "set-policy":
+        db.set_retention_policy(args.team_id, args.days)
+    elif args.command == "clear-policy":
+        db.delete_retention_policy(args.team_id)
+    db.close()
+
+if __name__ == "__main__":
+    main()
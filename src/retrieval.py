@@ -0,0 +1,55 @@
+import logging
+import re
+from typing import List, Tuple
+
+from .config import (RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOKENS, RETRIEVAL_TIME_BUDGET_MS,
+                     RETRIEVAL_MAX_TERMS)
+from .context import estimate_tokens, truncate_to_tokens
+from .storage import Storage
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Slack markup such as <@U0123ABCD>, <#C0123|general> or <https://...|link>
+SLACK_MARKUP = re.compile(r"<[^>]*>")
+WORD = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+    a about after all also am an and any are as at be because been but by can could did do
+    does for from get got had has have he her here him his how i if in into is it its just
+    let like me my no not now of on or our out please she so some than that the their them
+    then there these they this to up us was we were what when where which who why will with
+    would you your yes hey hello thanks thank know tell need want
+""".split())
+
+def search_terms(text: str, max_terms: int = RETRIEVAL_MAX_TERMS) -> List[str]:
+    """Distinct content words of a message, longest (and usually rarest) first."""
+    words = WORD.findall(SLACK_MARKUP.sub(" ", text).lower())
+    terms = {word for word in words if len(word) > 2 and word not in STOPWORDS and not word.isdigit()}
+    return sorted(terms, key=lambda word: (-len(word), word))[:max_terms]
+
+def related_messages(db: Storage, team_id: str, channel_id: str, thread_ts: str, text: str,
+                     top_k: int = RETRIEVAL_TOP_K,
+                     budget_ms: float = RETRIEVAL_TIME_BUDGET_MS) -> List[Tuple[str, bool, str]]:
+    """Best matches for text among the channel's other threads, as (message, is_bot, thread_ts)."""
+    terms = search_terms(text)
+    if top_k <= 0 or not terms:
+        return []
+    with span("retrieval"):
+        return db.search_messages(team_id, channel_id, terms, thread_ts, top_k, budget_ms / 1000)
+
+def with_related_context(prompt: str, related: List[Tuple[str, bool, str]],
+                         max_tokens: int = RETRIEVAL_MAX_TOKENS) -> str:
+    """Prefix the prompt with related messages, best first, within max_tokens."""
+    lines = []
+    remaining = max_tokens
+    for message, is_bot, _ in related:
+        if remaining <= 0:
+            break
+        line = f"- {'Bot' if is_bot else 'User'}: {' '.join(message.split())}"
+        line = truncate_to_tokens(line, remaining)
+        remaining -= estimate_tokens(line)
+        lines.append(line)
+    if not lines:
+        return prompt
+    return "Related messages from other threads in this channel:\n" + "\n".join(lines) + "\n\n" + prompt
@@ -0,0 +1,302 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+from typing import (Any, Callable, Deque, Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple,
+                    TypeVar)
+
+from .config import (LLM_HEDGE, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY_MS, LLM_HEDGE_WORKERS,
+                     LLM_STATS_WINDOW, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_MIN_CALLS,
+                     LLM_BREAKER_COOLDOWN, LLM_MODEL_LIST_TTL)
+from .metrics import LLM_BREAKER_OPEN, LLM_HEDGES, LLM_MODEL_CALLS
+from .scheduler import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latency samples a model needs before its percentile is trusted; until then
+# requests to it are hedged after COLD_HEDGE_DELAY seconds
+MIN_LATENCY_SAMPLES = 20
+COLD_HEDGE_DELAY = 5.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+def short_name(model_name: str) -> str:
+    """'models/gemini-pro' -> 'gemini-pro', as the API lists and accepts either."""
+    return model_name[len("models/"):] if model_name.startswith("models/") else model_name
+
+class ModelHealth:
+    """Rolling latency and error stats of one model, plus its circuit breaker.
+
+    The last `window` calls are kept. The breaker opens when at least
+    `min_calls` of them failed at `error_rate` or more, and after `cooldown`
+    seconds lets a single probe through: its success closes the breaker
+    and starts a fresh window, its failure opens it again.
+    """
+
+    def __init__(self, name: str, window: int = LLM_STATS_WINDOW,
+                 error_rate: float = LLM_BREAKER_ERROR_RATE, min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.error_rate_threshold = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        # (ok, seconds) of the most recent calls
+        self._calls: Deque[Tuple[bool, float]] = deque(maxlen=max(window, 1))
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        LLM_BREAKER_OPEN.labels(name).set(0)
+
+    def allow(self) -> bool:
+        """Whether a request may be sent; claims the probe of a cooled-down breaker."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, seconds: float) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    logger.info("Circuit breaker for %s closed", self.name)
+                    self.state = CLOSED
+                    self._calls.clear()
+                    LLM_BREAKER_OPEN.labels(self.name).set(0)
+                else:
+                    self._open()
+            self._calls.append((ok, seconds))
+            if self.state == CLOSED and not ok:
+                failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+                if failures >= self.min_calls and failures / len(self._calls) >= self.error_rate_threshold:
+                    self._open()
+
+    def _open(self) -> None:
+        logger.warning("Circuit breaker for %s opened; retrying it in %ss", self.name, self.cooldown)
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        LLM_BREAKER_OPEN.labels(self.name).set(1)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._calls:
+                return 0.0
+            return sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Seconds within which `percentile`% of recent successful calls finished."""
+        with self._lock:
+            samples = sorted(seconds for ok, seconds in self._calls if ok)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+class ModelRouter:
+    """Sends each LLM request to the first healthy model of a pool.
+
+    The pool is tried in order, skipping models whose circuit breaker is
+    open. With hedging on, a request that outlives the primary's
+    LLM_HEDGE_PERCENTILE latency (at least `hedge_min_delay` seconds) is
+    sent to the next model as well, and the first success wins; a failed
+    request fails over to the next model straight away. Requests run on a
+    shared pool of `hedge_workers` threads, so a hedge never waits on the
+    caller. The losing request is left to finish and only counts towards
+    its model's stats.
+    """
+
+    def __init__(self, models: Sequence[str], client_factory: Callable[[str], Any],
+                 list_models: Optional[Callable[[], Sequence[str]]] = None, hedge: bool = LLM_HEDGE,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 hedge_min_delay: float = LLM_HEDGE_MIN_DELAY_MS / 1000,
+                 hedge_workers: int = LLM_HEDGE_WORKERS, model_list_ttl: float = LLM_MODEL_LIST_TTL):
+        if not models:
+            raise ValueError("At least one model is required")
+        self.models: List[str] = [short_name(model) for model in models]
+        self.client_factory = client_factory
+        self.list_models = list_models
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.model_list_ttl = model_list_ttl
+        self.health: Dict[str, ModelHealth] = {model: ModelHealth(model) for model in self.models}
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._available: Optional[Tuple[float, FrozenSet[str]]] = None
+        self._executor = ThreadPoolExecutor(max_workers=max(hedge_workers, 1),
+                                            thread_name_prefix="llm-request")
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+    def client(self, model: str) -> Any:
+        """The SDK model object for a model name, created on first use."""
+        client = self._clients.get(model)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(model)
+                if client is None:
+                    client = self._clients[model] = self.client_factory(model)
+        return client
+
+    def available_models(self) -> FrozenSet[str]:
+        """Model names the API offers, listed at most once per model_list_ttl."""
+        with self._lock:
+            cached = self._available
+        if cached is not None and time.monotonic() - cached[0] < self.model_list_ttl:
+            return cached[1]
+        if self.list_models is None:
+            return frozenset(self.models)
+        models = frozenset(short_name(model) for model in self.list_models())
+        with self._lock:
+            self._available = (time.monotonic(), models)
+        return models
+
+    def set_primary(self, model: str) -> None:
+        """Route requests to `model` first, keeping the rest of the pool as fallbacks."""
+        model = short_name(model)
+        available = self.available_models()
+        if model not in available:
+            raise ValueError(f"Model {model} is not available. Available Models: {sorted(available)}")
+        with self._lock:
+            self.health.setdefault(model, ModelHealth(model))
+            self.models = [model] + [name for name in self.models if name != model]
+
+    def candidates(self) -> Iterator[str]:
+        """Models to try, in pool order, skipping open breakers; the primary if all are open.
+
+        Lazy, because a half-open breaker hands out its probe as it is asked.
+        """
+        models = list(self.models)
+        allowed = False
+        for model in models:
+            if self.health[model].allow():
+                allowed = True
+                yield model
+        if not allowed:
+            yield models[0]
+
+    def call(self, send: Callable[[str, Any], T],
+             admit: Optional[Callable[[], Any]] = None) -> Tuple[T, str]:
+        """Run send(model_name, client) on the pool; returns its result and the model that served it.
+
+        admit(), if given, runs before every request, hedges and failovers
+        included, and blocks until it may be sent (e.g. for a rate-limit
+        slot). Its errors are raised as they are, except for a hedge's,
+        which only count as that hedge failing. Rate-limit errors are raised
+        at once, without failing over: every model shares the API key's
+        quota, so the scheduler's backoff handles them.
+        """
+        admit = admit or (lambda: None)
+        candidates = self.candidates()
+        leader = next(candidates)
+        if not self.hedge:
+            return self._call_in_order(send, admit, leader, candidates)
+
+        # Set once the call returns, so a hedge still waiting in admit() is not sent
+        answered = threading.Event()
+        admit()
+        pending: Dict[Future, str] = {self._submit(send, leader): leader}
+        errors: List[Exception] = []
+        hedged = False
+        try:
+            while True:
+                timeout = None if hedged else self._hedge_delay(leader)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The leader is slower than usual: race the next model against it
+                    hedged = True
+                    fallback = next(candidates, None)
+                    if fallback is not None:
+                        LLM_HEDGES.labels(leader).inc()
+                        logger.info("Hedging a request to %s with %s", leader, fallback)
+                        pending[self._submit(send, fallback, admit, answered)] = fallback
+                    continue
+                for future in done:
+                    model = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        return future.result(), model
+                    if is_rate_limit_error(error):
+                        raise error
+                    errors.append(error)
+                if not pending:
+                    fallback = next(candidates, None)
+                    if fallback is None:
+                        raise errors[-1]
+                    logger.warning("Failing over from %s to %s: %s", model, fallback, errors[-1])
+                    leader = fallback
+                    admit()
+                    pending[self._submit(send, fallback)] = fallback
+        finally:
+            answered.set()
+
+    def _call_in_order(self, send: Callable[[str, Any], T], admit: Callable[[], Any], model: str,
+                       fallbacks: Iterator[str]) -> Tuple[T, str]:
+        while True:
+            admit()
+            try:
+                return self._attempt(send, model), model
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    raise
+                fallback = next(fallbacks, None)
+                if fallback is None:
+                    raise
+                logger.warning("Failing over from %s to %s: %s", model, fallback, e)
+                model = fallback
+
+    def _hedge_delay(self, model: str) -> float:
+        latency = self.health[model].latency_percentile(self.hedge_percentile)
+        return COLD_HEDGE_DELAY if latency is None else max(latency, self.hedge_min_delay)
+
+    def _submit(self, send: Callable[[str, Any], T], model: str,
+                admit: Optional[Callable[[], Any]] = None,
+                answered: Optional[threading.Event] = None) -> Future:
+        # Each request gets its own copy, so its spans land in the caller's trace
+        return self._executor.submit(contextvars.copy_context().run, self._attempt, send, model,
+                                     admit, answered)
+
+    def _attempt(self, send: Callable[[str, Any], T], model: str,
+                 admit: Optional[Callable[[], Any]] = None,
+                 answered: Optional[threading.Event] = None) -> T:
+        if admit is not None:
+            admit()
+        if answered is not None and answered.is_set():
+            raise CancelledError(f"Request to {model} no longer needed")
+        start = time.perf_counter()
+        try:
+            result = send(model, self.client(model))
+        except Exception as e:
+            if is_rate_limit_error(e):
+                # Quota, not model health
+                LLM_MODEL_CALLS.labels(model, "rate_limited").inc()
+                raise
+            self.health[model].record(False, time.perf_counter() - start)
+            LLM_MODEL_CALLS.labels(model, "error").inc()
+            raise
+        self.health[model].record(True, time.perf_counter() - start)
+        LLM_MODEL_CALLS.labels(model, "ok").inc()
+        return result
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-model breaker state, error rate and hedging percentile, for diagnostics."""
+        return {
+            model: {"state": health.state, "error_rate": health.error_rate(),
+                    "latency_p": health.latency_percentile(self.hedge_percentile)}
+            for model, health in self.health.items()
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,202 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from .config import (LLM_REQUESTS_PER_MINUTE, LLM_BURST, LLM_FAIR_QUANTUM, LLM_QUEUE_TIMEOUT,
+                     LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY)
+from .metrics import LLM_QUEUE_SECONDS, LLM_QUEUE_DEPTH, LLM_RATE_LIMITED, RETRIES
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class RateLimitError(Exception):
+    """An LLM call could not be made within the request quota."""
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for the API's 429 / RESOURCE_EXHAUSTED errors."""
+    # google.api_core errors carry the HTTP status as `code`
+    return getattr(error, "code", None) == 429 or \
+        type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+class TokenBucket:
+    """Allows `rate` requests per second on average and bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0, or the seconds until one is available."""
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def drain(self, now: float) -> None:
+        """Spend every saved token, e.g. after the API reported the quota as exhausted."""
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+
+class _Ticket:
+    __slots__ = ("team_id", "cost", "granted")
+
+    def __init__(self, team_id: str, cost: int):
+        self.team_id = team_id
+        self.cost = cost
+        self.granted = False
+
+class LLMScheduler:
+    """Shares the LLM request quota fairly between workspaces.
+
+    A global token bucket admits `requests_per_minute` calls (0 disables
+    it). While calls are waiting for a token, the next one is picked by
+    deficit round-robin over teams: each team earns `quantum` estimated
+    tokens per round and spends the cost of its calls, so a team sending
+    many or large prompts cannot crowd out the others. Callers block in
+    acquire(); there is no scheduler thread.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE, burst: int = LLM_BURST,
+                 quantum: int = LLM_FAIR_QUANTUM, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+                 retry_max_delay: float = LLM_RETRY_MAX_DELAY):
+        self.bucket = TokenBucket(requests_per_minute / 60, burst) if requests_per_minute > 0 else None
+        self.quantum = max(quantum, 1)
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._cond = threading.Condition()
+        # Teams with waiting calls, in round-robin order, and their FIFOs
+        self._active: Deque[str] = deque()
+        self._queues: Dict[str, Deque[_Ticket]] = {}
+        self._deficit: Dict[str, int] = {}
+        self._waiting = 0
+        LLM_QUEUE_DEPTH.labels().set_function(lambda: self._waiting)
+
+    def acquire(self, team_id: Optional[str], cost: int = 1) -> float:
+        """Block until this team may make one call; returns the seconds waited.
+
+        Raises RateLimitError if no slot is granted within queue_timeout.
+        """
+        team_id = team_id or "unknown"
+        if self.bucket is None:
+            return 0.0
+        start = time.monotonic()
+        ticket = _Ticket(team_id, max(int(cost), 1))
+        with span("llm.queue_wait"), self._cond:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    delay = self._grant()
+                    if ticket.granted:
+                        break
+                    remaining = start + self.queue_timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimitError(f"Waited {self.queue_timeout:g}s for an LLM request slot")
+                    self._cond.wait(min(delay, remaining))
+            finally:
+                if not ticket.granted:
+                    self._cancel(ticket)
+        waited = time.monotonic() - start
+        LLM_QUEUE_SECONDS.labels(team_id).observe(waited)
+        return waited
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        tickets = self._queues.get(ticket.team_id)
+        if tickets is None:
+            tickets = self._queues[ticket.team_id] = deque()
+            self._deficit[ticket.team_id] = 0
+            self._active.append(ticket.team_id)
+        tickets.append(ticket)
+        self._waiting += 1
+
+    def _cancel(self, ticket: _Ticket) -> None:
+        tickets = self._queues[ticket.team_id]
+        tickets.remove(ticket)
+        self._waiting -= 1
+        if not tickets:
+            self._retire(ticket.team_id)
+
+    def _retire(self, team_id: str) -> None:
+        # Idle teams do not bank credit for later bursts
+        del self._queues[team_id]
+        del self._deficit[team_id]
+        self._active.remove(team_id)
+
+    def _grant(self) -> float:
+        """Grant calls while tokens last; returns the seconds until the next token."""
+        granted = False
+        delay = self.queue_timeout
+        while self._active:
+            delay = self.bucket.take(time.monotonic())
+            if delay:
+                break
+            self._next_ticket().granted = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+        return delay
+
+    def _next_ticket(self) -> _Ticket:
+        """Deficit round-robin: serve the head team while its credit covers its next call."""
+        while True:
+            team_id = self._active[0]
+            tickets = self._queues[team_id]
+            if self._deficit[team_id] >= tickets[0].cost:
+                ticket = tickets.popleft()
+                self._deficit[team_id] -= ticket.cost
+                self._waiting -= 1
+                if not tickets:
+                    self._retire(team_id)
+                return ticket
+            self._deficit[team_id] += self.quantum
+            self._active.rotate(-1)
+
+    def rate_limited(self, team_id: Optional[str], attempt: int, error: Exception) -> None:
+        """Handle a 429 on the given attempt: back off with jitter, or raise once out of retries."""
+        team_id = team_id or "unknown"
+        LLM_RATE_LIMITED.labels(team_id).inc()
+        if self.bucket is not None:
+            # The quota is spent for everyone, not just this caller
+            with self._cond:
+                self.bucket.drain(time.monotonic())
+        if attempt >= self.max_retries:
+            raise RateLimitError(f"LLM rate limit exceeded after {attempt + 1} attempts: {error}") from error
+        # Full jitter keeps callers that were throttled together from retrying together
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        logger.warning("LLM rate limited for team %s, retrying in %.1fs", team_id, delay)
+        RETRIES.labels("llm").inc()
+        time.sleep(delay)
+
+    def call(self, team_id: Optional[str], fn: Callable[[], T], cost: int = 1) -> T:
+        """Run fn once admitted, retrying it on rate-limit errors."""
+        def admitted() -> T:
+            self.acquire(team_id, cost)
+            return fn()
+        return self.with_retries(team_id, admitted)
+
+    def with_retries(self, team_id: Optional[str], fn: Callable[[], T]) -> T:
+        """Run fn, retrying it on rate-limit errors; fn acquires its own slots,
+        one per request it sends."""
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self.rate_limited(team_id, attempt, e)
+                attempt += 1
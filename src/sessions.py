@@ -0,0 +1,79 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+from .cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+class ChatSession:
+    """One thread's LLM chat history plus the lock that serializes turns on it.
+
+    The history is kept as plain {"role", "parts"} turns rather than in an
+    SDK chat object, so any model of the pool can answer the next turn.
+    """
+
+    def __init__(self, history: List[dict], pending_prompt: str = "", tokens: int = 0,
+                 context: Any = None):
+        self.history = history
+        self.lock = threading.Lock()
+        # Estimated size of the chat history that is re-sent with every turn
+        self.tokens = tokens
+        # Trailing user messages from the seed history that have not been
+        # answered yet; they are sent along with the next prompt
+        self.pending_prompt = pending_prompt
+        # Running hash of every turn so far, for response cache keys
+        self.context = context
+
+    def take_pending_prompt(self) -> str:
+        pending, self.pending_prompt = self.pending_prompt, ""
+        return pending
+
+    def add_turns(self, prompt: str, response: str) -> None:
+        self.history += [{"role": "user", "parts": [prompt]}, {"role": "model", "parts": [response]}]
+
+class ChatSessionManager:
+    """Keeps one chat session per (team_id, channel, thread_ts), bounded by LRU and idle TTL."""
+
+    def __init__(self, max_sessions: int, idle_ttl: float):
+        self.sessions = TTLCache(maxsize=max_sessions, ttl=idle_ttl)
+        # One lock per key being created, with how many callers hold or wait
+        # on it, so building one thread's session never blocks another's
+        self._creating: Dict[Hashable, List] = {}
+        self._creating_lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], ChatSession]) -> ChatSession:
+        """Return the live session for a key, creating it with the factory on a miss."""
+        session = self.sessions.get(key)
+        if session is MISSING:
+            with self._creating_lock:
+                entry = self._creating.setdefault(key, [threading.Lock(), 0])
+                entry[1] += 1
+            try:
+                with entry[0]:
+                    session = self.sessions.get(key)
+                    if session is MISSING:
+                        logger.info("Starting chat session for %s", key)
+                        session = factory()
+                        self.sessions.set(key, session)
+                        return session
+            finally:
+                with self._creating_lock:
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._creating[key]
+        # Re-inserting refreshes both the LRU position and the idle TTL
+        self.sessions.set(key, session)
+        return session
+
+    def discard(self, key: Hashable) -> None:
+        self.sessions.pop(key)
+
+    def clear(self) -> None:
+        self.sessions.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -0,0 +1,213 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+import zlib
+from typing import Callable, List, Optional
+
+from . import readiness
+from .config import (SHARD_HEARTBEAT_INTERVAL, SHARD_HEARTBEAT_TIMEOUT, SHARD_FORWARD_QUEUE_SIZE,
+                     SHARD_MAX_RESTART_DELAY)
+
+logger = logging.getLogger(__name__)
+
+def shard_for(team_id: Optional[str], shards: int) -> int:
+    """Stable shard index for a team; the same in every process and across restarts."""
+    return zlib.crc32((team_id or "").encode()) % shards
+
+class ShardRouter:
+    """Routes app_mention events to the shard that owns their team.
+
+    Slack spreads Socket Mode events over every open connection regardless
+    of team, so a shard that receives an event for another shard's team
+    forwards it through that shard's inbox. Every mention for a team is
+    therefore handled by one process, which keeps its thread sessions,
+    summaries and write-behind queue local.
+    """
+
+    def __init__(self, index: int, shards: int, inboxes: list):
+        self.index = index
+        self.shards = shards
+        self.inboxes = inboxes
+
+    def owns(self, team_id: Optional[str]) -> bool:
+        return shard_for(team_id, self.shards) == self.index
+
+    def forward(self, team_id: Optional[str], event: dict) -> bool:
+        """Hand an event to its owning shard; False when that shard's inbox is full."""
+        try:
+            self.inboxes[shard_for(team_id, self.shards)].put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def serve(self, handle: Callable[[dict], None], stop: threading.Event) -> None:
+        """Feed events forwarded to this shard into handle until stop is set."""
+        inbox = self.inboxes[self.index]
+        while not stop.is_set():
+            try:
+                event = inbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                # The supervisor is shutting the inboxes down
+                return
+            try:
+                handle(event)
+            except Exception as e:
+                logger.error("Error handling forwarded event: %s", e, exc_info=True)
+
+def run_shard(index: int, shards: int, inboxes: list, heartbeats, log_level: int) -> None:
+    """Worker process entry point: run one SlackBot for the teams of one shard."""
+    from .logs import setup
+    setup(log_level, shard=index)
+    from .bot import SlackBot
+
+    router = ShardRouter(index, shards, inboxes)
+    bot = SlackBot(router=router)
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        if stop.is_set():
+            return
+        stop.set()
+        bot.stop()
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    threading.Thread(target=router.serve, args=(bot.handle_forwarded, stop),
+                     name="shard-inbox", daemon=True).start()
+
+    def heartbeat() -> None:
+        # Only beat while Socket Mode is connected, so a shard that cannot
+        # reconnect is restarted by the supervisor
+        while not stop.wait(SHARD_HEARTBEAT_INTERVAL):
+            if bot.handler.client.is_connected():
+                heartbeats[index] = time.time()
+    threading.Thread(target=heartbeat, name="shard-heartbeat", daemon=True).start()
+
+    logger.info("Starting shard %s of %s", index, shards)
+    bot.start()
+
+class Supervisor:
+    """Runs one bot process per shard and restarts any that die or stop heartbeating."""
+
+    def __init__(self, shards: int, log_level: int = logging.WARNING):
+        self.shards = shards
+        self.log_level = log_level
+        # Spawned rather than forked: the parent may already be running threads
+        self._context = multiprocessing.get_context("spawn")
+        self._manager = None
+        self._inboxes: list = []
+        self._heartbeats = None
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * shards
+        self._started_at = [0.0] * shards
+        self._restarts = [0] * shards
+        self._stop = threading.Event()
+        # Serializes restarts with stop() so no shard is spawned after it
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Apply migrations once, then start every shard."""
+        from .storage import create_storage
+        # Running migrations here keeps shards from racing on first start
+        create_storage().close()
+
+        # Inboxes live in a manager process so a shard killed mid-read
+        # cannot leave its queue locked for the replacement process
+        self._manager = self._context.Manager()
+        self._inboxes = [self._manager.Queue(maxsize=SHARD_FORWARD_QUEUE_SIZE)
+                         for _ in range(self.shards)]
+        self._heartbeats = self._context.Array("d", self.shards, lock=False)
+        for index in range(self.shards):
+            self._spawn(index)
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_shard, name=f"slamobot-shard-{index}",
+            args=(index, self.shards, self._inboxes, self._heartbeats, self.log_level)
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.time()
+        self._heartbeats[index] = 0.0
+        logger.info("Started shard %s (pid %s)", index, process.pid)
+
+    def status(self) -> List[dict]:
+        now = time.time()
+        result = []
+        for index, process in enumerate(self._processes):
+            last_seen = max(self._heartbeats[index], self._started_at[index])
+            result.append({
+                "shard": index,
+                "pid": process.pid if process else None,
+                "alive": bool(process and process.is_alive()),
+                "seconds_since_heartbeat": round(now - last_seen, 1),
+                "restarts": self._restarts[index]
+            })
+        return result
+
+    def ready_state(self) -> str:
+        """READY once every shard is alive and has heartbeated since it last started."""
+        if all(process is not None and process.is_alive() and
+               self._heartbeats[index] >= self._started_at[index]
+               for index, process in enumerate(self._processes)):
+            return readiness.READY
+        return readiness.STARTING
+
+    def monitor(self) -> None:
+        """Watch the shards until stop() is called, restarting unhealthy ones."""
+        next_attempt = [0.0] * self.shards
+        while not self._stop.wait(SHARD_HEARTBEAT_INTERVAL):
+            now = time.time()
+            for index, process in enumerate(self._processes):
+                # New processes get one timeout period to connect before their first beat
+                last_seen = max(self._heartbeats[index], self._started_at[index])
+                if process.is_alive() and now - last_seen <= SHARD_HEARTBEAT_TIMEOUT:
+                    if now - self._started_at[index] > SHARD_MAX_RESTART_DELAY:
+                        self._restarts[index] = 0
+                    continue
+                if now < next_attempt[index]:
+                    continue
+                with self._lock:
+                    if self._stop.is_set():
+                        return
+                    if process.is_alive():
+                        logger.error("Shard %s missed heartbeats for %.0fs, restarting",
+                                     index, now - last_seen)
+                        self._terminate(process)
+                    else:
+                        logger.error("Shard %s exited with code %s, restarting", index, process.exitcode)
+                    self._restarts[index] += 1
+                    # Back off exponentially while a shard keeps failing
+                    delay = min(SHARD_MAX_RESTART_DELAY, 2 ** (self._restarts[index] - 1))
+                    next_attempt[index] = now + delay
+                    self._spawn(index)
+
+    def stop(self, timeout: float = 30) -> None:
+        """Ask every shard to drain and exit, then shut the inboxes down."""
+        with self._lock:
+            self._stop.set()
+            processes = [process for process in self._processes if process is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.time() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    @staticmethod
+    def _terminate(process: multiprocessing.Process, timeout: float = 10) -> None:
+        process.terminate()
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
@@ -0,0 +1,274 @@
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Protocol, Tuple
+
+from .config import STORAGE_BACKEND
+from .context import estimate_tokens
+from .metrics import RETRIEVAL_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+class Storage(Protocol):
+    """Everything the bot, web routes, summarizer and retention job need from a backend.
+
+    Implemented by the SQLite `Database` (src/db.py), `MemoryStorage` below
+    and `PostgresStorage` (src/postgres.py). Message ids only have to
+    increase within a thread; summaries and retention rely on that order.
+    """
+
+    def get_workspaces(self) -> List[Tuple[str, str, str, str]]: ...
+
+    def get_workspace(self, team_id: str) -> Optional[Dict[str, str]]: ...
+
+    def add_workspace(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> bool: ...
+
+    def store_message(self, team_id: str, channel_id: str, thread_ts: str, user_id: str,
+                      message: str, is_bot: bool, model: Optional[str] = None) -> None: ...
+
+    def get_thread_history(self, team_id: str, channel_id: str, thread_ts: str,
+                           limit: int = 5) -> List[Tuple[str, bool]]: ...
+
+    def get_context_messages(self, team_id: str, channel_id: str, thread_ts: str,
+                             limit: int, after_id: int = 0) -> List[Tuple[str, bool, int]]: ...
+
+    def get_messages_after(self, team_id: str, channel_id: str, thread_ts: str, after_id: int,
+                           limit: int) -> List[Tuple[int, str, bool]]: ...
+
+    def get_channel_messages(self, team_id: str, channel_id: str, since: float, limit: int,
+                             after: Optional[Tuple[float, int]] = None
+                             ) -> List[Tuple[int, str, str, bool, float]]: ...
+
+    def search_messages(self, team_id: str, channel_id: str, terms: List[str],
+                        exclude_thread_ts: str, limit: int,
+                        time_budget: float) -> List[Tuple[str, bool, str]]: ...
+
+    def get_thread_summary(self, team_id: str, channel_id: str,
+                           thread_ts: str) -> Optional[Tuple[str, int]]: ...
+
+    def save_thread_summary(self, team_id: str, channel_id: str, thread_ts: str,
+                            summary: str, last_message_id: int) -> None: ...
+
+    def get_retention_policies(self) -> Dict[str, float]: ...
+
+    def set_retention_policy(self, team_id: str, ttl_days: float) -> None: ...
+
+    def delete_retention_policy(self, team_id: str) -> None: ...
+
+    def claim_event(self, event_hash: int, expires_at: float) -> bool: ...
+
+    def purge_processed_events(self, now: float) -> int: ...
+
+    def archive_expired_threads(self, team_id: str, cutoff: float, limit: int,
+                                sink: Callable[[List[dict]], None]) -> Tuple[int, int]: ...
+
+    def reclaim_space(self, pages: int = 0) -> int: ...
+
+    def storage_stats(self) -> dict: ...
+
+    def ping(self) -> None: ...
+
+    def flush(self) -> None: ...
+
+    def close(self) -> None: ...
+
+# Columns of an archived message row, shared by every backend
+ARCHIVE_COLUMNS = ("id", "team_id", "channel", "thread_ts", "user_id", "message", "is_bot",
+                   "timestamp", "token_count", "model")
+
+class MemoryStorage:
+    """Process-local storage: a dict of per-thread deques behind one lock.
+
+    Nothing survives a restart, so this backend is meant for tests,
+    benchmarks and local experiments. `max_thread_messages` optionally
+    caps each thread's deque, dropping its oldest messages first.
+    """
+
+    def __init__(self, max_thread_messages: Optional[int] = None):
+        self.max_thread_messages = max_thread_messages
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._workspaces: Dict[str, Tuple[str, str, str, str]] = {}
+        # (team_id, channel, thread_ts) -> (id, user_id, message, is_bot, timestamp, tokens)
+        self._threads: Dict[Tuple[str, str, str], Deque[tuple]] = {}
+        self._summaries: Dict[Tuple[str, str, str], Tuple[str, int]] = {}
+        self._policies: Dict[str, float] = {}
+        self._events: Dict[int, float] = {}
+
+    def get_workspaces(self) -> List[Tuple[str, str, str, str]]:
+        with self._lock:
+            return list(self._workspaces.values())
+
+    def get_workspace(self, team_id: str) -> Optional[Dict[str, str]]:
+        row = self._workspaces.get(team_id)
+        if row is None:
+            return None
+        return dict(zip(("team_id", "team_name", "bot_token", "bot_id"), row))
+
+    def add_workspace(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> bool:
+        with self._lock:
+            self._workspaces[team_id] = (team_id, team_name, bot_token, bot_id)
+        return True
+
+    def store_message(self, team_id: str, channel_id: str, thread_ts: str, user_id: str,
+                      message: str, is_bot: bool, model: Optional[str] = None) -> None:
+        tokens = estimate_tokens(message)
+        key = (team_id, channel_id, thread_ts)
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None:
+                thread = self._threads[key] = deque(maxlen=self.max_thread_messages)
+            # Ids are taken under the lock so they increase along each deque
+            thread.append((next(self._ids), user_id, message, bool(is_bot), time.time(), tokens, model))
+
+    def _newest(self, key: Tuple[str, str, str], limit: int, after_id: int = 0) -> List[tuple]:
+        """Up to `limit` of a thread's newest rows with id > after_id, oldest first."""
+        if limit <= 0:
+            return []
+        with self._lock:
+            newest = itertools.takewhile(lambda row: row[0] > after_id,
+                                         reversed(self._threads.get(key, ())))
+            rows = list(itertools.islice(newest, limit))
+        rows.reverse()
+        return rows
+
+    def get_thread_history(self, team_id: str, channel_id: str, thread_ts: str,
+                           limit: int = 5) -> List[Tuple[str, bool]]:
+        return [(row[2], row[3]) for row in self._newest((team_id, channel_id, thread_ts), limit)]
+
+    def get_context_messages(self, team_id: str, channel_id: str, thread_ts: str,
+                             limit: int, after_id: int = 0) -> List[Tuple[str, bool, int]]:
+        rows = self._newest((team_id, channel_id, thread_ts), limit, after_id)
+        return [(row[2], row[3], row[5]) for row in rows]
+
+    def get_messages_after(self, team_id: str, channel_id: str, thread_ts: str, after_id: int,
+                           limit: int) -> List[Tuple[int, str, bool]]:
+        with self._lock:
+            thread = self._threads.get((team_id, channel_id, thread_ts), ())
+            rows = itertools.dropwhile(lambda row: row[0] <= after_id, thread)
+            return [(row[0], row[2], row[3]) for row in itertools.islice(rows, max(limit, 0))]
+
+    def get_channel_messages(self, team_id: str, channel_id: str, since: float, limit: int,
+                             after: Optional[Tuple[float, int]] = None
+                             ) -> List[Tuple[int, str, str, bool, float]]:
+        """One page of the channel's messages since a timestamp, in (timestamp, id) order."""
+        cursor = after or (since, 0)
+        with self._lock:
+            rows = [(row[4], row[0], row[1], row[2], row[3]) for key, thread in self._threads.items()
+                    if key[0] == team_id and key[1] == channel_id for row in thread]
+        rows = sorted(row for row in rows if row[:2] > cursor)[:max(limit, 0)]
+        return [(row_id, user_id, message, is_bot, timestamp)
+                for timestamp, row_id, user_id, message, is_bot in rows]
+
+    def search_messages(self, team_id: str, channel_id: str, terms: List[str],
+                        exclude_thread_ts: str, limit: int,
+                        time_budget: float) -> List[Tuple[str, bool, str]]:
+        """Rank the channel's other messages by how many of the terms they contain."""
+        deadline = time.monotonic() + time_budget
+        wanted = set(terms)
+        with self._lock:
+            threads = [(key[2], list(rows)) for key, rows in self._threads.items()
+                       if key[0] == team_id and key[1] == channel_id and key[2] != exclude_thread_ts]
+        scored = []
+        for thread_ts, rows in threads:
+            if time.monotonic() > deadline:
+                RETRIEVAL_TIMEOUTS.labels().inc()
+                logger.warning("Message search for team %s exceeded its time budget", team_id)
+                return []
+            for row in rows:
+                score = len(wanted.intersection(re.findall(r"\w+", row[2].lower())))
+                if score:
+                    # Ties go to the newest message
+                    scored.append((score, row[0], row[2], row[3], thread_ts))
+        scored.sort(reverse=True)
+        return [(message, is_bot, thread_ts) for _, _, message, is_bot, thread_ts in scored[:limit]]
+
+    def get_thread_summary(self, team_id: str, channel_id: str,
+                           thread_ts: str) -> Optional[Tuple[str, int]]:
+        return self._summaries.get((team_id, channel_id, thread_ts))
+
+    def save_thread_summary(self, team_id: str, channel_id: str, thread_ts: str,
+                            summary: str, last_message_id: int) -> None:
+        with self._lock:
+            self._summaries[(team_id, channel_id, thread_ts)] = (summary, last_message_id)
+
+    def get_retention_policies(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._policies)
+
+    def set_retention_policy(self, team_id: str, ttl_days: float) -> None:
+        with self._lock:
+            self._policies[team_id] = ttl_days
+
+    def delete_retention_policy(self, team_id: str) -> None:
+        with self._lock:
+            self._policies.pop(team_id, None)
+
+    def claim_event(self, event_hash: int, expires_at: float) -> bool:
+        with self._lock:
+            if self._events.get(event_hash, 0.0) > time.time():
+                return False
+            self._events[event_hash] = expires_at
+            return True
+
+    def purge_processed_events(self, now: float) -> int:
+        with self._lock:
+            expired = [key for key, expires_at in self._events.items() if expires_at <= now]
+            for key in expired:
+                del self._events[key]
+        return len(expired)
+
+    def archive_expired_threads(self, team_id: str, cutoff: float, limit: int,
+                                sink: Callable[[List[dict]], None]) -> Tuple[int, int]:
+        """Hand up to `limit` threads idle since cutoff to sink, then drop them."""
+        with self._lock:
+            expired = [key for key, rows in self._threads.items()
+                       if key[0] == team_id and rows and rows[-1][4] < cutoff][:limit]
+            archived = [
+                dict(zip(ARCHIVE_COLUMNS, (row[0],) + key + row[1:]))
+                for key in expired for row in self._threads[key]
+            ]
+            if archived:
+                sink(archived)
+            for key in expired:
+                del self._threads[key]
+                self._summaries.pop(key, None)
+        return len(expired), len(archived)
+
+    def reclaim_space(self, pages: int = 0) -> int:
+        # Dropped deques are freed by the garbage collector
+        return 0
+
+    def storage_stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "threads": len(self._threads),
+                "messages": sum(len(rows) for rows in self._threads.values())
+            }
+
+    def ping(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """Build the storage backend named by STORAGE_BACKEND."""
+    backend = backend.lower()
+    if backend == "sqlite":
+        # Imported here because db.py uses this module for get_database()
+        from .db import Database
+        return Database()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "postgres":
+        from .postgres import PostgresStorage
+        return PostgresStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; use sqlite, memory or postgres")
@@ -0,0 +1,80 @@
+import logging
+import time
+from typing import Optional
+
+from slack_sdk.errors import SlackApiError
+
+from .metrics import RETRIES, SLACK_POST_SECONDS
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TEXT = "_Thinking…_ ⏳"
+
+class StreamingReply:
+    """A Slack message that is posted early and edited in place as LLM output arrives.
+
+    Appended text is coalesced and only pushed with chat.update once every
+    `min_interval` seconds, which keeps a reply well inside Slack's
+    per-channel update limits. A 429 pushes the next update back by the
+    Retry-After delay instead of failing the reply.
+    """
+
+    def __init__(self, client, channel: str, thread_ts: str, min_interval: float):
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.min_interval = min_interval
+        self.ts: Optional[str] = None
+        self.text = ""
+        self._sent_length = 0
+        self._next_update_at = 0.0
+        # Set by a 429; unlike the coalescing interval, the final update waits for it
+        self._retry_at = 0.0
+
+    def start(self) -> None:
+        """Post the placeholder message that later updates edit."""
+        with SLACK_POST_SECONDS.labels("chat_postMessage").time(), span("slack.chat_postMessage"):
+            response = self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, text=PLACEHOLDER_TEXT
+            )
+        self.ts = response["ts"]
+
+    def append(self, chunk: str) -> None:
+        """Add streamed text, updating the message if the interval has passed.
+
+        The first chunk is shown at once.
+        """
+        self.text += chunk
+        if time.monotonic() >= self._next_update_at and len(self.text) != self._sent_length:
+            self._update(text=self.text + " ▍")
+
+    def finish(self, text: str, blocks: Optional[list] = None) -> None:
+        """Replace the message with the final text and blocks, waiting out rate limits.
+
+        Sent straight away unless a 429 asked to wait, whatever the interval.
+        """
+        while True:
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if self._update(text=text, blocks=blocks):
+                return
+
+    def _update(self, text: str, blocks: Optional[list] = None) -> bool:
+        kwargs = {"blocks": blocks} if blocks is not None else {}
+        try:
+            with SLACK_POST_SECONDS.labels("chat_update").time(), span("slack.chat_update"):
+                self.client.chat_update(channel=self.channel, ts=self.ts, text=text, **kwargs)
+        except SlackApiError as e:
+            if e.response.status_code != 429:
+                raise
+            RETRIES.labels("chat_update").inc()
+            headers = e.response.headers
+            retry_after = float(headers.get("Retry-After") or headers.get("retry-after") or 1)
+            logger.warning("chat.update rate limited in %s, retrying in %ss", self.channel, retry_after)
+            self._retry_at = self._next_update_at = time.monotonic() + retry_after
+            return False
+        self._sent_length = len(self.text)
+        self._next_update_at = time.monotonic() + self.min_interval
+        return True
@@ -0,0 +1,102 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set, Tuple
+
+from .context import truncate_to_tokens
+from .storage import Storage
+from .llm import LLM
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+Update the running summary of a Slack thread between a user and a bot.
+Keep every fact, decision, open question and name that later replies may
+need. Write at most {max_tokens} tokens of plain prose and reply with the
+summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+class ThreadSummarizer:
+    """Folds older thread messages into a rolling summary in the background.
+
+    Once a thread has more than `trigger` messages after its summary, every
+    message except the newest `keep_recent` is folded into the summary in a
+    single LLM call. Only messages after the summary's last_message_id are
+    ever sent, so each update costs the same however long the thread gets.
+    """
+
+    def __init__(self, db: Storage, model: LLM, trigger: int, keep_recent: int,
+                 max_tokens: int, message_max_tokens: int):
+        self.db = db
+        self.model = model
+        self.trigger = trigger
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+        self.message_max_tokens = message_max_tokens
+        # One worker keeps summarization off the reply path without
+        # competing with mentions for the LLM quota
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self._scheduled: Set[Tuple[str, str, str]] = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def schedule(self, team_id: str, channel_id: str, thread_ts: str) -> None:
+        """Queue a summary update for a thread unless one is already queued.
+
+        A no-op after shutdown(), so mentions still finishing then are not failed.
+        """
+        key = (team_id, channel_id, thread_ts)
+        with self._lock:
+            if self._shutdown or key in self._scheduled:
+                return
+            self._scheduled.add(key)
+            self._executor.submit(self._run, key)
+
+    def _run(self, key: Tuple[str, str, str]) -> None:
+        with self._lock:
+            self._scheduled.discard(key)
+        try:
+            self.update(*key)
+        except Exception as e:
+            logger.error("Error summarizing thread %s: %s", key, e, exc_info=True)
+
+    def update(self, team_id: str, channel_id: str, thread_ts: str) -> Optional[str]:
+        """Fold unsummarized messages into the thread summary if enough have piled up."""
+        current = self.db.get_thread_summary(team_id, channel_id, thread_ts)
+        summary, last_id = current if current else ("", 0)
+
+        # Bounded so one pass never sends an unbounded backlog to the LLM
+        limit = self.trigger + self.keep_recent
+        messages = self.db.get_messages_after(team_id, channel_id, thread_ts, last_id, limit=limit)
+        if len(messages) <= self.trigger:
+            return None
+        fold = messages[:len(messages) - self.keep_recent]
+        if not fold:
+            return None
+
+        transcript = "\n".join(
+            f"{'Bot' if is_bot else 'User'}: {truncate_to_tokens(message, self.message_max_tokens)}"
+            for _, message, is_bot in fold
+        )
+        prompt = SUMMARY_PROMPT.format(max_tokens=self.max_tokens,
+                                       summary=summary or "(none yet)",
+                                       messages=transcript)
+        new_summary = truncate_to_tokens(self.model.generate(prompt, team_id=team_id).strip(), self.max_tokens)
+        self.db.save_thread_summary(team_id, channel_id, thread_ts, new_summary, fold[-1][0])
+        logger.info("Summarized %s messages for thread %s", len(fold), thread_ts)
+
+        # A long backlog (e.g. right after enabling summaries) takes several passes
+        if len(messages) == limit:
+            self.schedule(team_id, channel_id, thread_ts)
+        return new_summary
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._shutdown = True
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,162 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .config import TRACE_ENABLED, TRACE_SLOW_MS, TRACE_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """Timed spans for one unit of work, such as a single app_mention."""
+
+    def __init__(self, name: str, started: Optional[float] = None, **attributes: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        # perf_counter() for span offsets, wall clock only for display
+        self.started = time.perf_counter() if started is None else started
+        self.started_at = time.time() - (time.perf_counter() - self.started)
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, error: Optional[str] = None) -> None:
+        """Record a span that started at perf_counter() value `start`."""
+        span = {"name": name, "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3)}
+        if error:
+            span["error"] = error
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started
+
+    @property
+    def duration_ms(self) -> float:
+        return round((self.duration or 0.0) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        result = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "duration_ms": self.duration_ms,
+            "spans": spans,
+        }
+        result.update(self.attributes)
+        if self.error:
+            result["error"] = self.error
+        return result
+
+class SlowTraceLog:
+    """Ring buffer of the most recent traces that exceeded the slow threshold."""
+
+    def __init__(self, maxlen: int, threshold_ms: float):
+        self.threshold_ms = threshold_ms
+        self._traces: Deque[Trace] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, trace: Trace) -> bool:
+        """Keep and log the trace if it was slow; return whether it was."""
+        if trace.duration_ms < self.threshold_ms:
+            return False
+        with self._lock:
+            self._traces.append(trace)
+        breakdown = ", ".join(f"{span['name']}={span['duration_ms']:.0f}ms"
+                              for span in trace.to_dict()["spans"])
+        logger.warning("Slow %s trace %s took %.0fms: %s",
+                       trace.name, trace.trace_id, trace.duration_ms, breakdown)
+        return True
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the newest slow traces first."""
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+SLOW_TRACES = SlowTraceLog(maxlen=TRACE_BUFFER_SIZE, threshold_ms=TRACE_SLOW_MS)
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+def new_trace(name: str, started: Optional[float] = None, **attributes: Any) -> Optional[Trace]:
+    """Create a trace, or None when tracing is disabled."""
+    if not TRACE_ENABLED:
+        return None
+    return Trace(name, started=started, **attributes)
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.trace_id if trace is not None else None
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Make a trace current for this thread, then finish it and keep it if slow.
+
+    Traces are handed between threads explicitly (e.g. from a Bolt listener
+    to a dispatcher worker) because context variables do not follow work
+    submitted to a thread pool.
+    """
+    if trace is None:
+        yield None
+        return
+    token = _current.set(trace)
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        trace.finish()
+        SLOW_TRACES.record(trace)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a stage of the current trace; a no-op outside of a trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start, error)
+
+def traced(name: Optional[str] = None):
+    """Decorator that records each call as a span of the current trace."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
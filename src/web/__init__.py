@@ -1,4 +1,5 @@
 import logging
+import threading
 from flask import Flask
 from .. import config
 
@@ -7,16 +8,33 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Configure Flask app
-app.config.update(
-    SLACK_CLIENT_ID=config.SLACK_CLIENT_ID,
-    SLACK_CLIENT_SECRET=config.SLACK_CLIENT_SECRET
-)
+_configured = False
+_configure_lock = threading.Lock()
 
-# Log configuration status
-if app.config['SLACK_CLIENT_ID'] and app.config['SLACK_CLIENT_SECRET']:
-    logger.info("Flask app configured with Slack OAuth credentials")
-else:
-    logger.error("Flask app missing Slack OAuth credentials")
+def create_app() -> Flask:
+    """App factory for WSGI servers, e.g. gunicorn 'src.web:create_app()'.
 
-from . import routes  # Import routes after app creation to avoid circular imports
+    Checks configuration and registers the routes on first call; the
+    database is only opened by the first request that needs it.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return app
+        config.validate()
+
+        # Configure Flask app
+        app.config.update(
+            SLACK_CLIENT_ID=config.SLACK_CLIENT_ID,
+            SLACK_CLIENT_SECRET=config.SLACK_CLIENT_SECRET
+        )
+
+        # Log configuration status
+        if app.config['SLACK_CLIENT_ID'] and app.config['SLACK_CLIENT_SECRET']:
+            logger.info("Flask app configured with Slack OAuth credentials")
+        else:
+            logger.error("Flask app missing Slack OAuth credentials")
+
+        from . import routes  # Registers the routes on app
+        _configured = True
+    return app
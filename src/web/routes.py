@@ -1,20 +1,23 @@
-from flask import render_template, request, redirect, url_for
-import requests
+from flask import render_template, request, redirect, url_for, Response
+import hmac
 import logging
 import os
 from . import app
-from ..db import Database
+from ..auth import get_authorizer
+from ..db import get_database
+from ..http_client import slack_api_call
 from .. import config
+from .. import metrics
+from .. import readiness
+from ..tracing import SLOW_TRACES
+from ..workspaces import get_registry
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Initialize database
-db = Database()
-
 @app.route('/health')
 def health():
-    """Health check endpoint that also verifies environment variables."""
+    """Web readiness: required environment variables are set and the database answers."""
     required_vars = {
         'SLACK_CLIENT_ID': config.SLACK_CLIENT_ID,
         'SLACK_CLIENT_SECRET': config.SLACK_CLIENT_SECRET,
@@ -31,6 +34,16 @@ def health():
             'missing_env_vars': missing_vars
         }, 500
         
+    # Actually touch the database rather than assuming it is reachable
+    try:
+        get_database().ping()
+    except Exception as e:
+        logger.error("Health check database error: %s", e)
+        return {
+            'status': 'error',
+            'database': str(e)
+        }, 503
+
     # Include first few chars of client ID for verification
     safe_client_id = f"{config.SLACK_CLIENT_ID[:6]}..." if config.SLACK_CLIENT_ID else "None"
     
@@ -38,7 +51,41 @@ def health():
         'status': 'healthy',
         'database': 'connected',
         'client_id_preview': safe_client_id,
-        'env_vars': 'all present'
+        'env_vars': 'all present',
+        'auth_cache': get_authorizer().stats(),
+        # Informational: the web server is healthy while the bot is still connecting
+        'bot': readiness.state('bot')
+    }
+
+@app.route('/health/bot')
+def bot_health():
+    """Bot readiness, reported separately so deploys do not wait on Socket Mode."""
+    state = readiness.state('bot')
+    return {'bot': state}, 200 if state == readiness.READY else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+def _is_admin() -> bool:
+    """Check the request's bearer token against ADMIN_TOKEN."""
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode())
+
+@app.route('/admin/traces')
+def admin_traces():
+    """Most recent slow mention traces, newest first."""
+    if not config.ADMIN_TOKEN:
+        return {'error': 'admin routes are disabled'}, 404
+    if not _is_admin():
+        return {'error': 'unauthorized'}, 401
+
+    limit = request.args.get('limit', type=int)
+    return {
+        'threshold_ms': SLOW_TRACES.threshold_ms,
+        'traces': SLOW_TRACES.recent(limit)
     }
 
 @app.route('/')
@@ -51,7 +98,7 @@ def index():
     
     # Log the client ID (first few characters for debugging)
     safe_client_id = f"{config.SLACK_CLIENT_ID[:6]}..." if config.SLACK_CLIENT_ID else "None"
-    logger.info(f"Using Slack Client ID: {safe_client_id}")
+    logger.info("Using Slack Client ID: %s", safe_client_id)
     
     return render_template('index.html', client_id=config.SLACK_CLIENT_ID)
 
@@ -65,18 +112,15 @@ def oauth_redirect():
 
     # Exchange code for tokens
     try:
-        response = requests.post(
-            'https://slack.com/api/oauth.v2.access',
-            data={
-                'code': code,
-                'client_id': config.SLACK_CLIENT_ID,
-                'client_secret': config.SLACK_CLIENT_SECRET
-            }
-        ).json()
+        response = slack_api_call('oauth.v2.access', {
+            'code': code,
+            'client_id': config.SLACK_CLIENT_ID,
+            'client_secret': config.SLACK_CLIENT_SECRET
+        })
 
         if not response.get('ok'):
             error_msg = response.get('error', 'Unknown error')
-            logger.error(f"Slack OAuth error: {error_msg}")
+            logger.error("Slack OAuth error: %s", error_msg)
             return render_template('error.html', error=f"Slack error: {error_msg}")
 
         try:
@@ -86,27 +130,21 @@ def oauth_redirect():
             bot_token = response['access_token']
             bot_id = response['bot_user_id']
 
-            logger.info(f"Received OAuth tokens for workspace: {team_name} ({team_id})")
-            logger.info(f"Bot User ID: {bot_id}")
-
-            # Add workspace to database
-            if not db.add_workspace(team_id, team_name, bot_token, bot_id):
-                raise Exception("Failed to store workspace in database")
+            logger.info("Received OAuth tokens for workspace: %s (%s)", team_name, team_id)
+            logger.info("Bot User ID: %s", bot_id)
 
-            # Initialize bot for this workspace
-            from .. import bot
-            bot_instance = bot.SlackBot()
-            bot_instance.add_workspace(team_id, team_name, bot_token, bot_id)
+            # One write; the running bot sees the workspace on its next event
+            get_registry().register(team_id, team_name, bot_token, bot_id)
 
-            logger.info(f"Successfully set up workspace: {team_name}")
+            logger.info("Successfully set up workspace: %s", team_name)
             return render_template('success.html', team_name=team_name)
             
         except KeyError as e:
-            logger.error(f"Invalid Slack response: missing {str(e)}")
-            logger.error(f"Response data: {response}")
+            logger.error("Invalid Slack response: missing %s", e)
+            logger.error("Response data: %s", response)
             return render_template('error.html', 
                                 error=f"Invalid response from Slack: missing {str(e)}")
 
     except Exception as e:
-        logger.error(f"OAuth error: {str(e)}", exc_info=True)
+        logger.error("OAuth error: %s", e, exc_info=True)
         return render_template('error.html', error=str(e))
@@ -0,0 +1,54 @@
+import logging
+import threading
+from typing import Optional
+
+from .auth import WorkspaceAuthorizer, get_authorizer
+from .db import get_database
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+class WorkspaceRegistry:
+    """Records installed workspaces and makes them visible to the running bot.
+
+    Installs only need the shared Database and authorizer, so registering a
+    workspace never builds a Bolt app, LLM client or Socket Mode connection.
+    The bot picks up a new or re-installed workspace because its cached
+    authorization for that team is dropped; caches in other processes
+    expire through AUTH_CACHE_TTL and AUTH_NEGATIVE_CACHE_TTL.
+    """
+
+    def __init__(self, db: Optional[Storage] = None, authorizer: Optional[WorkspaceAuthorizer] = None):
+        self._db = db
+        self._authorizer = authorizer
+
+    @property
+    def db(self) -> Storage:
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    @property
+    def authorizer(self) -> WorkspaceAuthorizer:
+        if self._authorizer is None:
+            self._authorizer = get_authorizer()
+        return self._authorizer
+
+    def register(self, team_id: str, team_name: str, bot_token: str, bot_id: str) -> None:
+        """Store a workspace's bot credentials and invalidate its cached authorization."""
+        if not self.db.add_workspace(team_id, team_name, bot_token, bot_id):
+            raise Exception("Failed to store workspace in database")
+        self.authorizer.invalidate(team_id)
+        logger.info("Registered workspace %s (%s)", team_id, team_name)
+
+_registry: Optional[WorkspaceRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> WorkspaceRegistry:
+    """Return the process-wide registry shared by the bot and web routes."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = WorkspaceRegistry()
+    return _registry
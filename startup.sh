@@ -54,4 +54,4 @@ echo -e "\n=== All required environment variables are set ==="
 echo "Starting application..."
 
 # Start the application with verbose logging
-exec python main.py --verbose
+exec python main.py --verbose --server "${WEB_SERVER:-waitress}"
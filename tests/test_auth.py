@@ -0,0 +1,53 @@
+from src.auth import WorkspaceAuthorizer
+from src.storage import MemoryStorage
+from src.workspaces import WorkspaceRegistry
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get_workspace(self, team_id):
+        self.lookups += 1
+        return super().get_workspace(team_id)
+
+
+def make_registry():
+    db = CountingStorage()
+    authorizer = WorkspaceAuthorizer(db)
+    return WorkspaceRegistry(db, authorizer), authorizer, db
+
+
+def test_authorizations_are_cached():
+    registry, authorizer, db = make_registry()
+    registry.register("T1", "Team", "xoxb-1", "B1")
+    assert authorizer.authorize(None, "T1").bot_token == "xoxb-1"
+    assert authorizer.authorize(None, "T1").bot_token == "xoxb-1"
+    assert db.lookups == 1
+
+
+def test_reinstall_replaces_the_cached_token():
+    registry, authorizer, db = make_registry()
+    registry.register("T1", "Team", "xoxb-1", "B1")
+    assert authorizer.authorize(None, "T1").bot_token == "xoxb-1"
+    registry.register("T1", "Team", "xoxb-2", "B1")
+    assert authorizer.authorize(None, "T1").bot_token == "xoxb-2"
+
+
+def test_install_clears_a_cached_miss():
+    registry, authorizer, db = make_registry()
+    assert authorizer.authorize(None, "T1") is None
+    assert authorizer.authorize(None, "T1") is None
+    assert db.lookups == 1
+    registry.register("T1", "Team", "xoxb-1", "B1")
+    assert authorizer.authorize(None, "T1").bot_token == "xoxb-1"
+
+
+def test_register_only_invalidates_its_team():
+    registry, authorizer, db = make_registry()
+    registry.register("T1", "Team", "xoxb-1", "B1")
+    authorizer.authorize(None, "T1")
+    registry.register("T2", "Other", "xoxb-2", "B2")
+    authorizer.authorize(None, "T1")
+    assert db.lookups == 1
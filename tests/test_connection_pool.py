@@ -0,0 +1,46 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.db import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "messages.db"), write_behind=False)
+    yield database
+    database.close()
+
+
+def test_each_thread_reuses_its_own_connection(db):
+    main = db.get_connection()
+    assert db.get_connection() is main
+    others = []
+    thread = threading.Thread(target=lambda: others.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    assert others[0] is not main
+    assert len(db._connections) == 2
+
+
+def test_connections_use_wal(db):
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+
+
+def test_close_closes_every_pooled_connection(db):
+    threads = [threading.Thread(target=db.get_connection) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connections = list(db._connections)
+    db.close()
+    assert db._connections == []
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # The instance opens fresh connections if used again
+    assert db.get_workspace("T1") is None
@@ -0,0 +1,23 @@
+from src.context import ELISION_MARKER, build_context, estimate_tokens
+
+
+def rows(*texts):
+    return [(text, index % 2 == 1, estimate_tokens(text)) for index, text in enumerate(texts)]
+
+
+def test_newest_messages_fit_the_budget():
+    messages = rows("one two three", "four five", "six")
+    assert build_context(messages, budget=3, max_message_tokens=10) == [("four five", True), ("six", False)]
+
+
+def test_no_budget_sends_nothing():
+    assert build_context(rows("hello there"), budget=0, max_message_tokens=10) == []
+
+
+def test_no_turn_is_only_an_elision_marker():
+    marker = ELISION_MARKER.split("{}")[0]
+    messages = rows("word " * 50, "short")
+    context = build_context(messages, budget=100, max_message_tokens=0)
+    assert context == []
+    context = build_context(rows("word " * 50), budget=5, max_message_tokens=100)
+    assert len(context) == 1 and context[0][0].strip() and not context[0][0].startswith(marker)
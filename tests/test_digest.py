@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+from slack_sdk.errors import SlackApiError
+
+from src.bot import SlackBot
+from src.config import DIGEST_DEFAULT_HOURS
+from src.digest import ChannelDigester, parse_digest_request
+from src.storage import MemoryStorage
+
+
+@pytest.mark.parametrize("text, hours", [
+    ("<@U1> digest", DIGEST_DEFAULT_HOURS),
+    ("digest 6h", 6),
+    ("<@U1> digest the last 2 days", 48),
+    ("<@U1> summarize this channel", DIGEST_DEFAULT_HOURS),
+    ("<@U1> summarise this channel for the last 12 hours.", 12),
+    ("<@U1> summarize the last 3h", 3),
+    ("<@U01D> digest", DIGEST_DEFAULT_HOURS),
+])
+def test_digest_commands(text, hours):
+    assert parse_digest_request(text) == hours
+
+
+@pytest.mark.parametrize("text", [
+    "<@U1> summarize this thread",
+    "summarize this: hello",
+    "<@U1> summarize",
+    "<@U1> summarize the last 3 messages",
+    "<@U1> summarize this channel's pinned doc please",
+    "<@U1> digest this article for me",
+    "<@U1> what is a digest?",
+])
+def test_ordinary_prompts_are_not_digests(text):
+    assert parse_digest_request(text) is None
+
+
+def route(text):
+    calls = []
+    bot = SimpleNamespace(
+        _reply_with_digest=lambda event, say, client, hours: calls.append(("digest", hours)),
+        _reply_to_mention=lambda event, say, client: calls.append(("reply", None)))
+    SlackBot._process_mention(bot, {"team_id": "T1", "channel": "C1", "text": text}, None, None)
+    return calls
+
+
+def test_summarize_prompt_gets_a_normal_reply():
+    assert route("<@U1> summarize this thread") == [("reply", None)]
+    assert route("summarize this: hello") == [("reply", None)]
+
+
+def test_digest_command_gets_a_digest():
+    assert route("<@U1> summarize the last 6h") == [("digest", 6)]
+
+
+class MissingScopeClient:
+    def conversations_history(self, **kwargs):
+        response = SimpleNamespace(status_code=200, get={"error": "missing_scope"}.get)
+        raise SlackApiError("missing_scope", response)
+
+
+class EchoModel:
+    def generate(self, prompt, team_id=None):
+        return "summary"
+
+
+def test_slack_source_falls_back_to_stored_messages_without_scope():
+    db = MemoryStorage()
+    db.store_message("T1", "C1", "1.0", "U1", "hello", False)
+    digester = ChannelDigester(EchoModel(), db, source="slack")
+    try:
+        assert digester.digest("T1", "C1", 1, client=MissingScopeClient()) == "summary"
+    finally:
+        digester.shutdown()
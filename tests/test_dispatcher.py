@@ -0,0 +1,50 @@
+import threading
+import time
+
+from src.dispatcher import MentionDispatcher
+
+
+def test_tasks_for_one_key_run_in_order():
+    dispatcher = MentionDispatcher(workers=4, max_pending=100)
+    seen = {"A": [], "B": []}
+
+    def task(key, n):
+        def run():
+            time.sleep(0.001 * (n % 3))
+            seen[key].append(n)
+        return run
+
+    for n in range(20):
+        assert dispatcher.submit("A", task("A", n))
+        assert dispatcher.submit("B", task("B", n))
+    dispatcher.shutdown(timeout=5)
+    assert seen == {"A": list(range(20)), "B": list(range(20))}
+
+
+def test_different_keys_run_in_parallel():
+    dispatcher = MentionDispatcher(workers=2, max_pending=10)
+    started = threading.Barrier(2, timeout=2)
+    results = []
+    for key in ("A", "B"):
+        dispatcher.submit(key, lambda: results.append(started.wait()))
+    dispatcher.shutdown(timeout=5)
+    assert len(results) == 2
+
+
+def test_sheds_load_at_capacity():
+    dispatcher = MentionDispatcher(workers=1, max_pending=2)
+    release = threading.Event()
+    assert dispatcher.submit("A", lambda: release.wait(5))
+    assert dispatcher.submit("B", lambda: None)
+    assert not dispatcher.submit("C", lambda: None)
+    assert dispatcher.rejected == 1
+    release.set()
+    dispatcher.shutdown(timeout=5)
+    assert dispatcher.depth() == 0
+
+
+def test_refuses_tasks_after_shutdown():
+    dispatcher = MentionDispatcher(workers=1, max_pending=10)
+    dispatcher.shutdown(timeout=1)
+    assert not dispatcher.submit("A", lambda: None)
+    assert dispatcher.depth() == 0
@@ -0,0 +1,53 @@
+from src.db import Database
+from src.idempotency import EventDeduplicator
+
+EVENT = {"team_id": "T1", "channel": "C1", "ts": "1.0"}
+BODY = {"event_id": "Ev1"}
+
+
+def test_redelivery_is_dropped_in_process(tmp_path):
+    db = Database(str(tmp_path / "messages.db"))
+    try:
+        dedup = EventDeduplicator(db)
+        assert not dedup.is_duplicate(EVENT, BODY)
+        assert dedup.is_duplicate(EVENT, BODY)
+        assert not dedup.is_duplicate(EVENT, {"event_id": "Ev2"})
+    finally:
+        db.close()
+
+
+def test_redelivery_after_restart_is_dropped(tmp_path):
+    path = str(tmp_path / "messages.db")
+    db = Database(path)
+    assert not EventDeduplicator(db).is_duplicate(EVENT, BODY)
+    db.close()
+
+    # A new process starts with an empty in-memory cache
+    restarted = Database(path)
+    try:
+        dedup = EventDeduplicator(restarted)
+        assert dedup.is_duplicate(EVENT, BODY)
+        assert not dedup.is_duplicate(EVENT, {"event_id": "Ev2"})
+    finally:
+        restarted.close()
+
+
+def test_expired_claim_is_processed_again(tmp_path):
+    path = str(tmp_path / "messages.db")
+    db = Database(path)
+    assert not EventDeduplicator(db, ttl=-1).is_duplicate(EVENT, BODY)
+    db.close()
+
+    restarted = Database(path)
+    try:
+        assert not EventDeduplicator(restarted).is_duplicate(EVENT, BODY)
+    finally:
+        restarted.close()
+
+
+def test_storage_errors_let_the_event_through():
+    class BrokenStorage:
+        def claim_event(self, event_hash, expires_at):
+            raise RuntimeError("database is locked")
+
+    assert not EventDeduplicator(BrokenStorage()).is_duplicate(EVENT, BODY)
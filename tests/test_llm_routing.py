@@ -0,0 +1,128 @@
+import threading
+import time
+
+from src.llm import LLM
+from src.response_cache import ResponseCache
+from src.scheduler import LLMScheduler
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class FakeModel:
+    def __init__(self, name, delay=0.0, fail=False, rate_limits=0):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.rate_limits = rate_limits
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, prompt, stream=False):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        with self.lock:
+            if self.rate_limits:
+                self.rate_limits -= 1
+                raise QuotaExceeded("RESOURCE_EXHAUSTED")
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return FakeResponse(f"answer from {self.name}")
+
+    generate_content = send_message
+
+
+class CountingScheduler(LLMScheduler):
+    def __init__(self):
+        super().__init__(requests_per_minute=6000, burst=100, retry_base_delay=0.01)
+        self.acquired = 0
+
+    def acquire(self, team_id, cost=1):
+        self.acquired += 1
+        return super().acquire(team_id, cost)
+
+
+def make_llm(models, hedge):
+    scheduler = CountingScheduler()
+    llm = LLM(API_KEY="test", models=list(models), scheduler=scheduler,
+              cache=ResponseCache(maxsize=100, path=""), client_factory=models.__getitem__)
+    llm.router.hedge = hedge
+    llm.router.hedge_min_delay = 0.01
+    return llm, scheduler
+
+
+def test_failover_takes_a_slot_per_request():
+    models = {"gemini-a": FakeModel("gemini-a", fail=True), "gemini-b": FakeModel("gemini-b")}
+    llm, scheduler = make_llm(models, hedge=False)
+    try:
+        assert llm.generate("hello", team_id="T1") == "answer from gemini-b"
+        assert scheduler.acquired == 2
+    finally:
+        llm.shutdown()
+
+
+def test_hedge_takes_a_slot_per_request():
+    models = {"gemini-a": FakeModel("gemini-a", delay=0.5), "gemini-b": FakeModel("gemini-b")}
+    llm, scheduler = make_llm(models, hedge=True)
+    # Cold models are hedged after COLD_HEDGE_DELAY; make the primary's p95 known and short
+    for _ in range(20):
+        llm.router.health["gemini-a"].record(True, 0.01)
+    try:
+        assert llm.generate("hello", team_id="T1") == "answer from gemini-b"
+        assert scheduler.acquired == sum(model.calls for model in models.values()) == 2
+    finally:
+        llm.shutdown()
+
+
+def test_fallback_answer_is_cached_under_the_fallback_model():
+    models = {"gemini-a": FakeModel("gemini-a", fail=True), "gemini-b": FakeModel("gemini-b")}
+    llm, _ = make_llm(models, hedge=False)
+    try:
+        assert llm.get_chat_response("hello", team_id="T1") == ("answer from gemini-b", "gemini-b")
+        # Once the primary recovers, its own answer is asked for, not the fallback's
+        models["gemini-a"].fail = False
+        assert llm.get_chat_response("hello", team_id="T1") == ("answer from gemini-a", "gemini-a")
+        # The fallback's answer is served once it is the primary
+        llm.router.models = ["gemini-b", "gemini-a"]
+        calls = models["gemini-b"].calls
+        assert llm.get_chat_response("hello", team_id="T1") == ("answer from gemini-b", "gemini-b")
+        assert models["gemini-b"].calls == calls
+    finally:
+        llm.shutdown()
+
+
+def test_rate_limit_is_retried_without_failing_over():
+    models = {"gemini-a": FakeModel("gemini-a", rate_limits=3), "gemini-b": FakeModel("gemini-b")}
+    llm, scheduler = make_llm(models, hedge=False)
+    try:
+        assert llm.generate("hello", team_id="T1") == "answer from gemini-a"
+        assert models["gemini-b"].calls == 0
+        assert llm.router.health["gemini-a"].error_rate() == 0
+        assert scheduler.acquired == 4
+    finally:
+        llm.shutdown()
+
+
+def test_cache_hit_keeps_the_session():
+    models = {"gemini-a": FakeModel("gemini-a")}
+    llm, _ = make_llm(models, hedge=False)
+    try:
+        key = ("T1", "C1", "1.0")
+        llm.get_chat_response("hello", session_key=key, team_id="T1")
+        llm.get_chat_response("hello", session_key=("T1", "C1", "2.0"), team_id="T1")
+        session = llm.sessions.sessions.get(("T1", "C1", "2.0"))
+        assert models["gemini-a"].calls == 1
+        assert ("T1", "C1", "2.0") in llm.sessions
+        assert [turn["role"] for turn in session.history][-2:] == ["user", "model"]
+    finally:
+        llm.shutdown()
@@ -0,0 +1,130 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from src import db as db_module
+from src.db import Database
+
+# Schema and rows as written before versioned migrations existed
+BASELINE_SCHEMA = '''
+    CREATE TABLE workspaces
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+    team_id TEXT UNIQUE,
+    team_name TEXT,
+    bot_token TEXT,
+    bot_id TEXT,
+    installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE messages
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+    team_id TEXT,
+    channel TEXT,
+    thread_ts TEXT,
+    user_id TEXT,
+    message TEXT,
+    is_bot TEXT,
+    timestamp TEXT,
+    FOREIGN KEY (team_id) REFERENCES workspaces(team_id));
+'''
+LATEST = Database.MIGRATIONS[-1][0]
+WRITTEN_AT = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    # Small batches so the backfills take several transactions
+    monkeypatch.setattr(db_module, "DB_MIGRATION_BATCH_SIZE", 2)
+    path = str(tmp_path / "messages.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO workspaces (team_id, team_name, bot_token, bot_id) "
+                 "VALUES ('T1', 'Team', 'xoxb-1', 'B1')")
+    conn.executemany(
+        "INSERT INTO messages (team_id, channel, thread_ts, user_id, message, is_bot, timestamp) "
+        "VALUES ('T1', 'C1', '1.0', ?, ?, ?, ?)",
+        [("B1" if n % 2 else "U1", f"legacy message {n} about certificates",
+          "true" if n % 2 else "false", WRITTEN_AT.isoformat()) for n in range(5)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_baseline_database_is_migrated_to_the_latest_version(baseline):
+    assert user_version(baseline) == 0
+    db = Database(baseline, write_behind=False)
+    try:
+        assert user_version(baseline) == LATEST
+        assert db.get_workspace("T1")["bot_token"] == "xoxb-1"
+
+        history = db.get_thread_history("T1", "C1", "1.0", limit=10)
+        assert [is_bot for _, is_bot in history] == [False, True, False, True, False]
+        conn = db.get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM messages WHERE timestamp = ?",
+                            (WRITTEN_AT.timestamp(),)).fetchone()[0] == 5
+        assert conn.execute("SELECT COUNT(*) FROM messages "
+                            "WHERE is_bot_legacy IS NOT NULL OR timestamp_legacy IS NOT NULL"
+                            ).fetchone()[0] == 0
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_messages_thread", "idx_messages_team_time", "idx_messages_channel_time"} <= indexes
+
+        # Token counts of old rows are filled in on first read
+        assert all(tokens > 0 for _, _, tokens in db.get_context_messages("T1", "C1", "1.0", 10))
+        # Old rows were indexed for search by the backfill
+        assert len(db.search_messages("T1", "C1", ["certificates"], "2.0", 10, 1.0)) == 5
+
+        db.store_message("T1", "C1", "1.0", "B1", "new reply", True, model="gemini-a")
+        assert db.get_thread_history("T1", "C1", "1.0", limit=1) == [("new reply", True)]
+    finally:
+        db.close()
+
+
+def test_migrations_are_not_reapplied(baseline):
+    Database(baseline, write_behind=False).close()
+    db = Database(baseline, write_behind=False)
+    try:
+        assert user_version(baseline) == LATEST
+        assert len(db.get_thread_history("T1", "C1", "1.0", limit=10)) == 5
+        assert len(db.search_messages("T1", "C1", ["certificates"], "2.0", 10, 1.0)) == 5
+    finally:
+        db.close()
+
+
+def test_interrupted_backfill_resumes(baseline, monkeypatch):
+    # Stop after the typed columns exist but before the backfill has finished
+    monkeypatch.setattr(Database, "MIGRATIONS", Database.MIGRATIONS[:2])
+    Database(baseline, write_behind=False).close()
+    conn = sqlite3.connect(baseline)
+    with conn:
+        conn.execute("UPDATE messages SET is_bot = 1, is_bot_legacy = NULL, timestamp_legacy = NULL "
+                     "WHERE id = 2")
+    conn.close()
+    assert user_version(baseline) == 2
+
+    monkeypatch.undo()
+    db = Database(baseline, write_behind=False)
+    try:
+        assert user_version(baseline) == LATEST
+        history = db.get_thread_history("T1", "C1", "1.0", limit=10)
+        assert [is_bot for _, is_bot in history] == [False, True, False, True, False]
+    finally:
+        db.close()
+
+
+def test_new_database_starts_at_the_latest_version(tmp_path):
+    path = str(tmp_path / "new.db")
+    Database(path, write_behind=False).close()
+    assert user_version(path) == LATEST
+    conn = sqlite3.connect(path)
+    try:
+        # New files are created with incremental vacuum enabled
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        conn.close()
@@ -0,0 +1,38 @@
+import time
+
+from src.retention import DAY_SECONDS, RetentionManager
+from src.storage import MemoryStorage
+
+
+def make_manager(tmp_path, default_days=0):
+    db = MemoryStorage()
+    db.add_workspace("T1", "Team", "xoxb", "B1")
+    vacuums = []
+    db.reclaim_space = lambda pages=0: vacuums.append(pages) or 0
+    return RetentionManager(db, archive_dir=str(tmp_path), default_days=default_days), db, vacuums
+
+
+def test_run_without_policies_does_nothing(tmp_path):
+    manager, db, vacuums = make_manager(tmp_path)
+    db.store_message("T1", "C1", "1.0", "U1", "old", False)
+    stats = manager.run(now=time.time() + 10 * DAY_SECONDS)
+    assert stats["threads"] == 0
+    assert vacuums == []
+
+
+def test_policy_set_after_start_applies_on_next_run(tmp_path):
+    manager, db, vacuums = make_manager(tmp_path)
+    db.store_message("T1", "C1", "1.0", "U1", "old", False)
+    assert manager.run()["threads"] == 0
+    db.set_retention_policy("T1", 1)
+    stats = manager.run(now=time.time() + 2 * DAY_SECONDS)
+    assert (stats["threads"], stats["messages"]) == (1, 1)
+    assert len(vacuums) == 1
+    assert list(tmp_path.glob("T1/messages-*.ndjson.gz"))
+
+
+def test_run_that_archives_nothing_skips_vacuum(tmp_path):
+    manager, db, vacuums = make_manager(tmp_path, default_days=30)
+    db.store_message("T1", "C1", "1.0", "U1", "recent", False)
+    assert manager.run()["threads"] == 0
+    assert vacuums == []
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from src.scheduler import LLMScheduler, RateLimitError, _Ticket
+
+
+def grant_order(scheduler, tickets):
+    """Queue tickets as (team, cost) and return the teams in DRR service order."""
+    with scheduler._cond:
+        for team_id, cost in tickets:
+            scheduler._enqueue(_Ticket(team_id, cost))
+        return [scheduler._next_ticket().team_id for _ in tickets]
+
+
+def test_busy_team_does_not_starve_others():
+    scheduler = LLMScheduler(requests_per_minute=60, quantum=1)
+    order = grant_order(scheduler, [("A", 1)] * 6 + [("B", 1)] * 2)
+    assert order == ["A", "B", "A", "B", "A", "A", "A", "A"]
+    assert scheduler._waiting == 0 and not scheduler._active
+
+
+def test_shares_follow_call_cost():
+    scheduler = LLMScheduler(requests_per_minute=60, quantum=4)
+    order = grant_order(scheduler, [("A", 4)] * 3 + [("B", 1)] * 8)
+    # Each round A spends its quantum on one large call, B on four small ones
+    assert order == ["A"] + ["B"] * 4 + ["A"] + ["B"] * 4 + ["A"]
+
+
+def test_waiting_callers_are_served_round_robin():
+    scheduler = LLMScheduler(requests_per_minute=1200, burst=1, quantum=1)
+    scheduler.bucket.drain(time.monotonic())
+    order = []
+    lock = threading.Lock()
+
+    def call(team_id):
+        scheduler.acquire(team_id)
+        with lock:
+            order.append(team_id)
+
+    threads = [threading.Thread(target=call, args=("A",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.01)
+    threads += [threading.Thread(target=call, args=("B",)) for _ in range(2)]
+    for thread in threads[8:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(order) == ["A"] * 8 + ["B"] * 2
+    # B's calls are interleaved with A's backlog rather than queued behind it
+    assert max(index for index, team_id in enumerate(order) if team_id == "B") <= 4
+
+
+def test_acquire_times_out_when_no_slot_comes():
+    scheduler = LLMScheduler(requests_per_minute=1, burst=1, queue_timeout=0.05)
+    scheduler.acquire("A")
+    with pytest.raises(RateLimitError):
+        scheduler.acquire("A")
+    assert scheduler._waiting == 0 and not scheduler._queues
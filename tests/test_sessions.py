@@ -0,0 +1,40 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.sessions import ChatSession, ChatSessionManager
+
+
+def test_slow_creation_does_not_block_other_threads():
+    manager = ChatSessionManager(max_sessions=10, idle_ttl=60)
+    release = threading.Event()
+
+    def slow_factory():
+        release.wait(5)
+        return ChatSession([])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow = executor.submit(manager.get, "A", slow_factory)
+        time.sleep(0.05)
+        start = time.monotonic()
+        manager.get("B", lambda: ChatSession([]))
+        assert time.monotonic() - start < 1
+        release.set()
+        slow.result()
+    assert not manager._creating
+
+
+def test_concurrent_misses_create_one_session_per_key():
+    manager = ChatSessionManager(max_sessions=10, idle_ttl=60)
+    created = []
+
+    def factory():
+        time.sleep(0.05)
+        session = ChatSession([])
+        created.append(session)
+        return session
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sessions = list(executor.map(lambda _: manager.get("A", factory), range(8)))
+    assert len(created) == 1
+    assert all(session is created[0] for session in sessions)
@@ -0,0 +1,151 @@
+"""Behaviour every storage backend shares.
+
+Postgres runs too when TEST_DATABASE_URL points at a scratch database;
+every test uses fresh team ids, so a shared database is safe.
+"""
+
+import os
+import time
+import uuid
+from typing import List
+
+import pytest
+
+from src.storage import ARCHIVE_COLUMNS, MemoryStorage
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlite-write-behind", "postgres"])
+def db(request, tmp_path):
+    if request.param == "memory":
+        storage = MemoryStorage()
+    elif request.param == "postgres":
+        dsn = os.environ.get("TEST_DATABASE_URL")
+        if not dsn:
+            pytest.skip("TEST_DATABASE_URL is not set")
+        from src.postgres import PostgresStorage
+        storage = PostgresStorage(dsn, max_connections=4)
+    else:
+        from src.db import Database
+        storage = Database(str(tmp_path / "storage.db"),
+                           write_behind=request.param == "sqlite-write-behind")
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def team():
+    return f"T{uuid.uuid4().hex[:10]}"
+
+
+def test_workspaces(db, team):
+    assert db.get_workspace(team) is None
+    assert db.add_workspace(team, "Team", "xoxb-1", "B1")
+    assert db.add_workspace(team, "Renamed", "xoxb-2", "B1")
+    assert db.get_workspace(team) == {"team_id": team, "team_name": "Renamed",
+                                      "bot_token": "xoxb-2", "bot_id": "B1"}
+    assert (team, "Renamed", "xoxb-2", "B1") in [tuple(row) for row in db.get_workspaces()]
+
+
+def test_threads(db, team):
+    for i in range(5):
+        db.store_message(team, "C1", "1.0", "U1", f"message {i}", i % 2 == 1)
+    db.store_message(team, "C1", "2.0", "U1", "other thread", False)
+    db.flush()
+
+    history = db.get_thread_history(team, "C1", "1.0", limit=3)
+    assert [message for message, _ in history] == ["message 2", "message 3", "message 4"]
+    assert [bool(is_bot) for _, is_bot in history] == [False, True, False]
+
+    after = db.get_messages_after(team, "C1", "1.0", 0, 10)
+    ids = [row[0] for row in after]
+    assert len(ids) == 5 and ids == sorted(ids)
+    assert [row[1] for row in db.get_messages_after(team, "C1", "1.0", ids[2], 1)] == ["message 3"]
+
+    context = db.get_context_messages(team, "C1", "1.0", 10, after_id=ids[2])
+    assert [message for message, _, _ in context] == ["message 3", "message 4"]
+    assert all(isinstance(tokens, int) and tokens > 0 for _, _, tokens in context)
+    assert db.get_context_messages(team, "C1", "1.0", 0) == []
+    assert db.get_thread_history(team, "C1", "missing") == []
+
+
+def test_summaries(db, team):
+    assert db.get_thread_summary(team, "C1", "1.0") is None
+    db.save_thread_summary(team, "C1", "1.0", "first", 3)
+    db.save_thread_summary(team, "C1", "1.0", "second", 5)
+    assert tuple(db.get_thread_summary(team, "C1", "1.0")) == ("second", 5)
+
+
+def test_retention_policies(db, team):
+    db.set_retention_policy(team, 30)
+    db.set_retention_policy(team, 7)
+    assert db.get_retention_policies()[team] == 7
+    db.delete_retention_policy(team)
+    assert team not in db.get_retention_policies()
+
+
+def test_archive(db, team):
+    db.store_message(team, "C9", "9.0", "U1", "old", False)
+    db.flush()
+    db.save_thread_summary(team, "C9", "9.0", "summary", 1)
+    cutoff = time.time() + 1
+
+    def failing_sink(rows: List[dict]) -> None:
+        raise IOError("disk full")
+    with pytest.raises(IOError):
+        db.archive_expired_threads(team, cutoff, 10, failing_sink)
+    assert [message for message, _ in db.get_thread_history(team, "C9", "9.0")] == ["old"]
+
+    archived: List[dict] = []
+    assert db.archive_expired_threads(team, cutoff, 10, archived.extend) == (1, 1)
+    assert set(archived[0]) == set(ARCHIVE_COLUMNS) and archived[0]["message"] == "old"
+    assert db.get_thread_history(team, "C9", "9.0") == []
+    assert db.get_thread_summary(team, "C9", "9.0") is None
+    assert db.archive_expired_threads(team, cutoff, 10, archived.extend) == (0, 0)
+
+
+def test_event_claims(db):
+    key = uuid.uuid4().int >> 65
+    now = time.time()
+    assert db.claim_event(key, now + 60)
+    assert not db.claim_event(key, now + 60)
+    expired = key + 1
+    assert db.claim_event(expired, now - 1)
+    # An expired claim can be taken again
+    assert db.claim_event(expired, now + 60)
+    db.claim_event(expired + 1, now - 1)
+    assert db.purge_processed_events(now) >= 1
+    assert not db.claim_event(key, now + 60)
+
+
+def test_search(db, team):
+    db.store_message(team, "C1", "1.0", "U1", "How do I rotate the VPN certificate?", False)
+    db.store_message(team, "C1", "2.0", "U1", "Lunch order for Friday", False)
+    db.store_message(team, "C1", "3.0", "U1", "vpn certificate expired again", False)
+    db.store_message(team, "C2", "4.0", "U1", "vpn certificate in another channel", False)
+    db.flush()
+    found = db.search_messages(team, "C1", ["certificate", "vpn"], "3.0", 5, 1.0)
+    assert found == [("How do I rotate the VPN certificate?", False, "1.0")]
+    assert db.search_messages(team, "C1", ["unrelated"], "3.0", 5, 1.0) == []
+
+
+def test_channel_messages(db, team):
+    since = time.time() - 1
+    for n in range(5):
+        db.store_message(team, "C1", f"{n}.0", f"U{n}", f"message {n}", n == 4)
+    db.store_message(team, "C2", "9.0", "U9", "other channel", False)
+    db.flush()
+    rows, after = [], None
+    while True:
+        page = db.get_channel_messages(team, "C1", since, 2, after)
+        rows += page
+        if len(page) < 2:
+            break
+        after = (page[-1][4], page[-1][0])
+    assert [(user, message, bool(is_bot)) for _, user, message, is_bot, _ in rows] == \
+        [(f"U{n}", f"message {n}", n == 4) for n in range(5)]
+    assert db.get_channel_messages(team, "C1", time.time() + 60, 10) == []
+
+
+def test_health(db):
+    db.ping()
+    assert "backend" in db.storage_stats()
@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+
+from slack_sdk.errors import SlackApiError
+
+from src.streaming import StreamingReply
+
+
+class FakeClient:
+    def __init__(self, rate_limits=0, retry_after="0.2"):
+        self.updates = []
+        self.rate_limits = rate_limits
+        self.retry_after = retry_after
+
+    def chat_postMessage(self, channel, thread_ts, text):
+        return {"ts": "2.0"}
+
+    def chat_update(self, channel, ts, text, **kwargs):
+        if self.rate_limits:
+            self.rate_limits -= 1
+            response = SimpleNamespace(status_code=429, headers={"Retry-After": self.retry_after})
+            raise SlackApiError("ratelimited", response)
+        self.updates.append((time.monotonic(), text))
+
+
+def test_first_chunk_is_shown_at_once():
+    client = FakeClient()
+    reply = StreamingReply(client, "C1", "1.0", min_interval=10)
+    reply.start()
+    reply.append("Hello")
+    reply.append(" world")
+    assert [text for _, text in client.updates] == ["Hello ▍"]
+
+
+def test_finish_does_not_wait_for_the_interval():
+    client = FakeClient()
+    reply = StreamingReply(client, "C1", "1.0", min_interval=10)
+    reply.start()
+    reply.append("Hello")
+    start = time.monotonic()
+    reply.finish("Hello world")
+    assert time.monotonic() - start < 1
+    assert client.updates[-1][1] == "Hello world"
+
+
+def test_finish_waits_out_retry_after():
+    client = FakeClient(rate_limits=1, retry_after="0.2")
+    reply = StreamingReply(client, "C1", "1.0", min_interval=10)
+    reply.start()
+    start = time.monotonic()
+    reply.finish("done")
+    assert time.monotonic() - start >= 0.2
+    assert [text for _, text in client.updates] == ["done"]
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+
+import pytest
+
+from src import db as db_module
+from src.db import Database
+
+
+@pytest.fixture
+def slow_writer(monkeypatch):
+    # Queued rows stay pending until a batch fills, the interval passes or close()
+    monkeypatch.setattr(db_module, "DB_WRITE_BATCH_SIZE", 1000)
+    monkeypatch.setattr(db_module, "DB_WRITE_FLUSH_INTERVAL", 30.0)
+
+
+def committed(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT message FROM messages ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_queued_messages_are_read_back_before_commit(tmp_path, slow_writer):
+    path = str(tmp_path / "messages.db")
+    db = Database(path, write_behind=True)
+    try:
+        db.store_message("T1", "C1", "1.0", "U1", "question", False)
+        db.store_message("T1", "C1", "1.0", "B1", "answer", True)
+        assert committed(path) == []
+        assert db.get_thread_history("T1", "C1", "1.0") == [("question", False), ("answer", True)]
+        assert [message for message, _, _ in db.get_context_messages("T1", "C1", "1.0", 10)] == \
+            ["question", "answer"]
+        assert db.get_thread_history("T1", "C1", "2.0") == []
+    finally:
+        db.close()
+
+
+def test_close_commits_queued_messages(tmp_path, slow_writer):
+    path = str(tmp_path / "messages.db")
+    db = Database(path, write_behind=True)
+    for n in range(5):
+        db.store_message("T1", "C1", "1.0", "U1", f"message {n}", False)
+    start = time.monotonic()
+    db.close()
+    # Shutdown does not wait out the flush interval
+    assert time.monotonic() - start < 5
+    assert committed(path) == [f"message {n}" for n in range(5)]
+    assert not db._writer.pending
+
+    reopened = Database(path, write_behind=False)
+    try:
+        assert len(reopened.get_thread_history("T1", "C1", "1.0", limit=10)) == 5
+    finally:
+        reopened.close()
+
+
+def test_writes_after_close_are_not_lost(tmp_path, slow_writer):
+    path = str(tmp_path / "messages.db")
+    db = Database(path, write_behind=True)
+    db._writer.close()
+    db.store_message("T1", "C1", "1.0", "U1", "late", False)
+    db.close()
+    assert committed(path) == ["late"]